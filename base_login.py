@@ -1,11 +1,18 @@
-import os
 import json
 import base64
 import random
 import requests
+from log_setup import get_logger
+
+log = get_logger('login')
+
+LOGIN_USERNAME = '18029131603'
+LOGIN_PASSWORD = 'Imzl1107'
 
 class BaseLogin:
-    def __init__(self):
+    def __init__(self, username=None, password=None):
+        self.username = username or LOGIN_USERNAME
+        self.password = password or LOGIN_PASSWORD
         self.cookies = {
             'JSESSIONID': '0824ef5c-ba10-4c77-8d01-9405395b3022',
         }
@@ -26,17 +33,22 @@ class BaseLogin:
         }
 
     def base64_api(self, uname, pwd, img, typeid):
-        with open(img, 'rb') as f:
-            base64_data = base64.b64encode(f.read())
-            b64 = base64_data.decode()
+        """img 可以是图片路径，也可以直接是图片字节（验证码在内存中识别，不落盘）"""
+        if isinstance(img, (bytes, bytearray)):
+            b64 = base64.b64encode(img).decode()
+        else:
+            with open(img, 'rb') as f:
+                base64_data = base64.b64encode(f.read())
+                b64 = base64_data.decode()
         data = {"username": uname, "password": pwd, "typeid": typeid, "image": b64}
-        result = json.loads(requests.post("http://api.ttshitu.com/predict", json=data).text)
+        result = json.loads(requests.post("http://api.ttshitu.com/predict", json=data, timeout=15).text)
         if result['success']:
             return result["data"]["result"]
         else:
             return result["message"]
 
-    def login_with_captcha(self, detail_processor=None):
+    def acquire_session(self):
+        """走一遍验证码登录，返回新的 JSESSIONID（失败返回 None），不修改当前会话"""
         session = requests.Session()
         session.cookies.update({
             'username-m': '13266769662',
@@ -71,33 +83,46 @@ class BaseLogin:
         params = {'type': 'math','s': str(random.random())}
         try:
             captcha_response = session.get('https://www.gxkj123456.com/tgc/captcha/captchaImage', params=params, headers=captcha_headers, timeout=5)
-            captcha_path = 'captcha_math.jpg'
-            with open(captcha_path, 'wb') as f:
-                f.write(captcha_response.content)
-            captcha_result = self.base64_api(uname='FOURFIRE', pwd='Imzl1107', img=captcha_path, typeid=11)
-            if os.path.exists(captcha_path):
-                os.remove(captcha_path)
-            print(f"识别到的验证码结果: {captcha_result}")
-            login_data = {'username': '18029131603','password': 'Imzl1107','validateCode': captcha_result,'rememberMe': 'false'}
+            captcha_result = self.base64_api(uname='FOURFIRE', pwd='Imzl1107', img=captcha_response.content, typeid=11)
+            log.info(f"识别到的验证码结果: {captcha_result}")
+            login_data = {'username': self.username,'password': self.password,'validateCode': captcha_result,'rememberMe': 'false'}
             login_response = session.post('https://www.gxkj123456.com/tgc/login', headers=login_headers, data=login_data, timeout=5)
             if login_response.status_code == 200:
                 jsessionid = login_response.cookies.get('JSESSIONID')
                 if jsessionid:
-                    self.cookies['JSESSIONID'] = jsessionid
-                    if detail_processor:
-                        detail_processor.update_cookies(jsessionid)
-                    print(f"登录成功，获取到JSESSIONID: {jsessionid}")
-                    return True
-                else:
-                    print("登录失败：未获取到JSESSIONID")
-                    return False
-            else:
-                print(f"登录失败，状态码: {login_response.status_code}")
-                return False
+                    return jsessionid
+                log.warning("登录失败：未获取到JSESSIONID")
+                return None
+            log.warning(f"登录失败，状态码: {login_response.status_code}")
+            return None
         except Exception as e:
-            print(f"登录过程发生异常: {str(e)}")
+            log.warning(f"登录过程发生异常: {str(e)}")
+            return None
+
+    def validate_session(self, jsessionid: str) -> bool:
+        """用一次 pageSize=1 的列表请求校验会话是否可用"""
+        data = {'pageSize': '1', 'pageNum': '1', 'orderByColumn': 'updateTime', 'isAsc': 'desc'}
+        try:
+            r = requests.post('https://www.gxkj123456.com/tgc/gxPc/seek/list',
+                              cookies=dict(self.cookies, JSESSIONID=jsessionid),
+                              headers=self.headers, data=data, timeout=10)
+            return r.status_code == 200 and r.json().get('code') == 0
+        except Exception:
             return False
 
+    def apply_session(self, jsessionid: str, detail_processor=None):
+        """整体替换 cookies 字典（引用赋值是原子的），并发请求要么用旧会话要么用新会话"""
+        self.cookies = dict(self.cookies, JSESSIONID=jsessionid)
+        if detail_processor:
+            detail_processor.update_cookies(jsessionid)
+
+    def login_with_captcha(self, detail_processor=None):
+        jsessionid = self.acquire_session()
+        if not jsessionid:
+            return False
+        self.apply_session(jsessionid, detail_processor)
+        log.info(f"登录成功，获取到JSESSIONID: {jsessionid}")
+        return True
 
 if __name__ == '__main__':
     base_login = BaseLogin()
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+批量规则重算：把已保存快照中所有商品的 full_size_price_counts 展开成 NumPy 数组
+（每行一个 商品×尺码：尺码序号 / 价格 / 人数），用向量化方式套用 尺码/价格/人数/零价 规则，
+得到新的保留尺码集合，并与当前保存的 kept_sizes 对比，用于调整规则前预估影响。
+
+需要 numpy（仅本工具使用，监控本身不依赖）：pip install numpy
+
+用法：
+    python bulk_evaluator.py                              # 用 filter_rules.json（没有则用默认规则）评估当前快照
+    python bulk_evaluator.py --price-min 300 --price-max 1500 --show 20
+    python bulk_evaluator.py --rules new_rules.json --data initial_products_data.snap --out diff.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖
+    np = None
+
+import snapshot_store
+from compact_record import ProductRecord, SizeSnapshot, SIZE_TABLE, UNPRICED
+from rule_config import RULES_FILE, RuleConfigError, validate_config
+from rule_engine import CompiledRules
+
+_STRIDE = 3
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("批量规则重算需要 numpy，请先执行: pip install numpy")
+
+
+def _parse_price(price):
+    """与 CompiledRules.price_ok 相同的解析：返回 (价格, 是否未出价, 是否无法解析)"""
+    s = str(price)
+    if s.strip() == UNPRICED:
+        return 0.0, True, False
+    try:
+        return float(s), False, False
+    except Exception:
+        return 0.0, False, True
+
+
+class SnapshotArrays:
+    """
+    所有商品尺码展开后的列式数组：
+        prod   每行所属商品下标
+        ordinal 尺码序号（SIZE_TABLE）
+        price / unpriced / invalid / count
+    同时保存每个商品当前的 kept_sizes（以 商品下标*尺码数+序号 编码）
+    """
+
+    def __init__(self, products):
+        _require_numpy()
+        self.ids = []
+        raws, lens = [], []
+        odd_rows = []      # (行号, 原始条目) 无法编码、需要逐个解析的条目
+        kept_keys = []
+        row = 0
+        for idx, p in enumerate(products):
+            self.ids.append(p.get('id'))
+            full = p.get('full_size_price_counts') or {}
+            snap = full if isinstance(full, SizeSnapshot) else SizeSnapshot.from_dict(full)
+            raw, odd = snap.to_state()
+            raws.append(raw)
+            n = len(snap)
+            lens.append(n)
+            if odd:
+                for i, size in enumerate(snap):
+                    if size in odd:
+                        odd_rows.append((row + i, odd[size]))
+            row += n
+            for s in (p.get('kept_sizes') or []):
+                kept_keys.append((idx, SIZE_TABLE.ordinal(s)))
+
+        words = np.frombuffer(b''.join(raws), dtype=np.int64).reshape(-1, _STRIDE)
+        head = words[:, 0]
+        self.prod = np.repeat(np.arange(len(lens), dtype=np.int64), lens)
+        self.ordinal = (head & 0xFFFF).astype(np.int64)
+        decimals = ((head >> 16) & 0xF) - 1
+        self.count = head >> 24
+        self.unpriced = decimals < 0
+        scale = np.power(10.0, np.maximum(decimals, 0))
+        self.price = np.where(self.unpriced, 0.0, words[:, 1] / scale)
+        self.invalid = np.zeros(len(head), dtype=bool)
+        for r, info in odd_rows:
+            info = info if isinstance(info, dict) else {}
+            price, unpriced, invalid = _parse_price(info.get('price', UNPRICED))
+            self.price[r], self.unpriced[r], self.invalid[r] = price, unpriced, invalid
+            try:
+                self.count[r] = int(info.get('count', 0) or 0)
+            except (TypeError, ValueError):
+                self.count[r] = 0
+
+        self.n_sizes = len(SIZE_TABLE)
+        if kept_keys:
+            k = np.asarray(kept_keys, dtype=np.int64)
+            self.current_keys = np.unique(k[:, 0] * self.n_sizes + k[:, 1])
+        else:
+            self.current_keys = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.prod)
+
+    def evaluate(self, rules: CompiledRules):
+        """返回每行是否保留（与 DetailProcessor.kept_sizes_in_range 的规则一致）"""
+        if rules.allowed_sizes:
+            allowed = np.zeros(self.n_sizes, dtype=bool)
+            for s in rules.allowed_sizes:
+                o = SIZE_TABLE.find(s)
+                if o is not None:
+                    allowed[o] = True
+            size_ok = allowed[self.ordinal]
+        else:
+            size_ok = np.ones(len(self), dtype=bool)
+        price_ok = self.unpriced | (self.price == 0.0) | ((self.price >= rules.price_min) & (self.price <= rules.price_max))
+        return size_ok & (self.count > 0) & price_ok & ~self.invalid
+
+    def diff(self, kept_mask):
+        """与当前 kept_sizes 对比：{商品ID: {'added': [...], 'removed': [...]}}"""
+        new_keys = np.unique(self.prod[kept_mask] * self.n_sizes + self.ordinal[kept_mask])
+        added = np.setdiff1d(new_keys, self.current_keys, assume_unique=True)
+        removed = np.setdiff1d(self.current_keys, new_keys, assume_unique=True)
+        out = {}
+        for keys, field in ((added, 'added'), (removed, 'removed')):
+            for pidx, o in zip((keys // self.n_sizes).tolist(), (keys % self.n_sizes).tolist()):
+                entry = out.setdefault(self.ids[pidx], {'added': [], 'removed': []})
+                entry[field].append(SIZE_TABLE.size(o))
+        return out, new_keys
+
+
+# 与监控进程一致，默认文件取模块所在目录，不依赖当前工作目录
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_products(path):
+    if snapshot_store.is_snapshot(path):
+        return snapshot_store.load_products(path, compact=True)
+    with open(path, 'r', encoding='utf-8') as f:
+        return [ProductRecord.from_dict(p) for p in json.load(f)]
+
+
+def _load_rules(args):
+    overrides = {k: v for k, v in (('price_min', args.price_min), ('price_max', args.price_max),
+                                    ('allowed_sizes', args.sizes)) if v is not None}
+    rules_file = os.path.join(BASE_DIR, RULES_FILE)
+    if args.rules or os.path.exists(rules_file):
+        path = args.rules or rules_file
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        raw.update(overrides)
+        cfg = validate_config(raw)
+    elif overrides:
+        cfg = validate_config(overrides)
+    else:
+        cfg = validate_config({})
+    return cfg, CompiledRules(cfg['excluded_brands'], cfg['allowed_sizes'], cfg['price_min'], cfg['price_max'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='按新规则批量重算保留尺码，并与当前状态对比')
+    parser.add_argument('--data', help='商品快照（.snap 或 .json，默认取较新的一个）')
+    parser.add_argument('--rules', help=f'规则配置文件（默认 {RULES_FILE}，不存在则用代码默认值）')
+    parser.add_argument('--price-min', type=float, dest='price_min')
+    parser.add_argument('--price-max', type=float, dest='price_max')
+    parser.add_argument('--sizes', type=lambda v: [s for s in v.split(',') if s], help='允许尺码，逗号分隔')
+    parser.add_argument('--show', type=int, default=10, help='打印前 N 个有变化的商品')
+    parser.add_argument('--out', help='把完整差异写入 JSON 文件')
+    args = parser.parse_args(argv)
+
+    try:
+        _require_numpy()
+        cfg, rules = _load_rules(args)
+    except (RuntimeError, RuleConfigError, OSError, ValueError) as e:
+        print(f"✗ {e}")
+        return 1
+
+    path = args.data or snapshot_store.newest_existing(os.path.join(BASE_DIR, 'initial_products_data.json'),
+                                                       os.path.join(BASE_DIR, 'initial_products_data.snap'))
+    if not path:
+        print("✗ 没有找到商品快照")
+        return 1
+
+    t0 = time.time()
+    products = load_products(path)
+    t1 = time.time()
+    arrays = SnapshotArrays(products)
+    del products
+    t2 = time.time()
+    kept = arrays.evaluate(rules)
+    changes, new_keys = arrays.diff(kept)
+    t3 = time.time()
+
+    added = sum(len(c['added']) for c in changes.values())
+    removed = sum(len(c['removed']) for c in changes.values())
+    print(f"规则：价格 {cfg['price_min']:g}-{cfg['price_max']:g}，允许尺码 {len(cfg['allowed_sizes'])} 个")
+    print(f"商品 {len(arrays.ids)} 个，尺码行 {len(arrays)} 条")
+    print(f"保留尺码：当前 {len(arrays.current_keys)} → 新规则 {len(new_keys)}（新增 {added}，移除 {removed}），"
+          f"受影响商品 {len(changes)} 个")
+    print(f"耗时：加载 {t1 - t0:.2f}s，展开 {t2 - t1:.2f}s，重算+对比 {t3 - t2:.3f}s")
+    for pid, c in list(changes.items())[:args.show]:
+        parts = []
+        if c['added']:
+            parts.append('+' + ','.join(c['added']))
+        if c['removed']:
+            parts.append('-' + ','.join(c['removed']))
+        print(f"  {pid}: {' '.join(parts)}")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({str(k): v for k, v in changes.items()}, f, ensure_ascii=False, indent=2)
+        print(f"✓ 差异已写入 {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+变化事件流：监控进程把检测到的尺码变化和推送决定实时发布到本机 HTTP 的 Server-Sent Events 接口，
+其他工具订阅即可在一秒内拿到事件，不需要轮询 products_output.txt 或读快照文件。
+
+- GET /events            SSE 事件流；断线重连时带 Last-Event-ID（或 ?last_id=），从缓冲区补发之后的事件
+                         ?types=change,push 只订阅指定类型
+- GET /recent?n=100      最近 n 条事件（JSON 数组）
+
+事件类型：
+    change  {"pid", "article_num", "title", "change_type", "sizes": {尺码: {"count": [旧, 新], "price": [旧, 新]}}}
+    push    {"pid", "article_num", "profile", "group", "no", "sizes", "status": "pending"}  决定推送、已分配编号
+            {"pid", "profile", "group", "no", "status": "sent" | "failed"}               推送结果（失败时编号回滚）
+事件 ID 为 启动时间-序号，进程重启后旧 ID 无法续接时先发送一条 reset 事件，再补发缓冲区中的全部事件。
+缓冲区保留最近 REPLAY_SIZE 条；订阅方处理过慢（积压超过 CLIENT_QUEUE）时断开，由客户端重连补发。
+
+用法：
+    python change_feed.py tail [http://127.0.0.1:8770] [--types change,push]
+"""
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from log_setup import get_logger
+
+log = get_logger('feed')
+
+FEED_BIND = '127.0.0.1:8770'
+REPLAY_SIZE = 5000
+CLIENT_QUEUE = 1000
+HEARTBEAT = 15.0          # 空闲时发送注释行保持连接（秒）
+RECENT_MAX = 1000
+
+
+class ChangeFeed:
+    def __init__(self, replay_size=REPLAY_SIZE):
+        self.boot = str(int(time.time()))
+        self._seq = 0
+        self._buffer = deque(maxlen=replay_size)   # (seq, type, data_json)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def publish(self, event_type, data):
+        payload = json.dumps(dict(data, ts=round(time.time(), 3)), ensure_ascii=False, default=str)
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, event_type, payload)
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.offer(event)
+
+    def event_id(self, seq):
+        return f"{self.boot}-{seq}"
+
+    def subscribe(self, last_id=None, types=None):
+        """
+        返回 (订阅, 需要补发的事件, reset 序号)；无法续接时 reset 序号为补发起点，否则为 None。
+        补发与订阅在同一把锁内完成，不会漏掉事件
+        """
+        sub = _Subscriber(types)
+        with self._lock:
+            after, reset = self._resume_point(last_id)
+            if reset:
+                after = self._buffer[0][0] - 1 if self._buffer else self._seq
+            backlog = [e for e in self._buffer if e[0] > after and sub.wants(e[1])]
+            self._subscribers.add(sub)
+        return sub, backlog, after if reset else None
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def _resume_point(self, last_id):
+        """Last-Event-ID -> (从哪个序号之后补发, 是否无法续接)"""
+        if not last_id:
+            return self._seq, False        # 新订阅只接收之后的事件
+        boot, _, seq = str(last_id).partition('-')
+        if boot != self.boot or not seq.isdigit():
+            return 0, True
+        seq = int(seq)
+        oldest = self._buffer[0][0] if self._buffer else self._seq + 1
+        return seq, seq + 1 < oldest      # 需要的事件已被挤出缓冲区
+
+    def recent(self, n=100):
+        with self._lock:
+            events = list(self._buffer)[-n:]
+        return [{'id': self.event_id(s), 'type': t, 'data': json.loads(d)} for s, t, d in events]
+
+    # ===== HTTP =====
+    def start(self, bind=FEED_BIND):
+        host, _, port = bind.rpartition(':')
+        feed = self
+
+        class Handler(_FeedHandler):
+            pass
+        Handler.feed = feed
+        try:
+            self._server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), Handler)
+        except OSError as e:
+            log.warning(f"变化事件流无法监听 {bind}：{e}（事件仍保留在内存缓冲区）")
+            return False
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='change-feed', daemon=True).start()
+        log.info(f"变化事件流：http://{bind}/events")
+        return True
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _Subscriber:
+    def __init__(self, types):
+        self.types = set(types) if types else None
+        self.queue = queue.Queue(CLIENT_QUEUE)
+        self.overflowed = False
+
+    def wants(self, event_type):
+        return self.types is None or event_type in self.types or event_type == 'reset'
+
+    def offer(self, event):
+        if self.overflowed or not self.wants(event[1]):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True   # 订阅方跟不上：断开，客户端用 Last-Event-ID 重连补发
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    feed = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        log.debug("feed %s " + fmt, self.client_address[0], *args)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path == '/events':
+            types = [t for t in ','.join(query.get('types', [])).split(',') if t] or None
+            last_id = self.headers.get('Last-Event-ID') or (query.get('last_id') or [None])[0]
+            self._stream(last_id, types)
+        elif url.path == '/recent':
+            try:
+                n = max(1, min(RECENT_MAX, int((query.get('n') or ['100'])[0])))
+            except ValueError:
+                n = 100
+            body = json.dumps(self.feed.recent(n), ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def _stream(self, last_id, types):
+        feed = self.feed
+        sub, backlog, reset_seq = feed.subscribe(last_id, types)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            self.wfile.write(b'retry: 2000\n\n')
+            if reset_seq is not None:
+                # 中间的事件已丢失（进程重启或超出缓冲区），订阅方应重新读取一次全量状态
+                self._send(feed.event_id(reset_seq), 'reset', json.dumps({'boot': feed.boot}))
+            for seq, etype, data in backlog:
+                self._send(feed.event_id(seq), etype, data)
+            self.wfile.flush()
+            while not sub.overflowed:
+                try:
+                    seq, etype, data = sub.queue.get(timeout=HEARTBEAT)
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                self._send(feed.event_id(seq), etype, data)
+                # 一次写出队列中已有的事件，减少 flush 次数
+                while True:
+                    try:
+                        seq, etype, data = sub.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._send(feed.event_id(seq), etype, data)
+                self.wfile.flush()
+        except OSError:
+            pass   # 订阅方断开
+        finally:
+            feed.unsubscribe(sub)
+
+    def _send(self, event_id, event_type, data):
+        self.wfile.write(f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n".encode('utf-8'))
+
+
+def size_changes(old_full, new_full):
+    """{尺码: {"count": [旧, 新], "price": [旧, 新]}}，只包含人数或价格有变化的尺码"""
+    out = {}
+    for s in set(old_full or {}) | set(new_full or {}):
+        old = (old_full or {}).get(s) or {}
+        new = (new_full or {}).get(s) or {}
+        oc, nc = int(old.get('count', 0) or 0), int(new.get('count', 0) or 0)
+        op, np_ = old.get('price'), new.get('price')
+        if oc != nc or op != np_:
+            out[s] = {'count': [oc, nc], 'price': [op, np_]}
+    return out
+
+
+def tail(url, types=None):
+    """订阅并逐行打印事件，断线后带 Last-Event-ID 重连"""
+    last_id = None
+    while True:
+        params = {'types': types} if types else {}
+        req = urllib.request.Request(url.rstrip('/') + '/events?' + urllib.parse.urlencode(params))
+        if last_id:
+            req.add_header('Last-Event-ID', last_id)
+        try:
+            with urllib.request.urlopen(req, timeout=HEARTBEAT * 3) as resp:
+                event = {}
+                for raw in resp:
+                    line = raw.decode('utf-8').rstrip('\n')
+                    if not line:
+                        if 'data' in event:
+                            last_id = event.get('id', last_id)
+                            print(f"{event.get('id')} {event.get('event')} {event['data']}", flush=True)
+                        event = {}
+                    elif not line.startswith(':'):
+                        key, _, value = line.partition(': ')
+                        event[key] = value
+        except OSError as e:
+            print(f"[warn] 连接断开：{e}，2 秒后重连", file=sys.stderr)
+            time.sleep(2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='订阅监控进程的变化事件流')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_tail = sub.add_parser('tail')
+    p_tail.add_argument('url', nargs='?', default=f"http://{FEED_BIND}")
+    p_tail.add_argument('--types', help='只订阅指定类型，例如 change,push')
+    args = parser.parse_args()
+    try:
+        tail(args.url, args.types)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,580 @@
+# -*- coding: utf-8 -*-
+"""
+紧凑的内存商品记录：
+每个尺码的 价格/人数/最新订单时间 只在类型化数组中存一份（按全局共享的尺码序号索引），
+size_price_counts、kept_sizes、detail_data 等字段以只读映射视图的形式按需生成，
+对现有 dict 访问方式（p['id']、.get、.update、dict(...)、json.dump）保持兼容。
+
+用法：python compact_record.py [initial_products_data.json]  输出每个商品的内存占用对比
+"""
+import sys
+import json
+import threading
+from array import array
+from collections.abc import Mapping, MutableMapping
+from datetime import datetime, timedelta
+
+UNPRICED = '未出价'
+_EPOCH = datetime(1970, 1, 1)
+_ONE_SECOND = timedelta(seconds=1)
+
+
+class SizeTable:
+    """全局共享的 尺码 <-> 序号 表"""
+
+    def __init__(self):
+        self._ordinals = {}
+        self._sizes = []
+        self._lock = threading.Lock()
+
+    def ordinal(self, size) -> int:
+        size = str(size)
+        o = self._ordinals.get(size)
+        if o is None:
+            with self._lock:
+                o = self._ordinals.get(size)
+                if o is None:
+                    o = len(self._sizes)
+                    self._sizes.append(size)
+                    self._ordinals[size] = o
+        return o
+
+    def find(self, size):
+        """只查不增，未登记的尺码返回 None"""
+        return self._ordinals.get(str(size))
+
+    def size(self, ordinal: int) -> str:
+        return self._sizes[ordinal]
+
+    def sizes(self):
+        with self._lock:
+            return list(self._sizes)
+
+    def __len__(self):
+        return len(self._sizes)
+
+
+SIZE_TABLE = SizeTable()
+
+
+def _encode_price(price):
+    """价格按十进制整数存储，保证原样还原：'未出价' -> (0, -1)；'399' -> (399, 0)；'399.50' -> (39950, 2)"""
+    if price == UNPRICED:
+        return 0, -1
+    if not isinstance(price, str) or not price.isascii():
+        return None
+    intpart, dot, frac = price.partition('.')
+    if not intpart.isdigit() or (len(intpart) > 1 and intpart[0] == '0'):
+        return None
+    if dot and (not frac.isdigit() or len(frac) > 6):
+        return None
+    value = int(intpart + frac)
+    if value >= 1 << 62:
+        return None
+    return value, len(frac) if dot else 0
+
+
+def _decode_price(value, decimals):
+    if decimals < 0:
+        return UNPRICED
+    if decimals == 0:
+        return str(value)
+    scale = 10 ** decimals
+    return f"{value // scale}.{value % scale:0{decimals}d}"
+
+
+def _encode_time(value):
+    """'YYYY-MM-DD HH:MM[:SS]' -> (秒, 格式编码)；非规范格式返回 None（原样保存）"""
+    if value == '':
+        return 0, 0
+    if not isinstance(value, str):
+        return None
+    n = len(value)
+    if n == 19:
+        code = 2
+        if value[16] != ':' or not value[17:19].isdigit():
+            return None
+        sec = int(value[17:19])
+    elif n == 16:
+        code, sec = 1, 0
+    else:
+        return None
+    if value[4] != '-' or value[7] != '-' or value[10] != ' ' or value[13] != ':' \
+            or not (value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16]).isdigit() \
+            or not value.isascii():
+        return None
+    try:
+        dt = datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                      int(value[11:13]), int(value[14:16]), sec)
+    except ValueError:
+        return None
+    return (dt - _EPOCH) // _ONE_SECOND, code
+
+
+def _decode_time(ts, code):
+    if code == 0:
+        return ''
+    dt = _EPOCH + timedelta(seconds=ts)
+    if code == 1:
+        return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}"
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
+
+
+# 每个尺码占 3 个 int64：
+#   [0] 尺码序号(16位) | 小数位数+1(4位)<<16 | 时间格式(2位)<<20 | 人数(31位)<<24
+#   [1] 价格（十进制整数）
+#   [2] 最新订单时间（秒）
+_STRIDE = 3
+
+
+class SizeSnapshot(Mapping):
+    """{尺码: {'price', 'count', 'time'}} 的紧凑只读映射"""
+    __slots__ = ('_data', '_odd')
+
+    def __init__(self):
+        self._data = array('q')
+        self._odd = None   # 无法编码的条目原样保存 {尺码: 原始dict}
+
+    @classmethod
+    def from_dict(cls, d):
+        if isinstance(d, SizeSnapshot):
+            return d
+        snap = cls()
+        for size, info in (d or {}).items():
+            snap._append(str(size), info)
+        return snap
+
+    def _append(self, size, info):
+        enc = None
+        if isinstance(info, dict) and len(info) == 3 and type(info.get('count')) is int \
+                and 0 <= info['count'] < 2 ** 31:
+            p = _encode_price(info.get('price'))
+            t = _encode_time(info.get('time'))
+            if p is not None and t is not None:
+                enc = p, t
+        o = SIZE_TABLE.ordinal(size)
+        if enc is None:
+            if self._odd is None:
+                self._odd = {}
+            self._odd[size] = dict(info) if isinstance(info, Mapping) else info
+            self._data.extend((o, 0, 0))
+            return
+        (pv, pd), (tv, tc) = enc
+        self._data.extend((o | ((pd + 1) << 16) | (tc << 20) | (info['count'] << 24), pv, tv))
+
+    def _index(self, size):
+        o = SIZE_TABLE.find(size)
+        if o is None:
+            return -1
+        data = self._data
+        for i in range(0, len(data), _STRIDE):
+            if data[i] & 0xFFFF == o:
+                return i
+        return -1
+
+    def _entry(self, i):
+        head = self._data[i]
+        if self._odd is not None:
+            size = SIZE_TABLE.size(head & 0xFFFF)
+            if size in self._odd:
+                return self._odd[size]
+        return {
+            'price': _decode_price(self._data[i + 1], ((head >> 16) & 0xF) - 1),
+            'count': head >> 24,
+            'time': _decode_time(self._data[i + 2], (head >> 20) & 0x3),
+        }
+
+    def __getitem__(self, size):
+        i = self._index(size)
+        if i < 0:
+            raise KeyError(size)
+        return self._entry(i)
+
+    def __contains__(self, size):
+        return self._index(size) >= 0
+
+    def __iter__(self):
+        data = self._data
+        for i in range(0, len(data), _STRIDE):
+            yield SIZE_TABLE.size(data[i] & 0xFFFF)
+
+    def __len__(self):
+        return len(self._data) // _STRIDE
+
+    def __repr__(self):
+        return f"SizeSnapshot({dict(self)!r})"
+
+    def ordinals(self):
+        return array('H', (self._data[i] & 0xFFFF for i in range(0, len(self._data), _STRIDE)))
+
+    def to_dict(self):
+        return {SIZE_TABLE.size(self._data[i] & 0xFFFF): self._entry(i) for i in range(0, len(self._data), _STRIDE)}
+
+    def to_state(self):
+        return self._data.tobytes(), self._odd
+
+    @classmethod
+    def from_state(cls, state, remap=None, swap=False):
+        """remap：快照中的尺码序号 -> 当前进程序号；swap：字节序不同时需要翻转"""
+        raw, odd = state
+        snap = cls()
+        snap._data.frombytes(raw)
+        if swap:
+            snap._data.byteswap()
+        if remap is not None:
+            data = snap._data
+            for i in range(0, len(data), _STRIDE):
+                data[i] = (data[i] & ~0xFFFF) | remap[data[i] & 0xFFFF]
+        snap._odd = odd
+        return snap
+
+    def matches(self, d) -> bool:
+        """d 中每个尺码都存在且取值一致"""
+        if isinstance(d, SizeSnapshot) and d._odd is None and self._odd is None:
+            # 两边都是已编码条目时直接比较原始字
+            mine = {self._data[i] & 0xFFFF: i for i in range(0, len(self._data), _STRIDE)}
+            data, other = self._data, d._data
+            for j in range(0, len(other), _STRIDE):
+                i = mine.get(other[j] & 0xFFFF)
+                if i is None or data[i] != other[j] or data[i + 1] != other[j + 1] or data[i + 2] != other[j + 2]:
+                    return False
+            return True
+        for size, info in d.items():
+            i = self._index(size)
+            if i < 0 or self._entry(i) != info:
+                return False
+        return True
+
+
+class _SubsetView(Mapping):
+    """full 快照中按给定尺码序号取子集的只读视图"""
+    __slots__ = ('_full', '_ords')
+
+    def __init__(self, full, ords):
+        self._full = full
+        self._ords = ords
+
+    def __getitem__(self, size):
+        o = SIZE_TABLE.find(size)
+        if o is None or o not in self._ords:
+            raise KeyError(size)
+        return self._full[size]
+
+    def __iter__(self):
+        for o in self._ords:
+            yield SIZE_TABLE.size(o)
+
+    def __len__(self):
+        return len(self._ords)
+
+    def __repr__(self):
+        return f"{dict(self)!r}"
+
+
+class _Derived:
+    """size_price_counts 等派生字段：只存尺码序号；与 full 不一致时才另存一份自己的快照"""
+    __slots__ = ('ords', 'own')
+
+    def __init__(self, ords, own):
+        self.ords = ords
+        self.own = own
+
+    def view(self, full):
+        if self.own is not None:
+            return self.own
+        return _SubsetView(full if full is not None else SizeSnapshot(), self.ords)
+
+
+def _ords_to_state(ords):
+    return ords.tobytes()
+
+
+def _ords_from_state(raw, remap=None, swap=False):
+    ords = array('H')
+    ords.frombytes(raw)
+    if swap:
+        ords.byteswap()
+    if remap is not None:
+        ords = array('H', (remap[o] for o in ords))
+    return ords
+
+
+def _derived_to_state(d):
+    if d is None:
+        return None
+    return _ords_to_state(d.ords), (d.own.to_state() if d.own is not None else None)
+
+
+def _derived_from_state(state, remap=None, swap=False):
+    if state is None:
+        return None
+    ords, own = state
+    return _Derived(_ords_from_state(ords, remap, swap),
+                    SizeSnapshot.from_state(own, remap, swap) if own is not None else None)
+
+
+def _derive(d, full):
+    snap = SizeSnapshot.from_dict(d)
+    ords = array('H', snap.ordinals())
+    if full is not None and full.matches(snap):
+        return _Derived(ords, None)
+    return _Derived(ords, snap)
+
+
+# detail_data 中与列表原始字段重复的元信息，相同时只记标记
+_META_ALIASES = {'title': 'title', 'article_num': 'articleNum', 'img_url': 'logoUrl', 'update_time': 'updateTime'}
+_SAME = object()
+
+_VIRTUAL = frozenset(('full_size_price_counts', 'size_price_counts', 'kept_sizes', 'detail_data'))
+
+
+class ProductRecord(MutableMapping):
+    __slots__ = ('_fields', '_full', '_spc', '_kept', '_detail_meta', '_detail_spc', '_detail_full')
+
+    def __init__(self, fields=None):
+        self._fields = {}
+        self._full = None
+        self._spc = None
+        self._kept = None
+        self._detail_meta = None
+        self._detail_spc = None
+        self._detail_full = None
+        if fields:
+            for k, v in fields.items():
+                if k not in _VIRTUAL:
+                    self._fields[k] = v
+            # 先写 full，派生字段才能复用它
+            for k in ('full_size_price_counts', 'size_price_counts', 'kept_sizes', 'detail_data'):
+                if k in fields:
+                    self[k] = fields[k]
+
+    @classmethod
+    def from_dict(cls, d):
+        if isinstance(d, ProductRecord):
+            return d
+        return cls(d)
+
+    # ===== MutableMapping =====
+    def __getitem__(self, key):
+        if key in _VIRTUAL:
+            if key == 'full_size_price_counts':
+                if self._full is None:
+                    raise KeyError(key)
+                return self._full
+            if key == 'size_price_counts':
+                if self._spc is None:
+                    raise KeyError(key)
+                return self._spc.view(self._full)
+            if key == 'kept_sizes':
+                if self._kept is None:
+                    raise KeyError(key)
+                return [SIZE_TABLE.size(o) for o in self._kept]
+            if self._detail_meta is None:
+                raise KeyError(key)
+            return self._detail_dict()
+        return self._fields[key]
+
+    def __setitem__(self, key, value):
+        if key not in _VIRTUAL:
+            if key in _META_ALIASES.values():
+                self._materialize_meta(key)
+            self._fields[key] = value
+            return
+        if key == 'full_size_price_counts':
+            self._set_full(value)
+        elif key == 'size_price_counts':
+            self._spc = _derive(value, self._full)
+        elif key == 'kept_sizes':
+            self._kept = array('H', (SIZE_TABLE.ordinal(s) for s in value))
+        else:
+            self._set_detail(value)
+
+    def __delitem__(self, key):
+        if key not in _VIRTUAL:
+            del self._fields[key]
+            return
+        if key not in self:
+            raise KeyError(key)
+        if key == 'full_size_price_counts':
+            self._materialize_derived()
+            self._full = None
+        elif key == 'size_price_counts':
+            self._spc = None
+        elif key == 'kept_sizes':
+            self._kept = None
+        else:
+            self._detail_meta = self._detail_spc = self._detail_full = None
+
+    def __contains__(self, key):
+        if key in _VIRTUAL:
+            return {
+                'full_size_price_counts': self._full,
+                'size_price_counts': self._spc,
+                'kept_sizes': self._kept,
+                'detail_data': self._detail_meta,
+            }[key] is not None
+        return key in self._fields
+
+    def __iter__(self):
+        yield from self._fields
+        for k in ('size_price_counts', 'full_size_price_counts', 'kept_sizes', 'detail_data'):
+            if k in self:
+                yield k
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"ProductRecord({self.to_dict()!r})"
+
+    # ===== 内部 =====
+    def _derived_slots(self):
+        return [d for d in (self._spc, self._detail_spc, self._detail_full) if d is not None]
+
+    def _materialize_derived(self):
+        for d in self._derived_slots():
+            if d.own is None:
+                d.own = SizeSnapshot.from_dict(dict(d.view(self._full)))
+
+    def _set_full(self, value):
+        new_full = SizeSnapshot.from_dict(value)
+        old_full = self._full
+        for d in self._derived_slots():
+            if d.own is None:
+                # 派生字段依赖旧 full：取值会变化时先固化
+                view = d.view(old_full)
+                if not new_full.matches(view):
+                    d.own = SizeSnapshot.from_dict(dict(view))
+            elif new_full.matches(d.own):
+                d.own = None
+        self._full = new_full
+
+    def _set_detail(self, value):
+        value = dict(value)
+        spc = value.pop('size_price_counts', None)
+        full = value.pop('size_price_counts_full', None)
+        meta = {}
+        for k, v in value.items():
+            alias = _META_ALIASES.get(k)
+            if alias is not None and isinstance(v, str) and v == (self._fields.get(alias) or '').strip():
+                meta[k] = _SAME
+            else:
+                meta[k] = v
+        self._detail_meta = meta
+        self._detail_spc = _derive(spc, self._full) if spc is not None else None
+        self._detail_full = _derive(full, self._full) if full is not None else None
+
+    def _materialize_meta(self, field):
+        if not self._detail_meta:
+            return
+        for k, alias in _META_ALIASES.items():
+            if alias == field and self._detail_meta.get(k) is _SAME:
+                self._detail_meta[k] = (self._fields.get(alias) or '').strip()
+
+    def _detail_dict(self):
+        d = {}
+        for k, v in self._detail_meta.items():
+            d[k] = (self._fields.get(_META_ALIASES[k]) or '').strip() if v is _SAME else v
+        if self._detail_spc is not None:
+            d['size_price_counts'] = self._detail_spc.view(self._full)
+        if self._detail_full is not None:
+            d['size_price_counts_full'] = self._detail_full.view(self._full)
+        return d
+
+    # ===== 二进制快照（snapshot_store）用的纯数据状态，可直接 marshal =====
+    def to_state(self):
+        meta = None
+        if self._detail_meta is not None:
+            meta = {k: (... if v is _SAME else v) for k, v in self._detail_meta.items()}
+        return (
+            self._fields,
+            self._full.to_state() if self._full is not None else None,
+            _derived_to_state(self._spc),
+            _ords_to_state(self._kept) if self._kept is not None else None,
+            meta,
+            _derived_to_state(self._detail_spc),
+            _derived_to_state(self._detail_full),
+        )
+
+    @classmethod
+    def from_state(cls, state, remap=None, swap=False):
+        fields, full, spc, kept, meta, detail_spc, detail_full = state
+        rec = cls()
+        rec._fields = fields
+        rec._full = SizeSnapshot.from_state(full, remap, swap) if full is not None else None
+        rec._spc = _derived_from_state(spc, remap, swap)
+        rec._kept = _ords_from_state(kept, remap, swap) if kept is not None else None
+        if meta is not None:
+            rec._detail_meta = {k: (_SAME if v is ... else v) for k, v in meta.items()}
+        rec._detail_spc = _derived_from_state(detail_spc, remap, swap)
+        rec._detail_full = _derived_from_state(detail_full, remap, swap)
+        return rec
+
+    # ===== 导出 =====
+    def to_dict(self) -> dict:
+        """转换为普通 dict（可直接 json 序列化）"""
+        out = dict(self._fields)
+        for k in self:
+            if k in _VIRTUAL:
+                v = self[k]
+                if k == 'detail_data':
+                    v = {dk: (dict(dv) if isinstance(dv, Mapping) else dv) for dk, dv in v.items()}
+                elif isinstance(v, Mapping):
+                    v = dict(v)
+                out[k] = v
+        return out
+
+
+def json_default(obj):
+    """json.dump(default=...)：紧凑记录及其映射视图转为普通 dict"""
+    if isinstance(obj, ProductRecord):
+        return obj.to_dict()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# ===== 内存报告 =====
+def deep_sizeof(obj, seen=None) -> int:
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(x, seen) for x in obj)
+    elif isinstance(obj, (ProductRecord, SizeSnapshot, _Derived)):
+        for slot in type(obj).__slots__:
+            size += deep_sizeof(getattr(obj, slot, None), seen)
+    return size
+
+
+def memory_report(products) -> dict:
+    """对比普通 dict 与紧凑记录的内存占用（不含全局尺码表，它在所有商品间共享）"""
+    # 先经过一次 JSON 往返，得到与 load_initial_data 相同的对象结构（不共享子对象）
+    products = json.loads(json.dumps(list(products), default=json_default, ensure_ascii=False))
+    n = max(1, len(products))
+    before = deep_sizeof(products)
+    compact = [ProductRecord.from_dict(p) for p in products]
+    after = deep_sizeof(compact)
+    return {
+        'products': len(products),
+        'bytes_before': before,
+        'bytes_after': after,
+        'bytes_per_product_before': before // n,
+        'bytes_per_product_after': after // n,
+        'ratio': round(after / before, 3) if before else None,
+    }
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'initial_products_data.json'
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    r = memory_report(data)
+    print(f"商品数: {r['products']}")
+    print(f"普通 dict: {r['bytes_before'] / 1048576:.1f} MB，每个商品 {r['bytes_per_product_before']} 字节")
+    print(f"紧凑记录: {r['bytes_after'] / 1048576:.1f} MB，每个商品 {r['bytes_per_product_after']} 字节")
+    print(f"占用比例: {r['ratio']}")
@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+运行中的监控进程的控制通道（本机 Unix socket，文件 monitor.sock；分片/影子模式带相应后缀）。
+
+- stats：查看运行状态（轮次、详情积压、并发、计数器、当前参数）
+- get / set：查看、调整参数（并发、间隔、超时、重试、发送间隔，get 列出全部参数和范围）
+- counter：重置或设置群组计数器（代替运行中直接改 daily_counter.json，那样会被进程内存中的值覆盖）
+- profile：对下一轮做一次性能采样（cycle_profiler.py）
+
+修改类命令进入队列，由监控主线程在下一个安全点（每轮开始前，空闲等待会被提前唤醒）统一生效，
+不会改动正在进行中的详情抓取或推送。
+
+用法：
+    python control_socket.py stats
+    python control_socket.py get
+    python control_socket.py set req_timeout=10 max_retries=2 check_interval=3
+    python control_socket.py counter [群组] [--value N] [--profile 配置名]
+    python control_socket.py profile
+    python control_socket.py --socket monitor_shard0of4.sock stats
+不支持 Unix socket 的平台改用 127.0.0.1 上的随机端口，端口号写在 monitor.sock 文件中。
+"""
+import os
+import sys
+import json
+import stat
+import queue
+import atexit
+import socket
+import time
+import argparse
+import threading
+import detail_processor
+import wechat_bot
+from log_setup import get_logger
+
+log = get_logger('control')
+
+CONTROL_SOCKET = 'monitor.sock'
+APPLY_WAIT = 5.0        # 修改命令等待主线程生效的时间（秒），超时则返回“已排队”
+CLIENT_TIMEOUT = 10.0
+MAX_MESSAGE_BYTES = 4 * 1024 * 1024
+
+
+def _settings(monitor):
+    """参数名 -> (类型, 最小值, 最大值, 读取, 写入, 说明)"""
+    dp = monitor.detail_processor
+
+    def module_attr(mod, name):
+        return lambda: getattr(mod, name), lambda v: setattr(mod, name, v)
+
+    return {
+        'max_workers': (int, 1, 256, lambda: monitor.max_workers,
+                        lambda v: setattr(monitor, 'max_workers', v), '详情抓取线程数（至少为自适应并发上限）'),
+        'check_interval': (float, 0, 3600, lambda: monitor.check_interval,
+                           lambda v: setattr(monitor, 'check_interval', v), '两轮之间的等待（秒）'),
+        'cycle_budget': (float, 0, 3600, lambda: monitor.cycle_budget,
+                         lambda v: setattr(monitor, 'cycle_budget', v), '每轮时限（秒），到时未处理的详情顺延到下一轮，0 为不限制'),
+        'size_workers': (int, 1, 32, *module_attr(detail_processor, 'SIZE_WORKERS'), '每个商品并发请求的尺码数'),
+        'req_timeout': (float, 0.5, 120, *module_attr(detail_processor, 'REQ_TIMEOUT'), '单次尺码请求超时（秒）'),
+        'request_deadline': (float, 1, 600, *module_attr(detail_processor, 'REQUEST_DEADLINE'), '单个尺码含重试的总时限（秒）'),
+        'max_retries': (int, 0, 10, *module_attr(detail_processor, 'MAX_RETRIES'), '尺码请求重试次数'),
+        'retry_backoff': (float, 0, 30, *module_attr(detail_processor, 'RETRY_BACKOFF'), '重试退避基数（秒）'),
+        'retry_backoff_max': (float, 0, 300, *module_attr(detail_processor, 'RETRY_BACKOFF_MAX'), '重试退避上限（秒）'),
+        'concurrency_min': (int, 1, 256, lambda: dp.concurrency_bounds()[0],
+                            lambda v: dp.set_concurrency_bounds(min_limit=v), '自适应并发下限（每个主机/账号）'),
+        'concurrency_max': (int, 1, 256, lambda: dp.concurrency_bounds()[1],
+                            lambda v: dp.set_concurrency_bounds(max_limit=v), '自适应并发上限（每个主机/账号）'),
+        'send_interval': (float, 0, 60, *module_attr(wechat_bot, 'SEND_INTERVAL'), '同一群组两次发送的间隔（秒）'),
+    }
+
+
+def current_settings(monitor):
+    return {name: spec[3]() for name, spec in _settings(monitor).items()}
+
+
+def _parse_settings(monitor, changes):
+    """校验 {参数名: 值}，返回转换后的值；参数无效时抛出 ValueError"""
+    specs = _settings(monitor)
+    out = {}
+    for name, raw in changes.items():
+        if name not in specs:
+            raise ValueError(f"未知参数 {name}（可选：{', '.join(specs)}）")
+        typ, lo, hi = specs[name][:3]
+        try:
+            value = typ(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} 需要 {typ.__name__}：{raw!r}")
+        if not lo <= value <= hi:
+            raise ValueError(f"{name} 超出范围 {lo}-{hi}：{value}")
+        out[name] = value
+    lo = out.get('concurrency_min', specs['concurrency_min'][3]())
+    hi = out.get('concurrency_max', specs['concurrency_max'][3]())
+    if lo > hi:
+        raise ValueError(f"concurrency_min ({lo}) 不能大于 concurrency_max ({hi})")
+    return out
+
+
+def _parse_counter(monitor, req):
+    names = {p.name: p for p in monitor.profiles}
+    profile = req.get('profile') or 'default'
+    if profile not in names:
+        raise ValueError(f"没有筛选配置 {profile}（可选：{', '.join(names)}）")
+    group = req.get('group')
+    if group is not None and group not in (1, 2, 3):
+        raise ValueError("群组编号必须是 1、2 或 3")
+    value = req.get('value', 1)
+    if not isinstance(value, int) or value < 1:
+        raise ValueError("计数器的值必须是正整数")
+    return {'profile': profile, 'group': group, 'value': value}
+
+
+def stats(monitor):
+    return {
+        'pid': os.getpid(),
+        'shard': list(monitor.shard) if monitor.shard else None,
+        'shadow': monitor.shadow,
+        'date': monitor.current_date,
+        'cycles': monitor.cycles,
+        'last_cycle_seconds': monitor.last_cycle_seconds,
+        'detail_queue': len(monitor.detail_queue),
+        'backlog': backlog_stats(monitor),
+        'pending_pushes': len(monitor.push_finishers),
+        'products': len(monitor.products_data),
+        'counters': {p.name: p.counter_values() for p in monitor.profiles},
+        'concurrency': monitor.detail_processor.get_metrics(),
+        'accounts': monitor.session_pool.metrics() if monitor.session_pool else None,
+        'settings': current_settings(monitor),
+    }
+
+
+def backlog_stats(monitor):
+    oldest = monitor.detail_queue.oldest_enqueued()
+    return {
+        'size': len(monitor.detail_queue),
+        'oldest_seconds': round(time.time() - oldest, 1) if oldest is not None else None,
+        'carried_last_cycle': monitor.carried_over,
+        'deadline_hits': monitor.deadline_hits,
+    }
+
+
+class _Command:
+    def __init__(self, kind, args):
+        self.kind = kind
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+
+
+class ControlServer:
+    """监听控制通道；查询直接在连接线程中应答，修改命令排队等主线程调用 apply_pending()"""
+
+    def __init__(self, monitor, path):
+        self.monitor = monitor
+        self.path = path
+        self.wake = threading.Event()
+        self._pending = queue.Queue()
+        self._sock = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            try:
+                request(self.path, {'cmd': 'ping'}, timeout=1)
+                log.warning(f"控制通道 {os.path.basename(self.path)} 已被另一个监控进程使用，本进程不开启")
+                return False
+            except OSError:
+                os.remove(self.path)  # 上次异常退出留下的文件
+        try:
+            if hasattr(socket, 'AF_UNIX'):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.bind(self.path)
+                os.chmod(self.path, 0o600)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.bind(('127.0.0.1', 0))
+                with open(self.path, 'w', encoding='utf-8') as f:
+                    f.write(f"tcp:{sock.getsockname()[1]}")
+            sock.listen(8)
+        except OSError as e:
+            log.warning(f"无法开启控制通道：{e}")
+            return False
+        self._sock = sock
+        atexit.register(self.close)
+        threading.Thread(target=self._serve, name='control-socket', daemon=True).start()
+        log.info(f"控制通道：{os.path.basename(self.path)}（python control_socket.py stats）")
+        return True
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _serve(self):
+        while self._sock is not None:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                conn.settimeout(CLIENT_TIMEOUT)
+                req = json.loads(_read_line(conn))
+                resp = self._dispatch(req)
+            except ValueError as e:
+                resp = {'ok': False, 'error': str(e)}
+            except Exception as e:
+                log.warning(f"控制命令处理失败：{e}")
+                resp = {'ok': False, 'error': str(e)}
+            try:
+                conn.sendall(json.dumps(resp, ensure_ascii=False, default=str).encode('utf-8') + b'\n')
+            except OSError:
+                pass
+
+    def _dispatch(self, req):
+        cmd = req.get('cmd')
+        if cmd == 'ping':
+            return {'ok': True}
+        if cmd == 'stats':
+            return {'ok': True, 'stats': stats(self.monitor)}
+        if cmd == 'get':
+            specs = _settings(self.monitor)
+            return {'ok': True, 'settings': {k: {'value': s[3](), 'range': [s[1], s[2]], 'help': s[5]}
+                                             for k, s in specs.items()}}
+        if cmd == 'profile':
+            self.monitor.profiler.request()
+            self.wake.set()
+            return {'ok': True, 'message': '下一轮将进行性能采样，报告写入 profiles/'}
+        if cmd == 'set':
+            command = _Command('set', _parse_settings(self.monitor, req.get('settings') or {}))
+        elif cmd == 'counter':
+            command = _Command('counter', _parse_counter(self.monitor, req))
+        else:
+            raise ValueError(f"未知命令 {cmd!r}")
+        self._pending.put(command)
+        self.wake.set()
+        if command.done.wait(APPLY_WAIT):
+            return command.result
+        return {'ok': True, 'queued': True, 'message': '已排队，将在当前一轮结束后生效'}
+
+    # ===== 主线程调用 =====
+    def idle(self, seconds):
+        """代替轮询间隔的 sleep：收到修改命令时提前返回"""
+        self.wake.wait(seconds)
+        self.wake.clear()
+
+    def apply_pending(self):
+        applied = 0
+        while True:
+            try:
+                command = self._pending.get_nowait()
+            except queue.Empty:
+                return applied
+            try:
+                if command.kind == 'set':
+                    command.result = {'ok': True, 'applied': self._apply_settings(command.args)}
+                else:
+                    command.result = {'ok': True, 'counters': self._apply_counter(**command.args)}
+            except Exception as e:
+                command.result = {'ok': False, 'error': str(e)}
+            command.done.set()
+            applied += 1
+
+    def _apply_settings(self, changes):
+        specs = _settings(self.monitor)
+        applied = {name: [specs[name][3](), value] for name, value in changes.items()}
+        bounds = {k: changes.pop(k) for k in ('concurrency_min', 'concurrency_max') if k in changes}
+        for name, value in changes.items():
+            specs[name][4](value)
+        if bounds:
+            # 上下限一起调整，避免中间状态出现 下限 > 上限
+            self.monitor.detail_processor.set_concurrency_bounds(bounds.get('concurrency_min'),
+                                                                 bounds.get('concurrency_max'))
+        log.info("[控制] 参数已调整：" + '，'.join(f"{k} {o} → {n}" for k, (o, n) in applied.items()))
+        return applied
+
+    def _apply_counter(self, profile, group, value):
+        p = next(x for x in self.monitor.profiles if x.name == profile)
+        for g in ([group] if group else (1, 2, 3)):
+            p.set_counter(g, value)
+        if p.is_default and group is None and value == 1:
+            self.monitor._save_daily_counter(1)
+        log.info(f"[控制] {p.tag}{'群组' + str(group) if group else '所有群组'}的计数器已设为 {value}")
+        return p.counter_values()
+
+
+# ===== 客户端 =====
+def _read_line(conn):
+    buf = b''
+    while not buf.endswith(b'\n'):
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > MAX_MESSAGE_BYTES:
+            raise ValueError("消息过长")
+    return buf.decode('utf-8')
+
+
+def _connect(path, timeout):
+    st = os.stat(path)  # 不存在时抛出 OSError
+    if stat.S_ISSOCK(st.st_mode):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        addr = path
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            kind, _, port = f.read().strip().partition(':')
+        if kind != 'tcp' or not port.isdigit():
+            raise OSError(f"{path} 不是控制通道")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        addr = ('127.0.0.1', int(port))
+    sock.settimeout(timeout)
+    try:
+        sock.connect(addr)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def request(path, payload, timeout=CLIENT_TIMEOUT):
+    """发送一条命令并返回应答；进程未运行时抛出 OSError"""
+    with _connect(path, timeout) as sock:
+        sock.sendall(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n')
+        line = _read_line(sock)
+    if not line:
+        raise OSError("控制通道没有应答")
+    return json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='运行中的监控进程的控制通道')
+    parser.add_argument('--socket', default=CONTROL_SOCKET, help=f'控制通道文件（默认 {CONTROL_SOCKET}）')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('stats', help='运行状态')
+    sub.add_parser('get', help='当前参数')
+    p_set = sub.add_parser('set', help='调整参数，例如 req_timeout=10')
+    p_set.add_argument('pairs', nargs='+', metavar='参数=值')
+    p_counter = sub.add_parser('counter', help='重置/设置群组计数器')
+    p_counter.add_argument('group', nargs='?', type=int, choices=[1, 2, 3])
+    p_counter.add_argument('--value', type=int, default=1)
+    p_counter.add_argument('--profile', default='default')
+    sub.add_parser('profile', help='对下一轮做一次性能采样')
+    args = parser.parse_args(argv)
+
+    payload = {'cmd': args.cmd}
+    if args.cmd == 'set':
+        try:
+            payload['settings'] = dict(p.split('=', 1) for p in args.pairs)
+        except ValueError:
+            parser.error('参数格式应为 参数名=值')
+    elif args.cmd == 'counter':
+        payload.update(group=args.group, value=args.value, profile=args.profile)
+    try:
+        resp = request(args.socket, payload)
+    except OSError as e:
+        print(f"✗ 无法连接 {args.socket}（监控进程未运行？）：{e}")
+        return 1
+    if not resp.get('ok'):
+        print(f"✗ {resp.get('error')}")
+        return 1
+    if args.cmd == 'get':
+        for name, s in resp['settings'].items():
+            print(f"  {name:<18} {s['value']!s:<8} [{s['range'][0]}-{s['range'][1]}] {s['help']}")
+    elif args.cmd == 'stats':
+        print(json.dumps(resp['stats'], ensure_ascii=False, indent=2))
+    elif args.cmd == 'profile' or resp.get('queued'):
+        print(f"… {resp['message']}")
+    elif args.cmd == 'set':
+        for name, (old, new) in resp['applied'].items():
+            print(f"✓ {name}: {old} → {new}")
+    else:
+        print(f"✓ 计数器已更新：{resp['counters']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
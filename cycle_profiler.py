@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+按轮次的性能采样：某一轮突然变慢时，看清时间花在网络、锁等待、解析还是磁盘上。
+
+- 采样：后台线程每 SAMPLE_INTERVAL 秒读取一次各线程的调用栈（sys._current_frames），
+  统计热点函数（自身 / 含子调用）、按类别（网络、锁等待、解析、JSON、磁盘/压缩）和按线程的占比
+- 内存：采样期间开启 tracemalloc（TRACE_MEMORY），对比本轮开始/结束的快照，列出增长最多的分配位置和文件；
+  同时记录商品数、各筛选配置冷却表大小及相对上次采样的增长。tracemalloc 会让分配密集的代码明显变慢，
+  只关心耗时分布时可以关闭
+- 报告写入 profiles/cycle-<时间>-<轮次>.txt
+
+只在被选中的轮次开启（python main.py --profile-every N / --profile-next，或运行中
+python control_socket.py profile），其余轮次只有一次判断，没有额外开销。
+"""
+import os
+import re
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from log_setup import get_logger
+
+log = get_logger('profiler')
+
+PROFILE_DIR = 'profiles'
+SAMPLE_INTERVAL = 0.01
+TOP_N = 25
+TRACE_MEMORY = True
+TRACE_FRAMES = 1          # 报告只按最内层分配位置汇总
+# 只统计处理本轮的线程（主线程、详情线程池、企业微信发送线程），其余常驻后台线程只在按线程统计中列出
+CYCLE_THREADS = ('MainThread', 'ThreadPoolExecutor', 'wechat-group')
+# 按调用栈最内层的 Python 帧归类
+_IDLE_WORKER = '/concurrent/futures/thread.py'
+CATEGORIES = (
+    ('网络', ('/socket.py', '/ssl.py', '/http/client.py', '/urllib3/', '/requests/')),
+    ('锁/等待', ('/threading.py', '/queue.py', '/concurrent/futures/')),
+    ('解析', ('/bs4/', '/html/parser.py', '/re/', '/re.py', '/_strptime.py', 'detail_processor.py')),
+    ('JSON', ('/json/',)),
+    ('磁盘/压缩', ('snapshot_store.py', 'size_history.py', 'output_archive.py', 'product_archive.py',
+                '/gzip.py', '/shutil.py', '/sqlite3/')),
+)
+
+
+class CycleProfiler:
+    def __init__(self, out_dir=PROFILE_DIR, every=0, interval=SAMPLE_INTERVAL, top_n=TOP_N):
+        self.out_dir = out_dir
+        self.every = every
+        self.interval = interval
+        self.top_n = top_n
+        self._requested = threading.Event()
+        self._active = None
+        self._last_sizes = None
+
+    @property
+    def active(self):
+        return self._active is not None
+
+    def request(self):
+        """下一轮开始时采样一次（控制通道调用）"""
+        self._requested.set()
+
+    # ===== 主线程调用 =====
+    def begin(self, cycle, sizes):
+        """每轮开始时调用；sizes 为 {名称: 数量}（商品数、冷却表大小等）"""
+        if self._active is not None:
+            return
+        if not (self._requested.is_set() or (self.every and cycle % self.every == 0)):
+            return
+        self._requested.clear()
+        self._active = _Session(cycle, sizes, self.interval)
+
+    def end(self, sizes, completed=True):
+        """每轮结束时调用；completed=False 表示本轮中途失败（报告中注明，只覆盖失败前的部分）"""
+        session, self._active = self._active, None
+        if session is None:
+            return None
+        session.stop()
+        session.completed = completed
+        try:
+            path = self._write_report(session, sizes)
+        except OSError as e:
+            log.warning(f"写入性能采样报告失败：{e}")
+            return None
+        self._last_sizes = sizes
+        top = ' / '.join(f'{k} {v:.0%}' for k, v in session.category_share()[:3]) or '无处理线程样本'
+        log.info(f"[profile] 第 {session.cycle} 轮采样 {session.samples} 次，{top}，报告：{path}")
+        return path
+
+    def _write_report(self, session, sizes):
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"cycle-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{session.cycle}.txt")
+        lines = [f"=== 第 {session.cycle} 轮性能采样 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                 f"{'' if session.completed else '（本轮未正常结束）'} ===",
+                 f"耗时 {session.elapsed:.2f} 秒，采样 {session.samples} 次（间隔 {self.interval * 1000:g}ms），"
+                 f"线程样本 {session.thread_samples} 个（另有空闲线程池样本 {session.idle_samples} 个）"
+                 + ('，开启了 tracemalloc，耗时偏高' if session.mem_before else ''), '']
+        lines.append('[分类]（处理线程的样本占比，按最内层 Python 帧归类）')
+        for name, share in session.category_share():
+            lines.append(f"  {name:<8} {share:6.1%}")
+        lines += ['', f'[热点函数 - 自身] 前 {self.top_n}']
+        lines += _format_counts(session.self_counts, session.thread_samples, self.top_n)
+        lines += ['', f'[热点函数 - 含子调用] 前 {self.top_n}']
+        lines += _format_counts(session.cum_counts, session.thread_samples, self.top_n)
+        lines += ['', '[按线程]']
+        for name, n in session.by_thread.most_common():
+            lines.append(f"  {n:7d}  {name}")
+
+        lines += ['', '[数据规模]（本轮开始 → 结束，括号内为相对上次采样结束的增长）']
+        for key, end in sizes.items():
+            start = session.sizes.get(key, 0)
+            prev = (self._last_sizes or {}).get(key)
+            growth = f"（{end - prev:+d}）" if prev is not None else ''
+            lines.append(f"  {key:<24} {start} → {end}{growth}")
+
+        if session.mem_before is not None:
+            current, peak = session.mem_peak
+            lines += ['', f'[内存分配] tracemalloc 当前 {current / 1048576:.1f}MB，峰值 {peak / 1048576:.1f}MB']
+            lines.append(f'  增长最多的分配位置 前 {self.top_n}：')
+            for stat in session.mem_after.compare_to(session.mem_before, 'lineno')[:self.top_n]:
+                frame = stat.traceback[0]
+                lines.append(f"  {stat.size_diff / 1024:+10.1f}KB {stat.count_diff:+8d} 个  "
+                             f"{_short(frame.filename)}:{frame.lineno}")
+            lines.append('  按文件：')
+            for stat in session.mem_after.compare_to(session.mem_before, 'filename')[:10]:
+                lines.append(f"  {stat.size_diff / 1024:+10.1f}KB  {_short(stat.traceback[0].filename)}")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+
+class _Session:
+    def __init__(self, cycle, sizes, interval):
+        self.cycle = cycle
+        self.sizes = dict(sizes)
+        self.interval = interval
+        self.samples = 0
+        self.thread_samples = 0
+        self.idle_samples = 0
+        self.self_counts = Counter()
+        self.cum_counts = Counter()
+        self.categories = Counter()
+        self.by_thread = Counter()
+        self.started_tracing = TRACE_MEMORY and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start(TRACE_FRAMES)
+        self.mem_before = None
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self.mem_before = tracemalloc.take_snapshot()
+        self.mem_after = None
+        self.mem_peak = (0, 0)
+        self.t0 = time.time()
+        self.elapsed = 0.0
+        self.completed = True
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='cycle-profiler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            self.samples += 1
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                name = names.get(ident, str(ident))
+                self.by_thread[re.sub(r'_\d+$', '', name)] += 1   # 线程池各线程合并统计
+                if not name.startswith(CYCLE_THREADS):
+                    continue
+                leaf = frame.f_code
+                if leaf.co_name == '_worker' and _IDLE_WORKER in leaf.co_filename.replace('\\', '/'):
+                    self.idle_samples += 1   # 线程池中没有任务的空闲线程，不计入占比
+                    continue
+                self.thread_samples += 1
+                self.self_counts[_key(leaf)] += 1
+                self.categories[_category(leaf.co_filename)] += 1
+                seen = set()
+                f = frame
+                while f is not None:
+                    key = _key(f.f_code)
+                    if key not in seen:
+                        seen.add(key)
+                        self.cum_counts[key] += 1
+                    f = f.f_back
+            del frames
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.time() - self.t0
+        if self.mem_before is not None:
+            self.mem_after = tracemalloc.take_snapshot()
+            self.mem_peak = tracemalloc.get_traced_memory()
+        if self.started_tracing:
+            tracemalloc.stop()
+
+    def category_share(self):
+        total = max(1, self.thread_samples)
+        return [(name, n / total) for name, n in self.categories.most_common()]
+
+
+def _key(code):
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _category(filename):
+    path = filename.replace('\\', '/')
+    for name, patterns in CATEGORIES:
+        if any(p in path for p in patterns):
+            return name
+    return 'Python'
+
+
+def _short(filename):
+    path = filename.replace('\\', '/')
+    for marker in ('/site-packages/', '/lib/python'):
+        if marker in path:
+            return path.split(marker, 1)[1]
+    return os.path.basename(path)
+
+
+def _format_counts(counter, total, top_n):
+    total = max(1, total)
+    return [f"  {n / total:6.1%} {n:7d}  {func} ({_short(fn)}:{line})"
+            for (fn, line, func), n in counter.most_common(top_n)]
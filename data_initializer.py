@@ -1,30 +1,64 @@
 # -*- coding: utf-8 -*-
+import os
 import json
+import time
+import queue
+import threading
 import requests
 import concurrent.futures
 from datetime import datetime
 from base_login import BaseLogin
 from detail_processor import DetailProcessor
 
+CHECKPOINT_BATCH = 200   # 每抓完多少个商品写一次断点文件
+PAGE_RETRIES = 3         # 列表页请求失败后的重试次数（每次失败后等待 PAGE_RETRY_DELAY * 次数 秒）
+PAGE_RETRY_DELAY = 5
+PAGE_QUEUE_SIZE = 4      # 预取列表页的缓冲上限：详情跟不上时翻页线程等待，限制峰值内存
+
+
+class PageFetchError(Exception):
+    """列表页重试后仍然失败（不是“没有更多商品”）"""
+
+
 class DataInitializer(BaseLogin):
     def __init__(self):
         super().__init__()
         self.detail_processor = DetailProcessor()
+        self.detail_processor.set_relogin_handler(lambda: self.login_with_captcha(self.detail_processor))
         self.data_file = 'initial_products_data.json'
+        # 断点文件：每行一个商品（JSON Lines），初始化完成后合并为 data_file 并删除
+        self.partial_file = os.path.splitext(self.data_file)[0] + '.partial.jsonl'
         self.max_workers = 10
 
-    def fetch_all_products(self):
-        all_products = []
+    def iter_pages(self, page_size=500):
+        """
+        逐页产出商品列表。空页表示没有更多商品；请求失败（fetch_page 返回 None）时重试，
+        最后一次重试前重新登录，仍失败则抛出 PageFetchError，不把失败当作列表结束
+        """
         page_num = 1
-        page_size = 500
         while True:
             products = self.fetch_page(page_num, page_size)
-            if not products or len(products) == 0:
+            attempt = 0
+            while products is None:
+                attempt += 1
+                if attempt > PAGE_RETRIES:
+                    raise PageFetchError(f"第 {page_num} 页请求失败（已重试 {PAGE_RETRIES} 次）")
+                print(f"第 {page_num} 页请求失败，{PAGE_RETRY_DELAY * attempt} 秒后重试（{attempt}/{PAGE_RETRIES}）")
+                time.sleep(PAGE_RETRY_DELAY * attempt)
+                if attempt == PAGE_RETRIES:
+                    self.login_with_captcha(self.detail_processor)
+                products = self.fetch_page(page_num, page_size)
+            if len(products) == 0:
                 break
-            all_products.extend(products)
+            yield products
             if len(products) < page_size:
                 break
             page_num += 1
+
+    def fetch_all_products(self):
+        all_products = []
+        for products in self.iter_pages():
+            all_products.extend(products)
         return all_products
 
     def fetch_page(self, page_num, page_size):
@@ -62,17 +96,151 @@ class DataInitializer(BaseLogin):
             pass
         return None
 
-    def initialize_all_data(self):
+    def initialize_all_data(self, resume=None):
+        """
+        流式初始化：后台线程尽快翻完列表（不受详情抓取速度限制，整个列表在开始后很短时间内读完，
+        抓取期间更新时间变化的商品不会因为翻页位移而漏掉），主线程边收到列表页边提交详情任务（在途任务数有上限），
+        结果按批追加到断点文件；中途崩溃后再次运行会跳过已抓到详情的商品。
+        列表页请求失败时保留断点文件并返回 False，不会写出不完整的数据文件。
+        resume=None 时断点文件存在即续传。
+        """
+        if resume is None:
+            resume = os.path.exists(self.partial_file)
         if not self.login_with_captcha(self.detail_processor):
+            return False
+
+        captured = self._load_checkpoint() if resume else set()
+        if resume:
+            print(f"继续上次未完成的初始化：已抓取 {len(captured)} 个商品")
+        elif os.path.exists(self.partial_file):
+            os.remove(self.partial_file)
+
+        max_inflight = self.max_workers * 2
+        buffer = []
+        seen = set()
+        total = 0
+
+        def _harvest(futs, block):
+            done, _ = concurrent.futures.wait(
+                futs, timeout=None if block else 0,
+                return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for f in done:
+                product = futs.pop(f)
+                buffer.append(f.result() or product)
+            if len(buffer) >= CHECKPOINT_BATCH:
+                self._append_checkpoint(buffer)
+                buffer.clear()
+
+        pages = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def _put(item):
+            """队列满时等待；主循环已退出（中断/出错）则放弃，翻页线程随之结束"""
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _produce():
+            try:
+                for products in self.iter_pages():
+                    if not _put(products):
+                        return
+                _put(None)
+            except Exception as e:
+                _put(e)
+
+        threading.Thread(target=_produce, name='init-pages', daemon=True).start()
+        failed = None
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+                inflight = {}
+                while True:
+                    products = pages.get()
+                    if products is None:
+                        break
+                    if isinstance(products, Exception):
+                        failed = products
+                        break
+                    for p in products:
+                        pid = p.get('id')
+                        if pid in seen or pid in captured:
+                            continue
+                        seen.add(pid)
+                        total += 1
+                        while len(inflight) >= max_inflight:
+                            _harvest(inflight, block=True)
+                        inflight[ex.submit(self._fetch_and_attach_detail, p)] = p
+                    if inflight:
+                        _harvest(inflight, block=False)
+                while inflight:
+                    _harvest(inflight, block=True)
+        finally:
+            stop.set()
+            # 中断时也把已完成但未落盘的结果写入断点文件
+            self._append_checkpoint(buffer)
+
+        if failed is not None:
+            print(f"初始化未完成：{failed}。已抓取的商品保存在 {self.partial_file}，重新运行将从断点继续")
+            return False
+        if total == 0 and not captured:
+            return False
+        print(f"本次抓取 {total} 个商品，合并写入 {self.data_file}")
+        self._assemble_from_checkpoint()
+        return True
+
+    # ===== 断点文件 =====
+    def _append_checkpoint(self, products):
+        if not products:
             return
-        all_products = self.fetch_all_products()
-        if not all_products:
-            return
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
-            fut = {ex.submit(self._fetch_and_attach_detail, p): p for p in all_products}
-            for _ in concurrent.futures.as_completed(fut):
-                pass
-        self.save_data(all_products)
+        with open(self.partial_file, 'a', encoding='utf-8') as f:
+            for p in products:
+                f.write(json.dumps(p, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _iter_checkpoint(self):
+        """逐行读取断点文件，产出 (行偏移, 商品)；崩溃时写了一半的末行跳过"""
+        with open(self.partial_file, 'rb') as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    yield offset, json.loads(line)
+                except ValueError:
+                    continue
+
+    def _load_checkpoint(self):
+        """已抓到详情的商品ID（详情失败的商品续传时重新抓取）"""
+        return {p.get('id') for _, p in self._iter_checkpoint() if 'detail_data' in p}
+
+    def _assemble_from_checkpoint(self):
+        """按商品ID去重（优先保留带详情的记录），流式写出最终 JSON，不把全部商品读进内存"""
+        offsets = {}
+        for offset, p in self._iter_checkpoint():
+            pid = p.get('id')
+            prev = offsets.get(pid)
+            if prev is None or 'detail_data' in p or not prev[1]:
+                offsets[pid] = (offset, 'detail_data' in p)
+        tmp = self.data_file + '.tmp'
+        with open(self.partial_file, 'rb') as src, open(tmp, 'w', encoding='utf-8') as out:
+            out.write('[')
+            first = True
+            for offset, _ in sorted(offsets.values()):
+                src.seek(offset)
+                product = json.loads(src.readline())
+                body = json.dumps(product, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+                out.write(('\n  ' if first else ',\n  ') + body)
+                first = False
+            out.write('\n]' if not first else ']')
+        os.replace(tmp, self.data_file)
+        os.remove(self.partial_file)
 
     def save_data(self, products):
         with open(self.data_file, 'w', encoding='utf-8') as f:
@@ -5,6 +5,12 @@ import requests
 import urllib.parse
 import concurrent.futures
 from bs4 import BeautifulSoup
+from rate_controller import HostLimiters, OUTCOME_OK, OUTCOME_ERROR, OUTCOME_OVERLOAD, backoff_delay
+from session_guard import SessionCircuitBreaker, SessionExpiredError, is_login_response
+from rule_engine import CompiledRules
+from log_setup import get_logger
+
+log = get_logger('detail')
 
 EXCLUDED_BRANDS = [
     'under armour','hoka','saucony','salomon','puma','lining','new balance','ugg',
@@ -23,6 +29,20 @@ REQ_TIMEOUT = 8
 SIZE_WORKERS = 1
 MAX_RETRIES = 3
 RETRY_BACKOFF = 0.6
+RETRY_BACKOFF_MAX = 5.0
+REQUEST_DEADLINE = 30      # 单个尺码请求（含重试）的总时限（秒）
+
+# 自适应并发（按主机 AIMD）
+CONCURRENCY_INITIAL = 8
+CONCURRENCY_MIN = 2
+CONCURRENCY_MAX = 32
+LATENCY_TARGET = 2.0       # 平滑延迟低于该值（秒）时才允许增加并发
+
+SEEKS_URL = 'https://www.gxkj123456.com/tgc/gxPc/seek/work/seeks'
+
+
+class DetailDeferredError(Exception):
+    """尺码请求等不到并发额度或超过总时限：结果未知，不能按 0 人记录（否则下次成功时会被当作 0→N 推送）"""
 
 
 class DetailProcessor:
@@ -40,34 +60,68 @@ class DetailProcessor:
         adapter = requests.adapters.HTTPAdapter(pool_connections=128, pool_maxsize=256)
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
+        self.limiters = HostLimiters(initial=CONCURRENCY_INITIAL, min_limit=CONCURRENCY_MIN,
+                                     max_limit=CONCURRENCY_MAX, latency_target=LATENCY_TARGET)
+        # 会话过期熔断，重新登录由使用方通过 set_relogin_handler 注入
+        self.breaker = SessionCircuitBreaker()
+        # 可选的多账号会话池；为 None 时所有请求使用 self.cookies
+        self.session_pool = None
+        # 编译后的筛选规则（品牌自动机 / 尺码表 / 价格区间）
+        self.rules = CompiledRules(EXCLUDED_BRANDS, ALLOWED_SIZES, PRICE_MIN, PRICE_MAX)
+        # 其他筛选配置的规则：任一配置需要的商品都会抓取详情
+        self.extra_rules = ()
 
     def update_cookies(self, jsessionid: str):
-        self.cookies['JSESSIONID'] = jsessionid
+        self.cookies = dict(self.cookies, JSESSIONID=jsessionid)
+        self.breaker.on_session_updated()
+
+    def set_session_pool(self, pool):
+        self.session_pool = pool
+
+    def set_relogin_handler(self, relogin):
+        """relogin() -> bool，会话过期熔断时调用一次"""
+        self.breaker.set_relogin_handler(relogin)
 
     def fetch_and_process_detail(self, product_data: dict):
         return self._fetch_by_iter_sizes(product_data)
 
+    def max_concurrency(self) -> int:
+        # 每个账号各自有一套并发上限，线程上限随账号数扩展
+        return self.concurrency_bounds()[1] * max(1, len(self.session_pool) if self.session_pool else 1)
+
+    def concurrency_bounds(self):
+        kw = self.limiters.limiter_kwargs
+        return kw['min_limit'], kw['max_limit']
+
+    def set_concurrency_bounds(self, min_limit=None, max_limit=None):
+        """运行中调整自适应并发的上下限（control_socket）"""
+        lo, hi = self.concurrency_bounds()
+        self.limiters.set_bounds(lo if min_limit is None else min_limit, hi if max_limit is None else max_limit)
+
+    def get_metrics(self) -> dict:
+        """各主机当前并发上限、在途请求数、平滑延迟和错误率"""
+        return self.limiters.metrics()
+
     # ===== 规则 =====
     def _should_skip_brand(self, title: str) -> bool:
-        if not title:
-            return False
-        tl = title.lower()
-        return any(b in tl for b in EXCLUDED_BRANDS)
+        # 所有筛选配置都排除该品牌时才跳过
+        return all(r.skip_brand(title) for r in (self.rules,) + tuple(self.extra_rules))
 
     def _size_allowed(self, size: str) -> bool:
-        return True if not ALLOWED_SIZES else (str(size) in ALLOWED_SIZES)
+        return self.rules.size_allowed(size)
 
     def _in_price_range_or_zero(self, price_str: str) -> bool:
         # "未出价"也当作有效尺码
-        if price_str == '未出价' or price_str.strip() == '未出价':
-            return True
-        try:
-            p = float(price_str)
-        except Exception:
-            return False
-        if p == 0.0:
-            return True
-        return PRICE_MIN <= p <= PRICE_MAX
+        return self.rules.price_ok(price_str)
+
+    def list_exclude_reason(self, product_data: dict):
+        """列表阶段即可判定不需要抓详情的商品（所有筛选配置都排除：排除品牌 / 没有允许尺码），返回原因或 None"""
+        reason = None
+        for rules in (self.rules,) + tuple(self.extra_rules):
+            reason = rules.exclude_reason(product_data)
+            if reason is None:
+                return None
+        return reason
 
     # ===== 解析 =====
     def _parse_people_and_time(self, html: str):
@@ -103,26 +157,92 @@ class DetailProcessor:
             return '0.0'
         return '未出价'
 
-    # ===== 单尺码请求（带轻量重试） =====
+    # ===== 单尺码请求（多账号分摊 + 自适应并发 + 抖动重试 + 总时限 + 会话熔断） =====
+    def _pick_account(self):
+        """从账号池选出在途请求占并发上限比例最低的账号；无可用账号时返回 None（使用主账号）"""
+        if not self.session_pool:
+            return None
+        best, best_load = None, None
+        for acct in self.session_pool.candidates():
+            lim = self.limiters.get(SEEKS_URL, account=acct.username)
+            load = lim.inflight / max(1, lim.limit)
+            if best is None or load < best_load:
+                best, best_load = acct, load
+        return best
+
     def _fetch_one_size(self, pid: str, size: str, ptype: str = '0'):
         params = {'pid': pid, 'type': ptype, 'size': str(size)}
-        for attempt in range(MAX_RETRIES + 1):
+        deadline = time.time() + REQUEST_DEADLINE
+        session_retried = False
+        account_retries = 0
+        attempt = 0
+        while attempt <= MAX_RETRIES:
+            acct = self._pick_account()
+            if acct is None:
+                # 主账号：会话过期熔断期间在此等待或快速失败（抛出 SessionExpiredError）
+                generation = self.breaker.wait_ready()
+                cookies = self.cookies
+                limiter = self.limiters.get(SEEKS_URL)
+            else:
+                cookies = acct.cookies
+                limiter = self.limiters.get(SEEKS_URL, account=acct.username)
+            remaining = deadline - time.time()
+            if remaining <= 0 or not limiter.acquire(timeout=remaining):
+                raise DetailDeferredError(f"尺码 {size} 在 {REQUEST_DEADLINE:g} 秒内未取得并发额度")
+            outcome, latency, status = OUTCOME_ERROR, None, None
+            t0 = time.time()
             try:
                 r = self.session.get(
-                    'https://www.gxkj123456.com/tgc/gxPc/seek/work/seeks',
-                    params=params, cookies=self.cookies, headers=self.detail_headers,
-                    timeout=REQ_TIMEOUT, allow_redirects=True
+                    SEEKS_URL, params=params, cookies=cookies, headers=self.detail_headers,
+                    timeout=min(REQ_TIMEOUT, max(0.5, deadline - t0)), allow_redirects=True
                 )
-                if r.status_code != 200 or not r.text:
+                latency = time.time() - t0
+                status = r.status_code
+                if r.status_code == 429 or r.status_code >= 500:
+                    outcome = OUTCOME_OVERLOAD
+                elif r.status_code == 200 and r.text:
+                    outcome = OUTCOME_OK
+                if outcome != OUTCOME_OK:
                     raise RuntimeError(f"http_{r.status_code}")
+            except (requests.Timeout, requests.ConnectionError) as e:
+                outcome = OUTCOME_OVERLOAD
+                log.debug("尺码请求超时/连接失败 pid=%s size=%s: %s", pid, size, e, extra={'rate_key': 'size_overload'})
+            except Exception as e:
+                log.debug("尺码请求失败 pid=%s size=%s: %s", pid, size, e, extra={'rate_key': 'size_error'})
+            finally:
+                limiter.release(latency, outcome)
+
+            logged_out = outcome == OUTCOME_OK and is_login_response(r)
+            if acct is not None:
+                self.session_pool.report(acct, outcome == OUTCOME_OK and not logged_out,
+                                         throttled=(status == 429), logged_out=logged_out)
+                if logged_out:
+                    # 该账号会话过期：已摘除并后台重新登录，换其他账号重试（不占用重试次数）
+                    account_retries += 1
+                    if account_retries > len(self.session_pool):
+                        raise SessionExpiredError("账号池会话均已过期")
+                    continue
+            elif logged_out:
+                # 登录页不能当作“未出价/0人”，熔断并重新登录后用新会话重试（不占用重试次数）
+                if session_retried:
+                    raise SessionExpiredError("重新登录后仍返回登录页")
+                self.breaker.trip(generation)
+                session_retried = True
+                deadline = time.time() + REQUEST_DEADLINE
+                continue
+
+            if outcome == OUTCOME_OK:
                 price_str = self._extract_hand_price(r.text)
                 people_cnt, latest_time = self._parse_people_and_time(r.text)
                 return price_str, people_cnt, latest_time
-            except Exception:
-                if attempt < MAX_RETRIES:
-                    time.sleep(RETRY_BACKOFF * (attempt + 1))
-                    continue
-                return '未出价', 0, ""
+            if attempt < MAX_RETRIES:
+                delay = backoff_delay(attempt, RETRY_BACKOFF, RETRY_BACKOFF_MAX)
+                if time.time() + delay >= deadline:
+                    raise DetailDeferredError(f"尺码 {size} 超过总时限 {REQUEST_DEADLINE:g} 秒")
+                time.sleep(delay)
+            attempt += 1
+        log.info("尺码 pid=%s size=%s 重试后仍失败，按未出价处理", pid, size, extra={'rate_key': 'size_gave_up'})
+        return '未出价', 0, ""
 
     def _fetch_by_iter_sizes(self, product_data: dict):
         title = (product_data.get('title') or '').strip()
@@ -147,14 +267,19 @@ class DetailProcessor:
 
         if sizes:
             with concurrent.futures.ThreadPoolExecutor(max_workers=SIZE_WORKERS) as ex:
-                for s, (price_str, people_cnt, latest_time) in ex.map(_job, sizes):
-                    full_snapshot[str(s)] = {
-                        'price': price_str, 'count': int(people_cnt), 'time': latest_time
-                    }
-                    if self._size_allowed(s) and people_cnt > 0 and self._in_price_range_or_zero(price_str):
-                        filtered[str(s)] = {
+                try:
+                    for s, (price_str, people_cnt, latest_time) in ex.map(_job, sizes):
+                        full_snapshot[str(s)] = {
                             'price': price_str, 'count': int(people_cnt), 'time': latest_time
                         }
+                        if self._size_allowed(s) and people_cnt > 0 and self._in_price_range_or_zero(price_str):
+                            filtered[str(s)] = {
+                                'price': price_str, 'count': int(people_cnt), 'time': latest_time
+                            }
+                except (SessionExpiredError, DetailDeferredError):
+                    # 会话过期 / 限流放弃：取消该商品剩余尺码请求，整个商品本轮作废
+                    ex.shutdown(wait=False, cancel_futures=True)
+                    raise
 
         return {
             'hand_price': '',
@@ -167,10 +292,7 @@ class DetailProcessor:
         }
 
     def _size_sort_key(self, s):
-        try:
-            return (0, float(s))
-        except Exception:
-            return (1, s)
+        return self.rules.size_sort_key(s)
 
     def kept_sizes_in_range(self, current_price_counts):
         kept = []
@@ -181,7 +303,7 @@ class DetailProcessor:
             c = int(info.get('count', 0) or 0)
             
             # 检查尺码是否允许
-            if ALLOWED_SIZES and s not in ALLOWED_SIZES:
+            if not self._size_allowed(s):
                 continue
             
             # 检查订单数是否大于0
@@ -192,7 +314,9 @@ class DetailProcessor:
             if self._in_price_range_or_zero(price_str):
                 kept.append(s)
         return kept
-    def format_product_output(self, product_data, detail_data, product_history, product_number, change_type, group_num=1):
+    def format_product_output(self, product_data, detail_data, product_history, product_number, change_type, group_num=1,
+                              rules=None):
+        rules = rules or self.rules
         title       = (detail_data.get('title') or '').strip()
         article_num = (detail_data.get('article_num') or '').strip()
         img_url     = detail_data.get('img_url', '')
@@ -202,8 +326,8 @@ class DetailProcessor:
         old_full = product_history.get('full_size_price_counts', {}) or {}
 
         all_allowed_sizes = sorted(
-            [s for s in full_now.keys() if self._size_allowed(s)],
-            key=self._size_sort_key
+            [s for s in full_now.keys() if rules.size_allowed(s)],
+            key=rules.size_sort_key
         )
         if not all_allowed_sizes:
             return None, img_url
@@ -303,7 +427,7 @@ class DetailProcessor:
             except Exception:
                 price_line = ""
 
-        kept_list = sorted(list(cpc.keys()), key=self._size_sort_key)
+        kept_list = sorted(list(cpc.keys()), key=rules.size_sort_key)
         ks_str = "、".join(kept_list) if kept_list else ""
 
         lines = []
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+详情抓取任务的优先级队列：新增优先、近期更新优先、尺码多优先、近期已推送降权，
+并带有防饥饿保护（排队过久的任务按先来先服务出队）。
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+STARVATION_SECONDS = 60.0      # 排队超过该时长的任务优先出队，防止低优先级任务饿死
+RECENT_PUSH_WINDOW = 6 * 3600  # 该时间窗口内推送过的商品降权
+RECENCY_HALF_MINUTES = 10.0    # updateTime 越新得分越高，10分钟前的更新得分减半
+
+
+class DetailJob:
+    __slots__ = ('pid', 'product', 'change_type', 'priority', 'enqueued_at', 'seq', 'stale')
+
+    def __init__(self, pid, product, change_type, priority, enqueued_at, seq):
+        self.pid = pid
+        self.product = product
+        self.change_type = change_type
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+        self.seq = seq
+        self.stale = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _parse_update_time(value):
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+def score_detail_job(product, change_type, allowed_size_count=0, last_push_ts=None, now=None):
+    """
+    计算任务优先级（越小越先执行）
+    :return: (变化类型等级, -价值分)
+    """
+    now = time.time() if now is None else now
+    change_rank = 0 if str(change_type).startswith('🆕') else 1
+
+    recency = 0.0
+    ts = _parse_update_time(product.get('updateTime'))
+    if ts is not None:
+        age_minutes = max(0.0, now - ts) / 60.0
+        recency = 1.0 / (1.0 + age_minutes / RECENCY_HALF_MINUTES)
+
+    sizes_score = min(int(allowed_size_count or 0), 10) / 10.0
+
+    push_penalty = 0.0
+    if last_push_ts and (now - last_push_ts) < RECENT_PUSH_WINDOW:
+        push_penalty = 0.5
+
+    value = 2.0 * recency + sizes_score - push_penalty
+    return change_rank, -round(value, 6)
+
+
+class DetailJobQueue:
+    """按商品ID去重的优先级队列，重复入队时保留较高优先级和最早的入队时间"""
+
+    def __init__(self, scorer=None, starvation_seconds=STARVATION_SECONDS):
+        self.scorer = scorer or (lambda product, change_type: score_detail_job(product, change_type))
+        self.starvation_seconds = float(starvation_seconds)
+        self._heap = []
+        self._fifo = deque()
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def push(self, product, change_type, enqueued_at=None):
+        """enqueued_at：顺延/恢复的任务保留原来的入队时间（防饥饿和延迟统计按最早入队计算）"""
+        pid = product['id']
+        priority = self.scorer(product, change_type)
+        now = time.time() if enqueued_at is None else enqueued_at
+        with self._lock:
+            old = self._jobs.get(pid)
+            if old is not None:
+                old.stale = True
+                # 🆕 不会被后续的 📌 覆盖
+                if old.priority[0] < priority[0]:
+                    change_type = old.change_type
+                priority = min(priority, old.priority)
+                now = min(now, old.enqueued_at)
+            job = DetailJob(pid, product, change_type, priority, now, next(self._seq))
+            self._jobs[pid] = job
+            heapq.heappush(self._heap, job)
+            self._fifo.append(job)
+            return job
+
+    def pop(self):
+        with self._lock:
+            self._drop_stale_fifo_head()
+            if self._fifo and (time.time() - self._fifo[0].enqueued_at) >= self.starvation_seconds:
+                job = self._fifo.popleft()
+            else:
+                job = None
+                while self._heap:
+                    cand = heapq.heappop(self._heap)
+                    if not cand.stale:
+                        job = cand
+                        break
+            if job is None:
+                return None
+            job.stale = True
+            self._jobs.pop(job.pid, None)
+            return job
+
+    def _drop_stale_fifo_head(self):
+        while self._fifo and self._fifo[0].stale:
+            self._fifo.popleft()
+
+    def requeue(self, job):
+        """把已取出但未执行的任务放回队列（与期间新入队的同一商品合并）"""
+        return self.push(job.product, job.change_type, job.enqueued_at)
+
+    def oldest_enqueued(self):
+        with self._lock:
+            return min((j.enqueued_at for j in self._jobs.values()), default=None)
+
+    def pending(self):
+        with self._lock:
+            return sorted(self._jobs.values())
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, pid):
+        return pid in self._jobs
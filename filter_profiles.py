@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+筛选配置（profile）：同一份抓取到的详情数据按多套规则分别评估和推送。
+
+每个配置独立拥有：筛选规则、冷却表、群组计数器、企业微信群。
+默认配置沿用原有文件（cooldown_state.json / daily_counter.json）和 wechat_bot.py 中的群；
+其他配置写在 profiles.json 中：
+    [
+      {
+        "name": "teamB",
+        "allowed_sizes": ["40", "41", "42"],
+        "price_min": 300, "price_max": 1500,
+        "cooldown_days": 2,
+        "webhooks": {"1": ["https://..."], "2": ["https://..."], "3": ["https://..."]},
+        "delivery": {"1": "news", "3": "markdown"}
+      }
+    ]
+规则字段与 filter_rules.json 相同，省略的使用默认值；webhooks 也可以是一个列表，三个群组共用。
+delivery 为各群组的消息格式（image_text / news / markdown，见 wechat_bot.py），可以是一个字符串三个群组共用，省略时用 image_text。
+"""
+import os
+import re
+import json
+import time
+import threading
+import snapshot_store
+from rule_config import RuleConfigError, validate_config
+from rule_engine import CompiledRules
+from wechat_bot import WeChatBot, DELIVERY_CHOICES, DELIVERY_FORMATS
+from log_setup import get_logger
+
+log = get_logger('profiles')
+
+PROFILES_FILE = 'profiles.json'
+DEFAULT_PROFILE = 'default'
+GROUPS = (1, 2, 3)
+
+
+class FilterProfile:
+    def __init__(self, name, rules, cooldown_days, cooldown_file, counter_file, wechat_bot,
+                 current_date, snapshot_format='binary', persist=True):
+        self.name = name
+        self.rules = rules
+        self.cooldown_days = float(cooldown_days)
+        self.cooldown_seconds = self.cooldown_days * 86400
+        self.cooldown_file = cooldown_file
+        self.cooldown_snapshot_file = os.path.splitext(cooldown_file)[0] + '.snap'
+        self.counter_file = counter_file
+        self.wechat_bot = wechat_bot
+        self.current_date = current_date
+        self.snapshot_format = snapshot_format
+        self.persist = persist  # False：只读取本地冷却表/计数器文件，不写回（影子模式）
+        self.cooldown_map = self._load_cooldown_map()  # { "article_size": last_ts }
+        # 计数器锁，防止并发时计数器冲突
+        self.counter_lock = threading.Lock()
+        self.counters = {g: self._load_counter(g) for g in GROUPS}
+        self.claimed = set()  # 正在推送（已占用、尚未冷却）的 货号_尺码
+        # 分片模式下冷却/计数器/推送占用交给共享协调器（shard_coordinator），本地文件不再写入
+        self.coordinator = None
+        self.owner = None
+
+    def attach_coordinator(self, coordinator, owner):
+        """切换到共享协调器，并用本地已有的冷却表/当天计数器初始化协调器"""
+        coordinator.seed(self.name, self.current_date,
+                         {str(g): v for g, v in self.counters.items()}, self.cooldown_map)
+        self.coordinator = coordinator
+        self.owner = owner
+
+    @property
+    def is_default(self) -> bool:
+        return self.name == DEFAULT_PROFILE
+
+    @property
+    def tag(self) -> str:
+        """日志前缀，默认配置不加前缀保持原有输出"""
+        return '' if self.is_default else f"[{self.name}] "
+
+    def set_rules(self, rules, cooldown_days):
+        self.rules = rules
+        self.cooldown_days = float(cooldown_days)
+        self.cooldown_seconds = self.cooldown_days * 86400
+
+    def kept_map(self, full_snapshot):
+        """按本配置规则从完整快照中取出 白名单 + 人数>0 + (价在区间或=0) 的尺码"""
+        rules = self.rules
+        kept = {}
+        for s, info in (full_snapshot or {}).items():
+            if not rules.size_allowed(s):
+                continue
+            if int(info.get('count', 0) or 0) <= 0:
+                continue
+            if rules.price_ok(str(info.get('price', '未出价'))):
+                kept[s] = info
+        return kept
+
+    # ====== 冷却（按尺码） ======
+    def cool_key_size(self, article_num: str, size: str, fallback_id: str) -> str:
+        """生成冷却key：货号_尺码"""
+        base = (article_num or "").strip()
+        if base:
+            return f"{base}_{size}"
+        return f"{fallback_id}_{size}"
+
+    def cooling_sizes(self, keys):
+        """{key: 剩余冷却秒数}，只包含仍在冷却中的 key（一次查询，分片模式下只走一次协调器）"""
+        if self.coordinator is not None:
+            return self.coordinator.cooldown_remaining(self.name, list(keys), self.cooldown_seconds)
+        now = time.time()
+        out = {}
+        for key in keys:
+            ts = self.cooldown_map.get(key)
+            if isinstance(ts, (int, float)) and (now - float(ts)) < self.cooldown_seconds:
+                out[key] = self.cooldown_seconds - (now - float(ts))
+        return out
+
+    def claim_sizes(self, keys) -> bool:
+        """
+        推送前占用尺码，推送结束（mark_cooled_sizes / release_sizes）前同一货号尺码不会再次推送；
+        分片模式在协调器占用，防止其他分片同时推送；合并推送时消息在队列中等待期间也依赖这里去重
+        """
+        if self.coordinator is not None:
+            return self.coordinator.claim(self.name, list(keys), self.cooldown_seconds, self.owner)
+        with self.counter_lock:
+            if any(k in self.claimed for k in keys):
+                return False
+            self.claimed.update(keys)
+        return True
+
+    def renew_claims(self, keys):
+        """推送仍在发送队列中时续期协调器中的占用（本地占用没有有效期）"""
+        if self.coordinator is not None:
+            self.coordinator.renew(self.name, list(keys), self.owner)
+
+    def release_sizes(self, keys):
+        if self.coordinator is not None:
+            self.coordinator.release(self.name, list(keys), self.owner)
+            return
+        with self.counter_lock:
+            self.claimed.difference_update(keys)
+
+    def mark_cooled_sizes(self, keys):
+        if self.coordinator is not None:
+            self.coordinator.mark_cooled(self.name, list(keys), self.owner)
+            return
+        now = time.time()
+        for key in keys:
+            self.cooldown_map[key] = now
+        self.save_cooldown_map()
+        self.release_sizes(keys)
+
+    def _load_cooldown_map(self):
+        path = snapshot_store.newest_existing(self.cooldown_file, self.cooldown_snapshot_file)
+        if path:
+            try:
+                if path == self.cooldown_snapshot_file:
+                    return snapshot_store.read_map(path)
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                log.warning(f"读取 {os.path.basename(path)} 失败：{e}")
+                return {}
+        return {}
+
+    def save_cooldown_map(self):
+        if not self.persist:
+            return
+        if self.snapshot_format in ('binary', 'both'):
+            try:
+                snapshot_store.write_map(self.cooldown_snapshot_file, self.cooldown_map)
+            except Exception as e:
+                log.warning(f"写入 {os.path.basename(self.cooldown_snapshot_file)} 失败：{e}")
+        if self.snapshot_format in ('json', 'both'):
+            try:
+                _write_json(self.cooldown_file, self.cooldown_map)
+            except Exception as e:
+                log.warning(f"写入 {os.path.basename(self.cooldown_file)} 失败：{e}")
+
+    # ====== 群组计数器 ======
+    def _read_counter_state(self):
+        if os.path.exists(self.counter_file):
+            try:
+                with open(self.counter_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception:
+                pass
+        return {}
+
+    def _load_counter(self, group_num: int):
+        """加载或初始化群组计数器"""
+        st = self._read_counter_state()
+        group_key = f'counter_group_{group_num}'
+        if st.get('date') == self.current_date and isinstance(st.get(group_key), int) and st[group_key] >= 1:
+            return st[group_key]
+        self._save_counters({group_num: 1})
+        return 1
+
+    def _save_counters(self, values):
+        # 读出再写回，保留文件中的其他字段（默认配置与每日计数器共用一个文件）
+        if not self.persist:
+            return
+        st = self._read_counter_state()
+        st['date'] = self.current_date
+        for g, v in values.items():
+            st[f'counter_group_{g}'] = v
+        try:
+            _write_json(self.counter_file, st)
+        except Exception as e:
+            log.warning(f"写入群组计数器失败：{e}")
+
+    def take_number(self, group_num: int) -> int:
+        if self.coordinator is not None:
+            return self.coordinator.take_number(self.name, self.current_date, group_num)
+        with self.counter_lock:
+            n = self.counters[group_num]
+            self.counters[group_num] = n + 1
+            self._save_counters({group_num: n + 1})
+            return n
+
+    def return_number(self, group_num: int, n: int):
+        """
+        推送失败/跳过时回滚计数器，保持编号连续；
+        只回收最后发出的编号（之后已发出新编号时留空号，避免重复），分片模式由协调器判断
+        """
+        if self.coordinator is not None:
+            self.coordinator.return_number(self.name, self.current_date, group_num, n)
+            return
+        with self.counter_lock:
+            if self.counters[group_num] != n + 1:
+                return
+            self.counters[group_num] = n
+            self._save_counters({group_num: n})
+
+    def counter_values(self):
+        """{群组: 下一个编号}"""
+        if self.coordinator is not None:
+            return {int(g): v for g, v in self.coordinator.counters(self.name, self.current_date).items()}
+        with self.counter_lock:
+            return dict(self.counters)
+
+    def set_counter(self, group_num: int, value: int):
+        """把群组计数器设为 value（下一条推送使用该编号）"""
+        if self.coordinator is not None:
+            self.coordinator.set_counter(self.name, self.current_date, group_num, value)
+            return
+        with self.counter_lock:
+            self.counters[group_num] = value
+            self._save_counters({group_num: value})
+
+    def reset_counters(self, today):
+        with self.counter_lock:
+            self.current_date = today
+            self.counters = {g: 1 for g in GROUPS}
+            if self.coordinator is None:
+                self._save_counters(self.counters)
+            # 协调器中的计数器按日期区分，新的一天自动从1开始
+
+
+def _write_json(path, obj):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _webhooks(entry):
+    hooks = entry.get('webhooks')
+    if isinstance(hooks, list):
+        hooks = {str(g): hooks for g in GROUPS}
+    if not isinstance(hooks, dict):
+        raise RuleConfigError("webhooks 必须是列表或 {\"1\": [...], \"2\": [...], \"3\": [...]}")
+    out = {}
+    for g in GROUPS:
+        urls = hooks.get(str(g))
+        if not isinstance(urls, list) or not urls or not all(isinstance(u, str) and u.startswith('http') for u in urls):
+            raise RuleConfigError(f"webhooks 群组{g} 至少需要一个 http(s) 地址")
+        out[g] = list(urls)
+    return out
+
+
+def _delivery(entry):
+    value = entry.get('delivery', DELIVERY_FORMATS)
+    if isinstance(value, str):
+        value = {str(g): value for g in GROUPS}
+    if not isinstance(value, dict):
+        raise RuleConfigError("delivery 必须是字符串或 {\"1\": \"news\", ...}")
+    out = dict(DELIVERY_FORMATS)
+    for g, fmt in value.items():
+        if str(g) not in {str(x) for x in GROUPS} or fmt not in DELIVERY_CHOICES:
+            raise RuleConfigError(f"delivery 配置无效: {g!r}: {fmt!r}（群组为 1/2/3，格式可选 {', '.join(DELIVERY_CHOICES)}）")
+        out[int(g)] = fmt
+    return out
+
+
+def load_profiles(path, base_dir, current_date, snapshot_format='binary', persist=True):
+    """读取 profiles.json 中的附加配置；文件不存在返回空列表，格式错误时抛出 RuleConfigError"""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except ValueError as e:
+        raise RuleConfigError(f"{os.path.basename(path)} JSON 格式错误: {e}")
+    if not isinstance(entries, list):
+        raise RuleConfigError(f"{os.path.basename(path)} 顶层必须是列表")
+    profiles, names = [], {DEFAULT_PROFILE}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise RuleConfigError("每个配置必须是对象")
+        name = str(entry.get('name') or '').strip()
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', name) or name in names:
+            raise RuleConfigError(f"配置名无效或重复: {name!r}（只能包含字母、数字、_、-）")
+        names.add(name)
+        hooks = _webhooks(entry)
+        delivery = _delivery(entry)
+        cfg = validate_config({k: v for k, v in entry.items() if k not in ('name', 'webhooks', 'delivery')})
+        bot = WeChatBot()
+        bot.webhook_urls_group_1, bot.webhook_urls_group_2, bot.webhook_urls_group_3 = hooks[1], hooks[2], hooks[3]
+        bot.delivery_formats = delivery
+        profiles.append(FilterProfile(
+            name,
+            CompiledRules(cfg['excluded_brands'], cfg['allowed_sizes'], cfg['price_min'], cfg['price_max']),
+            cfg['cooldown_days'],
+            os.path.join(base_dir, f'cooldown_state_{name}.json'),
+            os.path.join(base_dir, f'daily_counter_{name}.json'),
+            bot, current_date, snapshot_format, persist,
+        ))
+    return profiles
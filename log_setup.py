@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+日志：监控主循环、详情处理、登录、推送统一通过 logging 输出，由后台线程写控制台和滚动日志文件，
+处理线程只把日志记录放进队列，不会被慢终端或磁盘 I/O 卡住。
+
+- 控制台保持原来的输出样式（只有消息本身，警告/错误加 [warn]/[error] 前缀）
+- logs/monitor.log 按大小滚动，带时间、级别和模块名
+- 重复性日志（如“冷却中”）带 extra={'rate_key': ...} 时按类别限流，每个时间窗口最多输出 RATE_LIMIT_COUNT 条，
+  省略的条数在下一条放行的日志后注明
+- 队列满时丢弃新日志并计数，腾出空间后补一条提示
+
+setup_logging() 之前（独立运行 base_login 等）日志直接同步输出到控制台。
+"""
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+ROOT_LOGGER = 'gongxie'
+LOG_DIR = 'logs'
+LOG_FILE = 'monitor.log'
+LOG_LEVEL = 'INFO'
+LOG_MAX_BYTES = 20 * 1024 * 1024
+LOG_BACKUPS = 5
+LOG_QUEUE_SIZE = 10000
+RATE_LIMIT_COUNT = 5        # 同一类别每个时间窗口最多输出的条数
+RATE_LIMIT_WINDOW = 60.0    # 秒
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def get_logger(name):
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+
+class ConsoleFormatter(logging.Formatter):
+    """与原 print 输出一致：INFO 只输出消息，WARNING 及以上加前缀（消息自带 [..] 标记时不再加）"""
+    PREFIX = {logging.WARNING: '[warn] ', logging.ERROR: '[error] ', logging.CRITICAL: '[error] '}
+
+    def format(self, record):
+        msg = super().format(record)
+        if msg.startswith('['):
+            return msg
+        return self.PREFIX.get(record.levelno, '') + msg
+
+
+class RateLimitFilter(logging.Filter):
+    """按 record.rate_key 限流；没有 rate_key 的日志不受影响"""
+
+    def __init__(self, count=RATE_LIMIT_COUNT, window=RATE_LIMIT_WINDOW):
+        super().__init__()
+        self.count = count
+        self.window = window
+        self._state = {}   # rate_key -> [窗口开始时间, 已输出条数, 已省略条数]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, 'rate_key', None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            st = self._state.get(key)
+            if st is None or now - st[0] >= self.window:
+                suppressed = st[2] if st else 0
+                self._state[key] = [now, 1, 0]
+            elif st[1] < self.count:
+                st[1] += 1
+                suppressed = 0
+            else:
+                st[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()}（此前 {self.window:g} 秒内同类日志省略 {suppressed} 条）"
+            record.args = None
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """队列满时丢弃而不是阻塞处理线程"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                notice = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+                                           f"日志队列已满，丢弃了 {self.dropped} 条日志", None, None)
+                self.queue.put_nowait(notice)
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _console_handler():
+    h = logging.StreamHandler(sys.stdout)
+    h.setFormatter(ConsoleFormatter('%(message)s'))
+    return h
+
+
+def setup_logging(base_dir='.', level=LOG_LEVEL, console=True, log_file=LOG_FILE):
+    """启动后台日志线程（重复调用只生效一次），返回 QueueListener"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+        handlers = []
+        if console:
+            handlers.append(_console_handler())
+        log_dir = os.path.join(base_dir, LOG_DIR)
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            fh = RotatingFileHandler(os.path.join(log_dir, log_file), maxBytes=LOG_MAX_BYTES,
+                                     backupCount=LOG_BACKUPS, encoding='utf-8')
+            fh.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+            handlers.append(fh)
+        except OSError as e:
+            print(f"[warn] 无法创建日志文件，只输出到控制台：{e}")
+
+        q = queue.Queue(LOG_QUEUE_SIZE)
+        qh = DroppingQueueHandler(q)
+        qh.addFilter(RateLimitFilter())
+        root = logging.getLogger(ROOT_LOGGER)
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(qh)
+        root.setLevel(level)
+        _listener = QueueListener(q, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)   # 退出前把队列中剩余的日志写完
+        return _listener
+
+
+# setup_logging() 之前的默认输出：同步写控制台，保证独立运行的模块也能看到日志
+_root = logging.getLogger(ROOT_LOGGER)
+_default_handler = _console_handler()
+_default_handler.addFilter(RateLimitFilter())
+_root.addHandler(_default_handler)
+_root.setLevel(logging.INFO)
+_root.propagate = False
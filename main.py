@@ -1,18 +1,112 @@
 import os
+import sys
+import argparse
+import subprocess
 from data_initializer import DataInitializer
-from product_monitor import ProductMonitor
+from product_monitor import ProductMonitor, SeedDataError
+from shard_coordinator import COORDINATOR_DB, connect, parse_shard
+from log_setup import LOG_FILE, LOG_LEVEL, get_logger, setup_logging
+from change_feed import FEED_BIND
 
-def main():
+log = get_logger('main')
+
+def ensure_initial_data():
     initial_data_file = 'initial_products_data.json'
-    if not os.path.exists(initial_data_file):
-        print("检测到初始数据文件不存在，开始初始化数据...")
+    initial_snapshot_file = 'initial_products_data.snap'
+    if not os.path.exists(initial_data_file) and not os.path.exists(initial_snapshot_file):
         initializer = DataInitializer()
-        initializer.initialize_all_data()
-        print("数据初始化完成！")
+        if os.path.exists(initializer.partial_file):
+            log.info("检测到未完成的初始化，从断点继续...")
+        else:
+            log.info("检测到初始数据文件不存在，开始初始化数据...")
+        if not initializer.initialize_all_data():
+            # 不完整的数据会让监控把剩余商品全部当作新增推送，断点文件保留，重新运行继续
+            log.warning("数据初始化未完成，请检查登录和网络后重新运行")
+            sys.exit(1)
+        log.info("数据初始化完成！")
     else:
-        print("检测到初始数据文件已存在，跳过初始化...")
-    print("开始监控商品变化...")
-    monitor = ProductMonitor()
+        log.info("检测到初始数据文件已存在，跳过初始化...")
+
+def feed_bind(spec, shard=None, shadow=False):
+    """变化事件流地址：未指定时使用 FEED_BIND，分片进程端口加分片序号（同机多分片不冲突），影子模式默认不开启"""
+    if spec == 'off' or (spec is None and shadow):
+        return None
+    host, _, port = (spec or FEED_BIND).rpartition(':')
+    if shard:
+        port = int(port) + shard[0]
+    return f"{host}:{port}"
+
+def run_workers(n, coordinator, log_level=LOG_LEVEL, feed=None):
+    """同机启动 n 个分片进程，共用同一个协调器"""
+    procs = []
+    for i in range(n):
+        cmd = [sys.executable, os.path.abspath(__file__), '--shard', f'{i}/{n}',
+               '--coordinator', coordinator, '--log-level', log_level]
+        if feed:
+            cmd += ['--feed', feed]   # 各分片在此端口上再加自己的序号
+        procs.append(subprocess.Popen(cmd))
+    log.info(f"已启动 {n} 个分片进程，协调器：{coordinator}")
+    try:
+        for p in procs:
+            p.wait()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+
+def main():
+    parser = argparse.ArgumentParser(description='商品监控')
+    parser.add_argument('--shard', help='分片模式：本进程负责的分片，格式 序号/总数，例如 0/4')
+    parser.add_argument('--coordinator',
+                        help=f'共享协调器：本机 SQLite 文件（如 {COORDINATOR_DB}）或 http://主机:8765（shard_coordinator.py serve，令牌取环境变量 COORDINATOR_TOKEN）')
+    parser.add_argument('--workers', type=int, help=f'在本机启动 N 个分片进程（默认协调器 {COORDINATOR_DB}）')
+    parser.add_argument('--shadow', action='store_true',
+                        help='影子模式：完整运行但不推送，冷却/计数器写入沙盒，输出吞吐和延迟统计（见 shadow_mode.py）')
+    parser.add_argument('--feed', help=f'变化事件流监听地址（默认 {FEED_BIND}，分片进程在端口上加分片序号，影子模式默认关闭；off 关闭）')
+    parser.add_argument('--profile-every', type=int, default=0, metavar='N',
+                        help='每 N 轮做一次性能采样（热点函数/内存分配，报告写入 profiles/）')
+    parser.add_argument('--profile-next', action='store_true', help='对第一轮做一次性能采样')
+    parser.add_argument('--log-level', default=LOG_LEVEL, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='日志级别（控制台和 logs/monitor.log）')
+    args = parser.parse_args()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    if args.workers:
+        if args.shard or args.shadow:
+            parser.error('--workers 不能与 --shard / --shadow 同时使用')
+        setup_logging(base_dir, level=args.log_level)
+        ensure_initial_data()
+        run_workers(args.workers, args.coordinator or COORDINATOR_DB, args.log_level, args.feed)
+        return
+
+    if args.shadow and (args.shard or args.coordinator):
+        parser.error('--shadow 使用自己的沙盒，不能与 --shard / --coordinator 同时使用')
+
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if shard[1] > 1 and not args.coordinator:
+            parser.error('分片模式需要 --coordinator，否则各分片的冷却和编号互不可见')
+    # 各分片写自己的日志文件，避免多进程同时滚动同一个文件
+    if shard:
+        log_file = f'monitor_shard{shard[0]}of{shard[1]}.log'
+    else:
+        log_file = 'monitor_shadow.log' if args.shadow else LOG_FILE
+    setup_logging(base_dir, level=args.log_level, log_file=log_file)
+
+    ensure_initial_data()
+    log.info("开始监控商品变化...")
+    try:
+        monitor = ProductMonitor(shard=shard, coordinator=connect(args.coordinator) if args.coordinator else None,
+                                 shadow=args.shadow, feed_bind=feed_bind(args.feed, shard, args.shadow))
+    except SeedDataError as e:
+        log.error(f"无法启动：{e}")
+        sys.exit(1)
+    monitor.profiler.every = max(0, args.profile_every)
+    if args.profile_next:
+        monitor.profiler.request()
     monitor.monitor_products(check_interval=5)
 
 if __name__ == '__main__':
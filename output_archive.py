@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+推送记录（products_output.txt）的缓冲写入、滚动归档和按编号查找。
+
+- 文件句柄常驻，写入先进缓冲区，超过 FLUSH_INTERVAL 秒或每轮结束时统一落盘
+- 当前文件超过 MAX_BYTES 或跨天时滚动：移入 output_archive/<段名>.txt，后台压缩为 .txt.gz
+- output_archive/index.jsonl 每条推送一行：日期 / 配置 / 群组 / NO. → 所在段、偏移、长度，
+  查找时只读取命中的那一段，不需要扫描全部归档
+
+用法：
+    python output_archive.py find 2698 [--date 2026-10-19] [--group 1] [--profile default]
+    python output_archive.py list
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import atexit
+import shutil
+import argparse
+import threading
+from datetime import datetime
+from log_setup import get_logger
+
+log = get_logger('output')
+
+OUTPUT_FILE = 'products_output.txt'
+OUTPUT_ARCHIVE_DIR = 'output_archive'
+INDEX_FILE = 'index.jsonl'
+CURRENT_FILE = 'current'          # 记录当前文件对应的段名
+MAX_BYTES = 50 * 1024 * 1024
+FLUSH_INTERVAL = 5.0
+BUFFER_SIZE = 256 * 1024
+SEPARATOR = '\n' + '=' * 80 + '\n\n'
+
+
+class OutputWriter:
+    def __init__(self, path=OUTPUT_FILE, archive_dir=None, max_bytes=MAX_BYTES, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(os.path.abspath(path)), OUTPUT_ARCHIVE_DIR)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.index_path = os.path.join(self.archive_dir, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._fh = None
+        self._index_fh = None
+        self._segment = None
+        self._segment_day = None
+        self._last_flush = time.time()
+        os.makedirs(self.archive_dir, exist_ok=True)
+        atexit.register(self.close)   # 退出前把缓冲区写完
+        threading.Thread(target=compress_pending, args=(self.archive_dir,), name='output-compress', daemon=True).start()
+
+    # ===== 段管理 =====
+    def _current_marker(self):
+        return os.path.join(self.archive_dir, CURRENT_FILE)
+
+    def _open(self):
+        segment = None
+        if os.path.exists(self.path):
+            try:
+                with open(self._current_marker(), 'r', encoding='utf-8') as f:
+                    segment = f.read().strip() or None
+            except OSError:
+                pass
+            if segment is None:
+                # 旧版本留下的文件：按修改时间命名成一个段（其中的记录没有索引）
+                segment = self._new_segment(datetime.fromtimestamp(os.path.getmtime(self.path)))
+                self._write_marker(segment)
+        else:
+            segment = self._new_segment(datetime.now())
+            self._write_marker(segment)
+        self._segment = segment
+        self._segment_day = _segment_day(segment)
+        self._fh = open(self.path, 'ab', buffering=BUFFER_SIZE)
+        if self._index_fh is None:
+            self._index_fh = open(self.index_path, 'a', encoding='utf-8', buffering=64 * 1024)
+
+    def _new_segment(self, when):
+        base = f"products_output-{when.strftime('%Y%m%d-%H%M%S')}"
+        segment, n = base, 0
+        while any(os.path.exists(os.path.join(self.archive_dir, segment + ext)) for ext in ('.txt', '.txt.gz')):
+            n += 1
+            segment = f"{base}-{n}"
+        return segment
+
+    def _write_marker(self, segment):
+        tmp = self._current_marker() + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(segment)
+        os.replace(tmp, self._current_marker())
+
+    def _rotate(self):
+        """当前文件移入归档目录，后台压缩"""
+        self._flush_locked()
+        self._fh.close()
+        self._fh = None
+        archived = os.path.join(self.archive_dir, self._segment + '.txt')
+        os.replace(self.path, archived)
+        os.remove(self._current_marker())
+        threading.Thread(target=_compress, args=(archived,), name='output-compress', daemon=True).start()
+        self._open()
+
+    # ===== 写入 =====
+    def write(self, content, no=None, group=None, profile=None, date=None):
+        data = content.encode('utf-8')
+        with self._lock:
+            if self._fh is None:
+                self._open()
+            today = datetime.now().strftime('%Y%m%d')
+            if self._fh.tell() > 0 and (self._fh.tell() + len(data) > self.max_bytes or self._segment_day != today):
+                self._rotate()
+            offset = self._fh.tell()
+            self._fh.write(data + SEPARATOR.encode('utf-8'))
+            if no is not None:
+                entry = {'date': date or datetime.now().strftime('%Y-%m-%d'), 'profile': profile,
+                         'group': group, 'no': no, 'seg': self._segment, 'off': offset, 'len': len(data)}
+                self._index_fh.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            if time.time() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._fh is not None:
+            self._fh.flush()
+        if self._index_fh is not None:
+            self._index_fh.flush()
+        self._last_flush = time.time()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            for fh in (self._fh, self._index_fh):
+                if fh is not None:
+                    fh.close()
+            self._fh = self._index_fh = None
+
+
+def _segment_day(segment):
+    try:
+        return segment.split('-')[1]
+    except IndexError:
+        return None
+
+
+_compress_lock = threading.Lock()
+
+
+def _compress(path):
+    with _compress_lock:
+        if os.path.exists(path):
+            _compress_file(path)
+
+
+def _compress_file(path):
+    try:
+        with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(path + '.gz.tmp', path + '.gz')
+        os.remove(path)
+    except OSError as e:
+        log.warning(f"压缩 {os.path.basename(path)} 失败：{e}")
+
+
+def compress_pending(archive_dir):
+    """压缩上次退出前没来得及压缩的归档段"""
+    for name in os.listdir(archive_dir):
+        if name.endswith('.txt'):
+            _compress(os.path.join(archive_dir, name))
+
+
+# ===== 查找 =====
+def iter_index(archive_dir):
+    path = os.path.join(archive_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # 崩溃时写了一半的行
+
+
+def read_entry(entry, output_path, archive_dir):
+    """按索引读出一条推送内容；当前文件、未压缩和已压缩的归档段都支持"""
+    seg, off, length = entry['seg'], entry['off'], entry['len']
+    marker = os.path.join(archive_dir, CURRENT_FILE)
+    current = None
+    if os.path.exists(marker):
+        with open(marker, 'r', encoding='utf-8') as f:
+            current = f.read().strip()
+    candidates = []
+    if seg == current:
+        candidates.append((output_path, open))
+    candidates.append((os.path.join(archive_dir, seg + '.txt'), open))
+    candidates.append((os.path.join(archive_dir, seg + '.txt.gz'), gzip.open))
+    for path, opener in candidates:
+        if os.path.exists(path):
+            with opener(path, 'rb') as f:
+                f.seek(off)   # gzip 只解压这一段中偏移之前的部分
+                return f.read(length).decode('utf-8', 'replace')
+    return None
+
+
+def find(no, date=None, group=None, profile=None, archive_dir=OUTPUT_ARCHIVE_DIR):
+    hits = []
+    for e in iter_index(archive_dir):
+        if e.get('no') != no:
+            continue
+        if date and e.get('date') != date:
+            continue
+        if group and e.get('group') != group:
+            continue
+        if profile and (e.get('profile') or 'default') != profile:
+            continue
+        hits.append(e)
+    return hits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='按 NO. 查找推送记录')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_find = sub.add_parser('find', help='按编号查找')
+    p_find.add_argument('no', type=int)
+    p_find.add_argument('--date', help='日期 YYYY-MM-DD（默认所有日期）')
+    p_find.add_argument('--group', type=int, choices=[1, 2, 3])
+    p_find.add_argument('--profile', help='筛选配置名（默认所有配置）')
+    p_find.add_argument('--output', default=OUTPUT_FILE)
+    p_find.add_argument('--archive', default=OUTPUT_ARCHIVE_DIR)
+    p_list = sub.add_parser('list', help='列出归档段')
+    p_list.add_argument('--archive', default=OUTPUT_ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'list':
+        if not os.path.isdir(args.archive):
+            print(f"✗ 没有找到 {args.archive}")
+            return 1
+        for name in sorted(os.listdir(args.archive)):
+            if name.endswith(('.txt', '.gz')):
+                print(f"  {name}  {os.path.getsize(os.path.join(args.archive, name)) / 1024:.0f} KB")
+        return 0
+
+    hits = find(args.no, args.date, args.group, args.profile, args.archive)
+    if not hits:
+        print(f"✗ 没有找到 NO.{args.no}")
+        return 1
+    for e in hits:
+        print(f"===== {e['date']} {e.get('profile') or 'default'} 群组{e['group']} NO.{e['no']}（{e['seg']} @ {e['off']}）")
+        text = read_entry(e, args.output, args.archive)
+        print(text if text is not None else '（所在的归档段已不存在）')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
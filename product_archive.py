@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+下架商品归档：长期不在列表中出现的商品从 products_data 移出，压缩后追加到归档文件，
+重新上架时按商品ID取回。
+
+文件布局（目录 product_archive/）：
+    archive.dat   记录数据，每条 = zlib(marshal(商品dict))，只追加
+    index.snap    {商品ID: (偏移, 长度, 归档时间)}（snapshot_store 映射格式）
+取回的记录从索引删除；失效数据超过一半时整体压缩重写。
+
+用法：
+    python product_archive.py info
+    python product_archive.py get 商品ID
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import marshal
+import threading
+import snapshot_store
+from compact_record import ProductRecord, json_default
+from log_setup import get_logger
+
+log = get_logger('archive')
+
+ARCHIVE_DIR = 'product_archive'
+MARSHAL_VERSION = 4
+COMPRESS_LEVEL = 6
+
+
+class ProductArchive:
+    def __init__(self, base_dir=ARCHIVE_DIR):
+        self.base_dir = base_dir
+        self.data_file = os.path.join(base_dir, 'archive.dat')
+        self.index_file = os.path.join(base_dir, 'index.snap')
+        self._lock = threading.Lock()
+        self._index = {}
+        if os.path.exists(self.index_file):
+            try:
+                self._index = snapshot_store.read_map(self.index_file)
+            except Exception as e:
+                log.warning(f"读取归档索引失败：{e}")
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, pid):
+        return pid in self._index
+
+    def _live_bytes(self):
+        return sum(length for _, length, _ in self._index.values())
+
+    def evict(self, products):
+        """归档一批商品（ProductRecord 或 dict），返回归档数量"""
+        if not products:
+            return 0
+        os.makedirs(self.base_dir, exist_ok=True)
+        now = time.time()
+        with self._lock:
+            with open(self.data_file, 'ab') as f:
+                for p in products:
+                    d = p.to_dict() if isinstance(p, ProductRecord) else dict(p)
+                    blob = zlib.compress(marshal.dumps(d, MARSHAL_VERSION), COMPRESS_LEVEL)
+                    offset = f.tell()
+                    f.write(blob)
+                    self._index[d.get('id')] = (offset, len(blob), now)
+                f.flush()
+                os.fsync(f.fileno())
+            snapshot_store.write_map(self.index_file, self._index)
+        return len(products)
+
+    def _read(self, offset, length):
+        with open(self.data_file, 'rb') as f:
+            f.seek(offset)
+            return marshal.loads(zlib.decompress(f.read(length)))
+
+    def get(self, pid):
+        """只读取，不从归档中移除"""
+        with self._lock:
+            entry = self._index.get(pid)
+            if entry is None:
+                return None
+            return self._read(entry[0], entry[1])
+
+    def restore(self, pid):
+        """取回并从索引中移除；不存在返回 None"""
+        with self._lock:
+            entry = self._index.pop(pid, None)
+            if entry is None:
+                return None
+            product = self._read(entry[0], entry[1])
+            snapshot_store.write_map(self.index_file, self._index)
+            if os.path.getsize(self.data_file) > 2 * self._live_bytes() + 1048576:
+                self._compact()
+            return product
+
+    def _compact(self):
+        tmp = self.data_file + '.tmp'
+        new_index = {}
+        with open(self.data_file, 'rb') as src, open(tmp, 'wb') as out:
+            for pid, (offset, length, ts) in self._index.items():
+                src.seek(offset)
+                new_index[pid] = (out.tell(), length, ts)
+                out.write(src.read(length))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, self.data_file)
+        self._index = new_index
+        snapshot_store.write_map(self.index_file, self._index)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('info', 'get'):
+        print(__doc__)
+        sys.exit(1)
+    # 与监控进程一致，默认读取模块所在目录下的归档，不依赖当前工作目录
+    archive = ProductArchive(os.path.join(os.path.dirname(os.path.abspath(__file__)), ARCHIVE_DIR))
+    if sys.argv[1] == 'info':
+        size = os.path.getsize(archive.data_file) if os.path.exists(archive.data_file) else 0
+        print(f"归档商品 {len(archive)} 个，数据文件 {size / 1048576:.1f} MB")
+    else:
+        if len(sys.argv) < 3:
+            print(__doc__)
+            sys.exit(1)
+        pid = int(sys.argv[2]) if sys.argv[2].isdigit() else sys.argv[2]
+        product = archive.get(pid)
+        if product is None:
+            print(f"未找到商品 {pid}")
+            sys.exit(1)
+        print(json.dumps(product, ensure_ascii=False, indent=2, default=json_default))
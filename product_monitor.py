@@ -4,23 +4,83 @@ import time
 import json
 import requests
 import concurrent.futures
+import functools
 import threading
 from datetime import datetime
 from base_login import BaseLogin
-from detail_processor import DetailProcessor
+from detail_processor import DetailProcessor, DetailDeferredError
+from session_guard import SessionExpiredError
+from session_manager import SessionManager
+from session_pool import SessionPool
+from detail_scheduler import DetailJobQueue, score_detail_job
 from wechat_bot import WeChatBot
+from compact_record import ProductRecord, json_default
+import snapshot_store
+from size_history import SizeHistoryStore, HISTORY_DIR
+from product_archive import ProductArchive, ARCHIVE_DIR
+from rule_config import RuleConfigWatcher, RULES_FILE
+from filter_profiles import FilterProfile, DEFAULT_PROFILE, PROFILES_FILE, load_profiles
+from shard_coordinator import CLAIM_RENEW_INTERVAL, shard_of, worker_id
+from log_setup import get_logger, setup_logging
+from output_archive import OutputWriter, OUTPUT_ARCHIVE_DIR
+from shadow_mode import SHADOW_SUFFIX, ShadowBot, ShadowReport, open_sandbox
+from control_socket import ControlServer
+from change_feed import ChangeFeed, size_changes
+from cycle_profiler import CycleProfiler, PROFILE_DIR
+
+log = get_logger('monitor')
 
 COOLDOWN_DAYS = 3.5
 COOLDOWN_FILE = 'cooldown_state.json'
+COMPACT_RECORDS = True  # 内存中使用紧凑商品记录（compact_record.ProductRecord）
+# 商品快照/冷却表的落盘格式：'binary'（snapshot_store 二进制）| 'json' | 'both'
+# 启动时读取 JSON 与二进制中较新的一个，因此重新初始化生成的 JSON 仍会生效
+SNAPSHOT_FORMAT = 'binary'
+SESSION_FILE = 'session_state.json'
+ACCOUNTS_FILE = 'accounts.json'
+# 下架商品归档：连续多次完整轮询都没出现、且超过一定时间未见的商品移入 product_archive/
+EVICT_AFTER_SECONDS = 7 * 86400
+EVICT_MIN_MISSED_SWEEPS = 3
+# 推送进入按群组的发送队列（wechat_bot.DIGEST_THRESHOLD 条以上积压时合并成一条 markdown），
+# 默认 False：与原来一样逐条同步发送，推送结束后才处理下一个商品
+PUSH_DIGEST = False
+# 每轮时限（秒，从本轮开始计）：到时不再开始新的详情任务，未执行的任务顺延到下一轮，与下一轮的变化按商品ID合并；
+# 积压写入 detail_backlog.json，重启后继续处理。0 为不限制
+CYCLE_BUDGET = 60
+BACKLOG_FILE = 'detail_backlog.json'
+
+class SeedDataError(RuntimeError):
+    """分片/影子模式首次启动时没有可用的共享初始数据（此时启动会把全部商品当作新增推送）"""
+
 
 class ProductMonitor(BaseLogin):
-    def __init__(self):
+    def __init__(self, shard=None, coordinator=None, shadow=False, feed_bind=None):
+        """
+        shard: (序号, 总数)，分片模式下只负责 crc32(商品ID) % 总数 == 序号 的商品；
+        coordinator: shard_coordinator.connect() 返回的协调器，冷却/计数器/推送占用由各分片共享；
+        shadow: 影子模式（见 shadow_mode.py），不推送，冷却/计数器写入沙盒；
+        feed_bind: 变化事件流的监听地址（见 change_feed.py），None 时只保留在内存缓冲区
+        """
         super().__init__()
         self.BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-        self.initial_data_file = os.path.join(self.BASE_DIR, 'initial_products_data.json')
-        self.output_file = os.path.join(self.BASE_DIR, 'products_output.txt')
+        setup_logging(self.BASE_DIR)
+        self.shard = shard
+        self.shadow = shadow
+        # 分片各自保存商品快照/尺码历史/归档，避免同机多个进程互相覆盖；首次启动从共享的初始数据中取本分片部分
+        # 影子模式同样使用单独的文件，不改动正式进程的数据
+        suffix = f'_shard{shard[0]}of{shard[1]}' if shard else ''
+        if shadow:
+            suffix += SHADOW_SUFFIX
+        self.seed_data_file = os.path.join(self.BASE_DIR, 'initial_products_data.json')
+        self.seed_snapshot_file = os.path.splitext(self.seed_data_file)[0] + '.snap'
+        self.initial_data_file = os.path.join(self.BASE_DIR, f'initial_products_data{suffix}.json')
+        # 推送记录：常驻缓冲写入，按大小/日期滚动压缩，NO. 索引见 output_archive.py
+        self.output_file = os.path.join(self.BASE_DIR, f'products_output{suffix}.txt')
+        self.output_writer = OutputWriter(self.output_file, os.path.join(self.BASE_DIR, OUTPUT_ARCHIVE_DIR + suffix))
         self.counter_state_file = os.path.join(self.BASE_DIR, 'daily_counter.json')
         self.cooldown_file = os.path.join(self.BASE_DIR, COOLDOWN_FILE)
+        self.initial_snapshot_file = os.path.splitext(self.initial_data_file)[0] + '.snap'
+        self.backlog_file = os.path.join(self.BASE_DIR, BACKLOG_FILE.replace('.json', f'{suffix}.json'))
 
         self.detail_processor = DetailProcessor()
         self.wechat_bot = WeChatBot()
@@ -30,36 +90,108 @@ class ProductMonitor(BaseLogin):
         self.product_counter = self._load_or_init_daily_counter()
 
         self.max_workers = 8
-
-        self.cooldown_days = float(COOLDOWN_DAYS)  # 使用浮点数保持3.5天
-        self.cooldown_seconds = self.cooldown_days * 86400
-        self.cooldown_map = self._load_cooldown_map()  # { "article_size": last_ts }
-        
-        # 为每个群维护独立的计数器
-        self.counter_group_1 = self._load_or_init_group_counter(1)  # ≤2
-        self.counter_group_2 = self._load_or_init_group_counter(2)  # 3≤5
-        self.counter_group_3 = self._load_or_init_group_counter(3)  # ≥6
+        self.check_interval = 1
+        self.cycles = 0
+        self.last_cycle_seconds = None
+        self.cycle_budget = CYCLE_BUDGET
+        self.carried_over = 0       # 上一轮到时顺延的详情任务数
+        self.deadline_hits = 0      # 累计到时的轮数
+        # 控制通道（control_socket.py）：运行中查看状态、调整参数和计数器，修改在每轮开始前生效
+        self.control = ControlServer(self, os.path.join(self.BASE_DIR, f'monitor{suffix}.sock'))
+        # 变化事件流：尺码变化和推送决定实时发布给其他工具（SSE）
+        self.feed = ChangeFeed()
+        self.feed_bind = feed_bind
+        # 按轮次的性能采样（默认关闭；profiler.every = N 每 N 轮一次，profiler.request() 下一轮一次）
+        self.profiler = CycleProfiler(os.path.join(self.BASE_DIR, PROFILE_DIR + suffix))
+        # 详情任务优先级队列（新增/近期更新/尺码多优先，带防饥饿）
+        self.last_push_ts = {}  # { product_id: 最近一次推送成功时间 }
+        self.detail_queue = DetailJobQueue(scorer=self._detail_job_priority)
+        self._backlog_saved = self._load_detail_backlog()
+        # 下架商品归档；missed_sweeps 记录商品连续缺席的完整轮询次数（只保存缺席的商品）
+        self.archive = ProductArchive(os.path.join(self.BASE_DIR, ARCHIVE_DIR + suffix))
+        self.missed_sweeps = {}
+        # 尺码变化时间序列（只追加，每轮详情处理结束后批量落盘）
+        self.size_history = SizeHistoryStore(os.path.join(self.BASE_DIR, HISTORY_DIR + suffix))
+
+        # 筛选配置：默认配置使用原有的冷却表/计数器/群（冷却天数使用浮点数保持3.5天），
+        # profiles.json 中的附加配置共用同一份抓取结果，只增加本地评估
+        self.default_profile = FilterProfile(
+            DEFAULT_PROFILE, self.detail_processor.rules, float(COOLDOWN_DAYS),
+            self.cooldown_file, self.counter_state_file, self.wechat_bot,
+            self.current_date, SNAPSHOT_FORMAT, persist=not shadow,
+        )
+        try:
+            extra_profiles = load_profiles(os.path.join(self.BASE_DIR, PROFILES_FILE), self.BASE_DIR,
+                                           self.current_date, SNAPSHOT_FORMAT, persist=not shadow)
+        except Exception as e:
+            log.warning(f"读取 {PROFILES_FILE} 失败，只使用默认配置：{e}")
+            extra_profiles = []
+        self.profiles = [self.default_profile] + extra_profiles
+        self.detail_processor.extra_rules = tuple(p.rules for p in extra_profiles)
+        self.shadow_report = None
+        if shadow:
+            coordinator = open_sandbox(self.BASE_DIR)
+            self.shadow_report = ShadowReport(self.BASE_DIR)
+            self.wechat_bot = ShadowBot(self.wechat_bot.delivery_formats)
+            for profile in self.profiles:
+                profile.wechat_bot = ShadowBot(profile.wechat_bot.delivery_formats)
+            log.info("影子模式：不推送，冷却/推送占用/计数器写入沙盒 shadow/sandbox.db")
+        if coordinator is not None:
+            owner = worker_id()
+            for profile in self.profiles:
+                profile.attach_coordinator(coordinator, owner)
+        if shard:
+            log.info(f"分片模式：本进程负责分片 {shard[0]}/{shard[1]}，已有商品 {len(self.products_data)} 个")
+        if extra_profiles:
+            log.info(f"已加载筛选配置：{', '.join(p.name for p in self.profiles)}")
+        # 筛选规则配置文件（存在时覆盖默认规则，修改后下一轮生效）
+        self.rule_watcher = RuleConfigWatcher(os.path.join(self.BASE_DIR, RULES_FILE))
+        if self.rule_watcher.check_now():
+            self.apply_pending_rules()
         
         # 推送锁，防止并发重复推送
         self.push_lock = threading.Lock()
         # 正在推送的商品集合，防止重复推送
         self.pushing_products = set()
-        # 计数器锁，防止并发时计数器冲突
-        self.counter_lock = threading.Lock()
+        # 合并推送：已提交、尚未处理结果的推送 { Future: 结束回调 } 与等待推送结果的商品
+        self.push_finishers = {}
+        self.pending_details = []
+        self._claims_renewed_at = time.time()
+        self._job_enqueued_at = None  # 当前处理的详情任务入队时间（影子模式统计入队→推送延迟）
+        for profile in self.profiles:
+            profile.wechat_bot.digest = PUSH_DIGEST
         
         # 连续失败计数器，用于检测登录过期
         self.consecutive_failures = 0
         self.max_failures_before_relogin = 3  # 连续失败3次后重新登录
         # 上次登录时间
         self.last_login_time = None
-        # 登录有效期（秒），设为1小时，超过则主动刷新
+        # 登录有效期（秒），设为1小时，由后台会话管理线程提前续期
         self.login_refresh_interval = 3600
+        # 分片进程各自登录、各自保存会话（同一账号 N 个分片即 N 次验证码登录/小时；网站只允许单会话时会互相挤下线，
+        # 此时为每个分片配置 accounts_shard<序号>of<总数>.json 使用不同账号）；
+        # 影子模式只读跟随正式进程的 session_state.json，自己不登录，不会把正式进程挤下线
+        self.session_manager = SessionManager(self, self.detail_processor, on_swap=self._on_session_swap,
+                                              refresh_interval=self.login_refresh_interval,
+                                              state_file=os.path.join(self.BASE_DIR, SESSION_FILE.replace('.json', f'{suffix}.json')),
+                                              follow_file=os.path.join(self.BASE_DIR, SESSION_FILE) if shadow else None)
+        self.detail_processor.set_relogin_handler(self._relogin_for_detail)
+        # 多账号会话池（存在 accounts.json 时启用，分片进程优先使用自己的 accounts_shard<序号>of<总数>.json），
+        # 详情请求在各账号间分摊
+        accounts_file = os.path.join(self.BASE_DIR, ACCOUNTS_FILE)
+        if shard:
+            shard_accounts = accounts_file.replace('.json', f'_shard{shard[0]}of{shard[1]}.json')
+            if os.path.exists(shard_accounts):
+                accounts_file = shard_accounts
+        self.session_pool = SessionPool.from_config(accounts_file, suffix, follow=shadow)
+        if self.session_pool:
+            self.detail_processor.set_session_pool(self.session_pool)
 
     # ====== 简易 I/O ======
     def _fast_write_json(self, path: str, obj):
         path = os.path.abspath(path)
         with open(path, 'w', encoding='utf-8') as f:
-            json.dump(obj, f, ensure_ascii=False, indent=2)
+            json.dump(obj, f, ensure_ascii=False, indent=2, default=json_default)
             f.flush()
             os.fsync(f.fileno())
 
@@ -79,6 +211,8 @@ class ProductMonitor(BaseLogin):
     def _save_daily_counter(self, value=None):
         if value is not None:
             self.product_counter = value
+        if self.shadow:
+            return
         # 保留现有的群组计数器数据，避免覆盖
         if os.path.exists(self.counter_state_file):
             try:
@@ -93,115 +227,102 @@ class ProductMonitor(BaseLogin):
         try:
             self._fast_write_json(self.counter_state_file, state)
         except Exception as e:
-            print(f"[warn] 写入 {os.path.basename(self.counter_state_file)} 失败：{e}")
-
-    def _load_or_init_group_counter(self, group_num: int):
-        """加载或初始化群组计数器"""
-        today = self.current_date
-        if os.path.exists(self.counter_state_file):
-            try:
-                with open(self.counter_state_file, 'r', encoding='utf-8') as f:
-                    st = json.load(f)
-                group_key = f'counter_group_{group_num}'
-                if st.get('date') == today and isinstance(st.get(group_key), int) and st[group_key] >= 1:
-                    return st[group_key]
-            except Exception:
-                pass
-        self._save_group_counter(group_num, 1)
-        return 1
-
-    def _save_group_counter(self, group_num: int, value: int):
-        """保存群组计数器"""
-        today = self.current_date
-        if os.path.exists(self.counter_state_file):
-            try:
-                with open(self.counter_state_file, 'r', encoding='utf-8') as f:
-                    st = json.load(f)
-            except Exception:
-                st = {'date': today}
-        else:
-            st = {'date': today}
-        
-        st['date'] = today
-        st[f'counter_group_{group_num}'] = value
-        
-        try:
-            self._fast_write_json(self.counter_state_file, st)
-        except Exception as e:
-            print(f"[warn] 写入群组计数器失败：{e}")
+            log.warning(f"写入 {os.path.basename(self.counter_state_file)} 失败：{e}")
 
     def _rollover_if_new_day(self):
         today = datetime.now().strftime('%Y-%m-%d')
         if today != self.current_date:
-            print(f"[日期切换] {self.current_date} → {today}，重置所有计数器")
+            log.info(f"[日期切换] {self.current_date} → {today}，重置所有计数器")
             self.current_date = today
-            # 重置所有计数器为1
-            self.product_counter = 1
-            self.counter_group_1 = 1
-            self.counter_group_2 = 1
-            self.counter_group_3 = 1
-            # 保存到文件
-            state = {
-                'date': today,
-                'counter': 1,
-                'counter_group_1': 1,
-                'counter_group_2': 1,
-                'counter_group_3': 1
-            }
-            try:
-                self._fast_write_json(self.counter_state_file, state)
-            except Exception as e:
-                print(f"[warn] 重置计数器失败：{e}")
+            # 重置所有计数器为1（每个筛选配置的群组计数器各自重置）
+            self._save_daily_counter(1)
+            for profile in self.profiles:
+                profile.reset_counters(today)
 
     # ====== 业务 I/O ======
     def load_initial_data(self):
-        if os.path.exists(self.initial_data_file):
+        path = snapshot_store.newest_existing(self.initial_data_file, self.initial_snapshot_file)
+        seeding = not path and (self.shard or self.shadow)
+        if seeding:
+            # 首次启动从正式进程的数据中取：二进制格式下只有 .snap 持续更新，取两者中较新的一个
+            path = snapshot_store.newest_existing(self.seed_data_file, self.seed_snapshot_file)
+            if not path:
+                raise SeedDataError(f"没有共享初始数据（{os.path.basename(self.seed_data_file)} / "
+                                    f"{os.path.basename(self.seed_snapshot_file)}），请先运行一次初始化")
+        if path:
             try:
-                with open(self.initial_data_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                if path.endswith('.snap'):
+                    data = snapshot_store.load_products(path, compact=COMPACT_RECORDS)
+                else:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data = [self._as_record(p) for p in json.load(f)]
+                return self.own_products(data)
             except Exception as e:
-                print(f"[warn] 读取 {os.path.basename(self.initial_data_file)} 失败：{e}")
+                if seeding:
+                    raise SeedDataError(f"读取共享初始数据 {os.path.basename(path)} 失败：{e}")
+                log.warning(f"读取 {os.path.basename(path)} 失败：{e}")
                 return []
         return []
 
+    def own_products(self, products):
+        """分片模式下只保留本分片负责的商品"""
+        if not self.shard:
+            return products
+        index, total = self.shard
+        return [p for p in products if shard_of(p['id'], total) == index]
+
+    def _as_record(self, product):
+        return ProductRecord.from_dict(product) if COMPACT_RECORDS else product
+
     def save_initial_data(self):
+        if SNAPSHOT_FORMAT in ('binary', 'both'):
+            try:
+                snapshot_store.write_products(self.initial_snapshot_file, self.products_data)
+            except Exception as e:
+                log.warning(f"写入 {os.path.basename(self.initial_snapshot_file)} 失败：{e}")
+        if SNAPSHOT_FORMAT in ('json', 'both'):
+            try:
+                self._fast_write_json(self.initial_data_file, self.products_data)
+            except Exception as e:
+                log.warning(f"写入 {os.path.basename(self.initial_data_file)} 失败：{e}")
+
+    def _load_detail_backlog(self):
+        """恢复上次退出时未处理的详情任务；返回恢复的任务数"""
+        if not os.path.exists(self.backlog_file):
+            return 0
         try:
-            self._fast_write_json(self.initial_data_file, self.products_data)
+            with open(self.backlog_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            for e in entries:
+                if self.own_products([e['product']]):
+                    self.detail_queue.push(e['product'], e['change_type'], e.get('enqueued_at'))
         except Exception as e:
-            print(f"[warn] 写入 {os.path.basename(self.initial_data_file)} 失败：{e}")
-
-    def write_to_output_file(self, content):
+            log.warning(f"读取 {os.path.basename(self.backlog_file)} 失败：{e}")
+            return 0
+        if self.detail_queue:
+            log.info(f"恢复上次未处理的详情任务 {len(self.detail_queue)} 个")
+        return len(self.detail_queue)
+
+    def save_detail_backlog(self):
+        """积压的详情任务落盘（队列为空且上次已写空时跳过）"""
+        jobs = self.detail_queue.pending()
+        if not jobs and not self._backlog_saved:
+            return
         try:
-            with open(self.output_file, 'a', encoding='utf-8') as f:
-                f.write(content + '\n' + '=' * 80 + '\n\n')
+            self._fast_write_json(self.backlog_file, [
+                {'product': j.product, 'change_type': j.change_type, 'enqueued_at': j.enqueued_at}
+                for j in jobs])
+            self._backlog_saved = len(jobs)
         except Exception as e:
-            print(f"[warn] 写入 {os.path.basename(self.output_file)} 失败：{e}")
-
-    # ====== 冷却（按尺码） ======
-    def _cool_key_size(self, article_num: str, size: str, fallback_id: str) -> str:
-        """生成冷却key：货号_尺码"""
-        base = (article_num or "").strip()
-        if base:
-            return f"{base}_{size}"
-        return f"{fallback_id}_{size}"
-
-    def _is_cooled_size(self, key: str) -> bool:
-        ts = self.cooldown_map.get(key)
-        if not isinstance(ts, (int, float)):
-            return False
-        return (time.time() - float(ts)) < self.cooldown_seconds
-
-    def _mark_cooled_size(self, key: str):
-        self.cooldown_map[key] = time.time()
-        self._save_cooldown_map()
+            log.warning(f"写入 {os.path.basename(self.backlog_file)} 失败：{e}")
 
-    def _cooldown_remaining_seconds(self, key: str) -> int:
-        ts = self.cooldown_map.get(key)
-        if not isinstance(ts, (int, float)):
-            return 0
-        elapsed = time.time() - float(ts)
-        rem = int(self.cooldown_seconds - elapsed)
-        return rem if rem > 0 else 0
+    def write_to_output_file(self, content, no=None, group_num=None, profile=None):
+        try:
+            self.output_writer.write(content, no=no, group=group_num,
+                                     profile=profile.name if profile else None,
+                                     date=profile.current_date if profile else self.current_date)
+        except Exception as e:
+            log.warning(f"写入 {os.path.basename(self.output_file)} 失败：{e}")
 
     def _fmt_hms(self, seconds: int) -> str:
         h = seconds // 3600
@@ -209,42 +330,41 @@ class ProductMonitor(BaseLogin):
         s = seconds % 60
         return f"{h:02d}:{m:02d}:{s:02d}"
 
-    def _load_cooldown_map(self):
-        if os.path.exists(self.cooldown_file):
-            try:
-                with open(self.cooldown_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"[warn] 读取 {os.path.basename(self.cooldown_file)} 失败：{e}")
-                return {}
-        return {}
-
-    def _save_cooldown_map(self):
-        try:
-            self._fast_write_json(self.cooldown_file, self.cooldown_map)
-        except Exception as e:
-            print(f"[warn] 写入 {os.path.basename(self.cooldown_file)} 失败：{e}")
-
     # ===== 登录刷新 =====
-    def _should_refresh_login(self):
-        """检查是否需要刷新登录（超过1小时或连续失败多次）"""
-        if self.last_login_time is None:
+    def apply_pending_rules(self) -> bool:
+        """在两轮之间替换规则：DetailProcessor 的编译规则和冷却时长各自整体替换"""
+        loaded = self.rule_watcher.take_pending()
+        if loaded is None:
             return False
-        elapsed = time.time() - self.last_login_time
-        return elapsed > self.login_refresh_interval
-    
+        cfg, rules = loaded
+        self.detail_processor.rules = rules
+        self.default_profile.set_rules(rules, cfg['cooldown_days'])
+        log.info(f"✓ 已加载规则配置：排除品牌 {len(cfg['excluded_brands'])} 个，允许尺码 {len(cfg['allowed_sizes'])} 个，"
+              f"价格 {cfg['price_min']:g}-{cfg['price_max']:g}，冷却 {self.default_profile.cooldown_days:g} 天")
+        return True
+
+    def _on_session_swap(self, jsessionid):
+        """会话管理线程换入新会话后回调"""
+        self.consecutive_failures = 0
+        self.last_login_time = time.time()
+
     def _try_relogin(self):
-        """尝试重新登录"""
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🔄 正在尝试重新登录...")
-        if self.login_with_captcha(self.detail_processor):
-            self.consecutive_failures = 0
-            self.last_login_time = time.time()
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✓ 重新登录成功")
+        """请求会话管理线程立即续期并等待结果（多个调用方并发时只登录一次）"""
+        log.info(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🔄 正在尝试重新登录...")
+        if self.session_manager.request_refresh(wait=True):
+            log.info(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✓ 重新登录成功")
             return True
         else:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✗ 重新登录失败")
+            log.warning(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✗ 重新登录失败")
             return False
 
+    def _relogin_for_detail(self):
+        """详情页检测到会话过期时由熔断器调用；若此前已换过新会话则直接复用"""
+        generation = self.detail_processor.breaker.generation
+        if self.session_manager.request_refresh(wait=True):
+            return True
+        return self.detail_processor.breaker.generation != generation
+
     # ===== 列表 =====
     def fetch_page(self, page_num, page_size=500):
         data = {'pageSize': str(page_size), 'pageNum': str(page_num),
@@ -253,250 +373,543 @@ class ProductMonitor(BaseLogin):
             r = requests.post('https://www.gxkj123456.com/tgc/gxPc/seek/list',
                               cookies=self.cookies, headers=self.headers, data=data, timeout=10)
             if r.status_code != 200:
-                print(f"[debug] fetch_page 状态码异常: {r.status_code}")
+                log.warning(f"fetch_page 状态码异常: {r.status_code}")
                 return None
             result = r.json()
             if result.get('code') != 0:
-                print(f"[debug] fetch_page 返回码异常: code={result.get('code')}, msg={result.get('msg', '')}")
+                log.warning(f"fetch_page 返回码异常: code={result.get('code')}, msg={result.get('msg', '')}")
                 return None
             return result.get('rows', [])
         except Exception as e:
-            print(f"[debug] fetch_page 异常: {e}")
+            log.warning(f"fetch_page 异常: {e}")
             return None
 
     def detect_changes(self, new_products):
         new_items, updated_items, unchanged_items = [], [], []
         existing_ids = {p['id']: p for p in self.products_data}
+        now = time.time()
+        excluded = 0
         for product in new_products:
             pid = product['id']
+            if pid not in existing_ids and pid in self.archive:
+                # 已归档的商品重新上架：取回原记录，按普通的 更新/未变 处理
+                restored = self._restore_archived(pid)
+                if restored is None:
+                    # 取回失败时不能当作新商品（会按 🆕新增 推送），本轮跳过，下一轮再试
+                    log.info("  归档商品 %s 暂时无法取回，本轮跳过", pid, extra={'rate_key': 'archive_restore'})
+                    continue
+                existing_ids[pid] = restored
+            # 列表阶段按编译好的规则排除（品牌/尺码），被排除的商品只记录不抓详情
+            skip = self.detail_processor.list_exclude_reason(product) is not None
             if pid not in existing_ids:
-                new_items.append(product)
                 product['size_price_counts'] = {}
                 product['full_size_price_counts'] = {}
                 product['last_checked'] = datetime.now().isoformat()
-                self.products_data.append(product)
+                product['last_seen'] = now
+                self.products_data.append(self._as_record(product))
+                if skip:
+                    excluded += 1
+                else:
+                    new_items.append(product)
             else:
                 old = existing_ids[pid]
+                old['last_seen'] = now
                 if product.get('updateTime') != old.get('updateTime'):
-                    updated_items.append({'old': old, 'new': product})
                     old.update(product)
                     old['last_checked'] = datetime.now().isoformat()
+                    if skip:
+                        excluded += 1
+                    else:
+                        updated_items.append({'old': old, 'new': product})
                 else:
                     unchanged_items.append(product)
+        if excluded:
+            log.info(f"  列表阶段排除 {excluded} 个商品（排除品牌/无允许尺码）")
         return new_items, updated_items, unchanged_items
 
+    def _restore_archived(self, pid):
+        try:
+            product = self.archive.restore(pid)
+        except Exception as e:
+            log.warning(f"取回归档商品 {pid} 失败：{e}")
+            return None
+        if product is None:
+            return None
+        ref = self._as_record(product)
+        self.products_data.append(ref)
+        log.info(f"  ♻ 商品 {product.get('articleNum') or pid} 重新上架，已从归档取回")
+        return ref
+
+    def evict_absent_products(self, seen_ids):
+        """
+        完整轮询后调用：连续 EVICT_MIN_MISSED_SWEEPS 次缺席且超过 EVICT_AFTER_SECONDS 未见的商品移入归档。
+        只有完整翻完所有列表页时才计数，避免某页请求失败把商品误判为下架。
+        """
+        now = time.time()
+        missed, keep, evict = {}, [], []
+        for p in self.products_data:
+            pid = p['id']
+            if pid in seen_ids:
+                keep.append(p)
+                continue
+            n = missed[pid] = self.missed_sweeps.get(pid, 0) + 1
+            last_seen = p.get('last_seen')
+            if last_seen is None:
+                # 旧数据没有 last_seen，从现在开始计时
+                p['last_seen'] = last_seen = now
+            if n >= EVICT_MIN_MISSED_SWEEPS and now - last_seen >= EVICT_AFTER_SECONDS and pid not in self.detail_queue:
+                evict.append(p)
+            else:
+                keep.append(p)
+        if evict:
+            try:
+                self.archive.evict(evict)
+            except Exception as e:
+                log.warning(f"归档下架商品失败：{e}")
+                evict = []
+                keep = self.products_data
+            else:
+                self.products_data = keep
+                for p in evict:
+                    missed.pop(p['id'], None)
+                    self.last_push_ts.pop(p['id'], None)
+                log.info(f"  🗄 {len(evict)} 个商品超过 {EVICT_AFTER_SECONDS / 86400:g} 天未出现，已移入归档（归档共 {len(self.archive)} 个）")
+        self.missed_sweeps = missed
+        return len(evict)
+
     def _find_or_attach_ref(self, product):
         for p in self.products_data:
             if p['id'] == product['id']:
                 return p
-        self.products_data.append(product)
-        return product
+        ref = self._as_record(product)
+        self.products_data.append(ref)
+        return ref
 
     def process_products_streaming(self, products, change_type):
+        """按同一变化类型入队并立即处理"""
         if not products:
             return
+        for p in products:
+            self.detail_queue.push(p, change_type)
+        self.process_detail_queue()
+
+    def _detail_job_priority(self, product, change_type):
+        allowed = [s for s in (product.get('sizes') or []) if self.detail_processor._size_allowed(str(s))]
+        return score_detail_job(product, change_type, len(set(map(str, allowed))),
+                                self.last_push_ts.get(product.get('id')))
+
+    def process_detail_queue(self, deadline=None):
+        """
+        按优先级从队列取出详情任务并发抓取，主线程逐个处理结果。
+        deadline：到时不再开始新任务，已提交但未开始的任务放回队列，留给下一轮；返回顺延的任务数
+        """
+        if not self.detail_queue:
+            return 0
 
-        id_to_ref = {p['id']: self._find_or_attach_ref(p) for p in products}
+        id_to_ref = {p['id']: p for p in self.products_data}
+        # 实际在途请求数由 DetailProcessor 的自适应并发控制，线程数只作为上限
+        workers = max(self.max_workers, self.detail_processor.max_concurrency())
+        prefetch = workers + self.max_workers  # 推送时 sleep，多预取一些保持线程忙碌
 
         processed = 0
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
-            future_to_id = {ex.submit(self.detail_processor.fetch_and_process_detail, p): p['id'] for p in products}
-            for fut in concurrent.futures.as_completed(future_to_id):
-                pid = future_to_id[fut]
-                target = id_to_ref.get(pid)
-                if not target:
-                    continue
+        deferred = []  # 会话过期而暂停的任务，本轮结束后放回队列，下一轮重新抓取
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+            inflight = {}
+
+            def _fill():
+                while len(inflight) < prefetch and not expired:
+                    job = self.detail_queue.pop()
+                    if job is None:
+                        break
+                    fut = ex.submit(self.detail_processor.fetch_and_process_detail, job.product)
+                    inflight[fut] = job
+
+            expired = False
+            _fill()
+            while inflight:
+                timeout = None if expired or deadline is None else max(0.0, deadline - time.time())
+                done, _ = concurrent.futures.wait(inflight, timeout=timeout,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                if not expired and deadline is not None and time.time() >= deadline:
+                    # 到时：排队中的任务取消后放回队列，正在抓取的任务等待完成（受单个请求时限约束）
+                    expired = True
+                    for fut in [f for f in inflight if f not in done and f.cancel()]:
+                        self.detail_queue.requeue(inflight.pop(fut))
+                for fut in done:
+                    job = inflight.pop(fut)
+                    _fill()
+                    pid = job.pid
+                    target = id_to_ref.get(pid)
+                    if target is None:
+                        target = id_to_ref[pid] = self._find_or_attach_ref(job.product)
 
-                try:
-                    detail_result = fut.result()
-                except Exception as e:
-                    print(f"[detail error] product {pid}: {e}")
-                    continue
-                if not detail_result:
-                    continue
+                    try:
+                        detail_result = fut.result()
+                    except (SessionExpiredError, DetailDeferredError) as e:
+                        # 会话过期 / 限流或总时限放弃：不更新快照，避免写入虚假的0人数据；列表变化已合并进快照，不会再次检测到，
+                        # 因此任务留到下一轮重新抓取（本轮内立即重试只会继续失败）
+                        log.info("[detail deferred] product %s: %s", pid, e, extra={'rate_key': 'detail_skipped'})
+                        deferred.append(job)
+                        continue
+                    except Exception as e:
+                        log.warning("[detail error] product %s: %s", pid, e, extra={'rate_key': 'detail_error'})
+                        continue
+                    if not detail_result:
+                        continue
+                    self._job_enqueued_at = job.enqueued_at
+                    try:
+                        if self._handle_detail_result(pid, target, detail_result, job.change_type):
+                            processed += 1
+                    except Exception as e:
+                        # 协调器超时等：快照未更新，任务留到下一轮（列表变化已合并，丢弃就不会再检测到）
+                        log.warning("[detail deferred] product %s: %s", pid, e, extra={'rate_key': 'detail_error'})
+                        deferred.append(job)
+                    processed += self.harvest_pushes()
 
-                article_num = detail_result.get('article_num', '') or target.get('articleNum', '') or ''
-                curr_full = detail_result.get('size_price_counts_full', {}) or {}
-                kept_map = detail_result.get('size_price_counts', {}) or {}  # 白名单 + 人数>0 + (价在区间或=0)
-                kept_all = sorted(list(kept_map.keys()), key=self.detail_processor._size_sort_key)
-
-                # —— 老快照 —— #
-                old_full_snapshot = target.get('full_size_price_counts', {}) or {}
-                old_kept_sizes = target.get('kept_sizes', []) or []
-                history_view = {'full_size_price_counts': old_full_snapshot, 'kept_sizes': old_kept_sizes}
-
-                # ===== 新增检测（旧=0 → 新>0），需排除冷却中的尺码 =====
-                def old0_newpos(s) -> bool:
-                    old_c = int((old_full_snapshot.get(s) or {}).get('count', 0) or 0)
-                    new_c = int((curr_full.get(s) or {}).get('count', 0) or 0)
-                    return (s in kept_map) and (old_c <= 0 and new_c > 0)
-                
-                def is_size_cooled(s) -> bool:
-                    """检查尺码是否在冷却期"""
-                    size_key = self._cool_key_size(article_num, s, fallback_id=str(pid))
-                    return self._is_cooled_size(size_key)
-
-                # 排除冷却中的尺码
-                newly_added_kept = [s for s in kept_all if old0_newpos(s) and not is_size_cooled(s)]
-                has_new_size_order = len(newly_added_kept) > 0
-
-                # ===== 获取所有要显示的尺码（包括价格超过范围的） =====
-                # 所有允许的尺码（用于显示和计算群组）
-                all_allowed_sizes = sorted(
-                    [s for s in curr_full.keys() if self.detail_processor._size_allowed(s)],
-                    key=self.detail_processor._size_sort_key
-                )
-                
-                # ===== 按尺码检查冷却和筛选需要推送的尺码 =====
-                # 对于 kept_map 中的尺码，检查冷却
-                push_sizes_kept = []
-                for s in kept_all:
-                    size_key = self._cool_key_size(article_num, s, fallback_id=str(pid))
-                    if not self._is_cooled_size(size_key):
-                        push_sizes_kept.append(s)
-                    else:
-                        rem = self._cooldown_remaining_seconds(size_key)
-                        if rem > 0:
-                            print(f"  ⏳ 冷却中（货号={article_num} 尺码={s}）：剩余 {self._fmt_hms(rem)}")
+        for job in deferred:
+            self.detail_queue.requeue(job)
+        if deferred:
+            log.info(f"  {len(deferred)} 个详情任务未能处理（会话不可用、限流或协调器出错），留到下一轮")
+
+        if self.pending_details:
+            log.info(f"  等待合并推送队列发送完成（{len(self.pending_details)} 个商品）...")
+        processed += self.harvest_pushes(wait=True)
+
+        try:
+            self.size_history.flush()
+        except Exception as e:
+            log.warning(f"写入尺码历史失败：{e}")
+
+        if processed == 0:
+            log.info("  没有符合条件的变化")
+        return len(self.detail_queue) if expired else 0
+
+    def _handle_detail_result(self, pid, target, detail_result, change_type):
+        """
+        同一份详情按每个筛选配置分别对比新旧快照并推送；返回是否有配置推送成功。
+        任一配置需要推送但没有成功时不更新快照，下一轮重新判断。
+        """
+        article_num = detail_result.get('article_num', '') or target.get('articleNum', '') or ''
+        title = (detail_result.get('title') or '').strip()
+
+        # —— 老快照 —— #
+        old_full_snapshot = target.get('full_size_price_counts', {}) or {}
+        old_kept_sizes = target.get('kept_sizes', []) or []
+        history_view = {'full_size_price_counts': old_full_snapshot, 'kept_sizes': old_kept_sizes}
+        changes = size_changes(old_full_snapshot, detail_result.get('size_price_counts_full'))
+        if changes:
+            self.feed.publish('change', {'pid': pid, 'article_num': article_num, 'title': title,
+                                         'change_type': change_type, 'sizes': changes})
+
+        pushed = False
+        blocked = False
+        futures = []
+        commit_args = (pid, target, detail_result, article_num, old_full_snapshot)
+        failed = True
+        try:
+            for profile in self.profiles:
+                if profile.rules.skip_brand(title):
+                    continue
+                outcome = self._handle_profile_result(profile, pid, target, detail_result, change_type,
+                                                      article_num, old_full_snapshot, history_view)
+                if isinstance(outcome, concurrent.futures.Future):
+                    futures.append(outcome)
+                elif outcome is True:
+                    pushed = True
+                elif outcome is False:
+                    blocked = True
+            failed = False
+        finally:
+            if futures:
+                # 合并推送：等推送结果出来后再决定是否更新快照；后面的配置出错时已提交的推送也要照常收尾
+                self.pending_details.append((futures, pushed, blocked or failed, commit_args))
+        if futures:
+            return False
+        # 未触发或全部推送成功：更新历史
+        if not blocked:
+            self._commit_snapshot(*commit_args)
+        return pushed
+
+    def _handle_profile_result(self, profile, pid, target, detail_result, change_type,
+                               article_num, old_full_snapshot, history_view):
+        """
+        按单个筛选配置决定是否推送。
+        返回 None：不需要推送；True：推送成功；False：需要推送但未成功（失败/重复推送被跳过）；
+        合并推送模式下返回 Future，结果由 harvest_pushes() 处理
+        """
+        tag = profile.tag
+        rules = profile.rules
+        curr_full = detail_result.get('size_price_counts_full', {}) or {}
+        kept_map = profile.kept_map(curr_full)  # 白名单 + 人数>0 + (价在区间或=0)
+        kept_all = sorted(list(kept_map.keys()), key=rules.size_sort_key)
+        size_keys = {s: profile.cool_key_size(article_num, s, fallback_id=str(pid)) for s in kept_all}
+        cooling = profile.cooling_sizes(size_keys.values())
+
+        # ===== 新增检测（旧=0 → 新>0），需排除冷却中的尺码 =====
+        def old0_newpos(s) -> bool:
+            old_c = int((old_full_snapshot.get(s) or {}).get('count', 0) or 0)
+            new_c = int((curr_full.get(s) or {}).get('count', 0) or 0)
+            return (s in kept_map) and (old_c <= 0 and new_c > 0)
                 
-                # 对于不在 kept_map 中的尺码（价格超过范围），不检查冷却，直接计入
-                push_sizes_other = [s for s in all_allowed_sizes if s not in kept_all]
+        def is_size_cooled(s) -> bool:
+            """检查尺码是否在冷却期"""
+            return size_keys[s] in cooling
+
+        # 排除冷却中的尺码
+        newly_added_kept = [s for s in kept_all if old0_newpos(s) and not is_size_cooled(s)]
+        has_new_size_order = len(newly_added_kept) > 0
+
+        # ===== 获取所有要显示的尺码（包括价格超过范围的） =====
+        # 所有允许的尺码（用于显示和计算群组）
+        all_allowed_sizes = sorted(
+            [s for s in curr_full.keys() if rules.size_allowed(s)],
+            key=rules.size_sort_key
+        )
                 
-                # 合并所有要推送的尺码
-                push_sizes = push_sizes_kept + push_sizes_other
-
-                # ===== 是否推送 =====
-                need_push = False
-                # 只在以下情况推送：
-                # 1. 新增商品且有未冷却的符合条件的尺码
-                # 2. 有尺码的订单数从0变为>0（0→正数）且未冷却
-                if change_type.startswith('🆕') and push_sizes_kept:
-                    # 新增商品也检查冷却，只有未冷却的尺码才推送
-                    need_push = True
-                elif has_new_size_order:
-                    need_push = True
-                # 注意：不再因为"有未冷却的尺码"就推送，避免无变化时重复推送
-
-                # 未触发：仅更新历史
-                if not need_push:
-                    target['detail_data'] = detail_result
-                    target['size_price_counts'] = kept_map
-                    target['full_size_price_counts'] = curr_full
-                    self.detail_processor.update_product_history(target, target['size_price_counts'], curr_full)
-                    self.save_initial_data()
-                    continue
+        # ===== 按尺码检查冷却和筛选需要推送的尺码 =====
+        # 对于 kept_map 中的尺码，检查冷却
+        push_sizes_kept = []
+        for s in kept_all:
+            rem = int(cooling.get(size_keys[s], 0))
+            if size_keys[s] not in cooling:
+                push_sizes_kept.append(s)
+            elif rem > 0:
+                log.info("  %s⏳ 冷却中（货号=%s 尺码=%s）：剩余 %s", tag, article_num, s, self._fmt_hms(rem),
+                         extra={'rate_key': 'cooldown'})
+
+        # ===== 是否推送 =====
+        need_push = False
+        # 只在以下情况推送：
+        # 1. 新增商品且有未冷却的符合条件的尺码
+        # 2. 有尺码的订单数从0变为>0（0→正数）且未冷却
+        if change_type.startswith('🆕') and push_sizes_kept:
+            # 新增商品也检查冷却，只有未冷却的尺码才推送
+            need_push = True
+        elif has_new_size_order:
+            need_push = True
+        # 注意：不再因为"有未冷却的尺码"就推送，避免无变化时重复推送
+
+        if not need_push:
+            return None
 
-                # 触发推送：只推送未冷却的尺码（kept_map中的）
-                filtered_kept_map = {s: kept_map[s] for s in push_sizes_kept if s in kept_map}
-                detail_for_output = dict(detail_result)
-                detail_for_output['size_price_counts'] = filtered_kept_map
-                detail_for_output['size_price_counts_full'] = curr_full
+        # 触发推送：只推送未冷却的尺码（kept_map中的）
+        filtered_kept_map = {s: kept_map[s] for s in push_sizes_kept if s in kept_map}
+        detail_for_output = dict(detail_result)
+        detail_for_output['size_price_counts'] = filtered_kept_map
+        detail_for_output['size_price_counts_full'] = curr_full
+
+        # 根据所有要显示的尺码数量确定群组和计数器（包括价格超过范围和冷却中的）
+        # 使用 all_allowed_sizes 而不是 push_sizes，因为群组分配应该基于所有显示的尺码
+        size_count = len(all_allowed_sizes)
+        if size_count <= 2:
+            group_num = 1
+        elif size_count <= 5:
+            group_num = 2
+        else:  # >= 6
+            group_num = 3
+        push_keys = [size_keys[s] for s in push_sizes_kept]
+        # 分片模式：先在协调器占用这些尺码，其他分片同时命中同一货号尺码时只有一个能推送
+        if not profile.claim_sizes(push_keys):
+            log.info("⚠ %s商品 %s 的尺码正在推送中（同货号其他商品或其他分片），下一轮再判断", tag, article_num or pid,
+                     extra={'rate_key': 'claimed'})
+            return False
+        # 使用锁保护计数器操作，防止并发冲突
+        next_no = profile.take_number(group_num)
+
+        formatted_output, img_url = self.detail_processor.format_product_output(
+            target, detail_for_output, history_view, next_no, change_type, group_num, rules=rules
+        )
+        if not formatted_output:
+            profile.return_number(group_num, next_no)
+            profile.release_sizes(push_keys)
+            return False
 
-                # 根据所有要显示的尺码数量确定群组和计数器（包括价格超过范围和冷却中的）
-                # 使用 all_allowed_sizes 而不是 push_sizes，因为群组分配应该基于所有显示的尺码
-                size_count = len(all_allowed_sizes)
-                
-                # 使用锁保护计数器操作，防止并发冲突
-                with self.counter_lock:
-                    if size_count <= 2:
-                        group_num = 1
-                        next_no = self.counter_group_1
-                        self.counter_group_1 += 1
-                        self._save_group_counter(1, self.counter_group_1)
-                    elif size_count <= 5:
-                        group_num = 2
-                        next_no = self.counter_group_2
-                        self.counter_group_2 += 1
-                        self._save_group_counter(2, self.counter_group_2)
-                    else:  # >= 6
-                        group_num = 3
-                        next_no = self.counter_group_3
-                        self.counter_group_3 += 1
-                        self._save_group_counter(3, self.counter_group_3)
-
-                formatted_output, img_url = self.detail_processor.format_product_output(
-                    target, detail_for_output, history_view, next_no, change_type, group_num
-                )
-
-                if formatted_output:
-                    # 使用推送锁和集合防止重复推送
-                    # 使用 pid 作为唯一标识，而不是 next_no（因为 next_no 可能不同）
-                    push_key = f"{article_num}_{pid}" if article_num else str(pid)
-                    with self.push_lock:
-                        if push_key in self.pushing_products:
-                            print(f"⚠ 商品 {article_num or pid} 正在推送中，跳过重复推送")
-                            # 回滚计数器（使用计数器锁）
-                            with self.counter_lock:
-                                if group_num == 1:
-                                    self.counter_group_1 -= 1
-                                    self._save_group_counter(1, self.counter_group_1)
-                                elif group_num == 2:
-                                    self.counter_group_2 -= 1
-                                    self._save_group_counter(2, self.counter_group_2)
-                                else:
-                                    self.counter_group_3 -= 1
-                                    self._save_group_counter(3, self.counter_group_3)
-                            continue
-                        self.pushing_products.add(push_key)
-                    
-                    try:
-                        print(f"\n📦 处理商品 {next_no} (群组{group_num}, 尺码数{size_count}):")
-                        print(formatted_output)
-                        self.write_to_output_file(formatted_output)
+        ok = False
+        # 使用推送锁和集合防止重复推送
+        # 使用 pid 作为唯一标识，而不是 next_no（因为 next_no 可能不同）
+        push_key = f"{profile.name}:{article_num}_{pid}" if article_num else f"{profile.name}:{pid}"
+        with self.push_lock:
+            if push_key in self.pushing_products:
+                log.info("⚠ %s商品 %s 正在推送中，跳过重复推送", tag, article_num or pid, extra={'rate_key': 'pushing'})
+                # 回滚计数器（使用计数器锁）
+                profile.return_number(group_num, next_no)
+                profile.release_sizes(push_keys)
+                return False
+            self.pushing_products.add(push_key)
+
+        self.feed.publish('push', {'pid': pid, 'article_num': article_num, 'profile': profile.name,
+                                   'group': group_num, 'no': next_no, 'sizes': push_sizes_kept, 'status': 'pending'})
+        log.info(f"\n📦 {tag}处理商品 {next_no} (群组{group_num}, 尺码数{size_count}):")
+        log.info(formatted_output.rstrip())
+        finish = functools.partial(self._finish_push, profile, pid, next_no, group_num, push_keys, push_key,
+                                   enqueued_at=self._job_enqueued_at)
+        if profile.wechat_bot.digest:
+            # 合并推送：放入群组队列立即返回，结果由 harvest_pushes() 在主线程处理
+            try:
+                self.write_to_output_file(formatted_output, next_no, group_num, profile)
+                fut = profile.wechat_bot.submit(formatted_output, img_url, group_num)
+            except Exception:
+                self._run_finisher(finish, False)
+                raise
+            self.push_finishers[fut] = finish
+            return fut
 
-                        ok = self.wechat_bot.send_product_to_bot(formatted_output, img_url, group_num)
-                        if ok:
-                            print(f"✓ 商品 {next_no} 推送成功")
-                            processed += 1
-                            # 按尺码冷却（只对 kept_map 中的尺码进行冷却）
-                            for s in push_sizes_kept:
-                                size_key = self._cool_key_size(article_num, s, fallback_id=str(pid))
-                                self._mark_cooled_size(size_key)
-                            # 只有推送成功才更新历史数据
-                            target['detail_data'] = detail_result
-                            target['size_price_counts'] = kept_map
-                            target['full_size_price_counts'] = curr_full
-                            self.detail_processor.update_product_history(target, target['size_price_counts'], curr_full)
-                            self.save_initial_data()
-                        else:
-                            print(f"✗ 商品 {next_no} 推送失败")
-                            # 推送失败时回滚计数器，保持编号连续（使用计数器锁）
-                            with self.counter_lock:
-                                if group_num == 1:
-                                    self.counter_group_1 -= 1
-                                    self._save_group_counter(1, self.counter_group_1)
-                                elif group_num == 2:
-                                    self.counter_group_2 -= 1
-                                    self._save_group_counter(2, self.counter_group_2)
-                                else:
-                                    self.counter_group_3 -= 1
-                                    self._save_group_counter(3, self.counter_group_3)
-                    finally:
-                        # 推送完成后从集合中移除
-                        with self.push_lock:
-                            self.pushing_products.discard(push_key)
-                time.sleep(1)
+        try:
+            self.write_to_output_file(formatted_output, next_no, group_num, profile)
+            ok = profile.wechat_bot.send_product_to_bot(formatted_output, img_url, group_num)
+        finally:
+            self._run_finisher(finish, ok)
+        time.sleep(1)
+        return ok
+
+    def _finish_push(self, profile, pid, next_no, group_num, push_keys, push_key, ok, enqueued_at=None):
+        """推送结束：成功则按尺码冷却，失败回滚编号并释放占用"""
+        tag = profile.tag
+        self.feed.publish('push', {'pid': pid, 'profile': profile.name, 'group': group_num, 'no': next_no,
+                                   'status': 'sent' if ok else 'failed'})
+        try:
+            if ok:
+                log.info(f"✓ {tag}商品 {next_no} 推送成功")
+                self.last_push_ts[pid] = time.time()
+                if self.shadow_report:
+                    self.shadow_report.record(profile.name, group_num, next_no, pid, push_keys,
+                                              time.time() - enqueued_at if enqueued_at else None)
+                # 按尺码冷却（只对 kept_map 中的尺码进行冷却）
+                profile.mark_cooled_sizes(push_keys)
+            else:
+                log.warning(f"✗ {tag}商品 {next_no} 推送失败")
+                # 推送失败时回滚计数器，保持编号连续（使用计数器锁）
+                profile.return_number(group_num, next_no)
+                profile.release_sizes(push_keys)
+        finally:
+            # 推送完成后从集合中移除
+            with self.push_lock:
+                self.pushing_products.discard(push_key)
+
+    def _run_finisher(self, finish, ok):
+        """执行推送结束回调；协调器出错时只记录（占用到期后自动释放），不中断本轮"""
+        try:
+            finish(ok)
+        except Exception as e:
+            log.warning(f"处理推送结果失败（商品 {finish.args[1]} NO.{finish.args[2]}）：{e}")
+
+    def harvest_pushes(self, wait=False) -> int:
+        """
+        处理合并推送队列中已完成的推送（主线程调用）：所有配置的推送都结束后再决定是否更新快照。
+        wait=True 时等待全部完成。返回推送成功的商品数。
+        """
+        if wait:
+            # 排队的推送可能比占用有效期更久，等待期间定期续期
+            futures = [f for entry in self.pending_details for f in entry[0]]
+            while concurrent.futures.wait(futures, timeout=CLAIM_RENEW_INTERVAL).not_done:
+                self._renew_claims(force=True)
+        else:
+            self._renew_claims()
+        done_count = 0
+        still, ready, finished, failed = [], [], [], []
+        for entry in self.pending_details:
+            futures, pushed, blocked, commit_args = entry
+            if not wait and not all(f.done() for f in futures):
+                still.append(entry)
+                continue
+            for fut in futures:
+                ok = fut.result()
+                (finished if ok else failed).append(self.push_finishers.pop(fut))
+                pushed = pushed or ok
+                blocked = blocked or not ok
+            ready.append((pushed, blocked, commit_args))
+        # 先移出已取走的条目，回调出错也不会在下次重复处理
+        self.pending_details = still
+        for finish in finished:
+            self._run_finisher(finish, True)
+        # 失败的推送按编号从大到小回滚：同一批连续的编号整体失败时全部收回，保持编号连续
+        for finish in sorted(failed, key=lambda f: f.args[2], reverse=True):
+            self._run_finisher(finish, False)
+        for pushed, blocked, commit_args in ready:
+            if not blocked:
+                self._commit_snapshot(*commit_args)
+            done_count += int(pushed)
+        return done_count
+
+    def _renew_claims(self, force=False):
+        """续期仍在发送队列中的推送在协调器中的尺码占用（每 CLAIM_RENEW_INTERVAL 秒一次）"""
+        if not self.push_finishers or (not force and time.time() - self._claims_renewed_at < CLAIM_RENEW_INTERVAL):
+            return
+        self._claims_renewed_at = time.time()
+        by_profile = {}
+        for finish in self.push_finishers.values():
+            profile, push_keys = finish.args[0], finish.args[4]
+            by_profile.setdefault(profile, []).extend(push_keys)
+        for profile, keys in by_profile.items():
+            try:
+                profile.renew_claims(keys)
+            except Exception as e:
+                log.warning(f"续期推送占用失败：{e}")
 
-        if processed == 0:
-            print("  没有符合条件的变化")
+    def _commit_snapshot(self, pid, target, detail_result, article_num, old_full_snapshot):
+        """用本次详情覆盖商品快照，并把尺码变化写入历史时间序列"""
+        curr_full = detail_result.get('size_price_counts_full', {}) or {}
+        try:
+            self.size_history.record_changes(article_num, pid, old_full_snapshot, curr_full)
+        except Exception as e:
+            log.warning(f"记录尺码历史失败：{e}")
+        target['detail_data'] = detail_result
+        target['size_price_counts'] = detail_result.get('size_price_counts', {}) or {}
+        target['full_size_price_counts'] = curr_full
+        self.detail_processor.update_product_history(target, target['size_price_counts'], curr_full)
+        self.save_initial_data()
+
+    def _print_concurrency_metrics(self):
+        for host, m in self.detail_processor.get_metrics().items():
+            lat = f"{m['latency_ms']}ms" if m['latency_ms'] is not None else '-'
+            log.info(f"  [并发] {host} 上限={m['limit']} 在途={m['inflight']} 平滑延迟={lat} "
+                  f"错误率={m['error_rate']:.1%} 请求={m['requests']} 过载={m['overloads']}")
+        if self.session_pool:
+            for name, m in self.session_pool.metrics().items():
+                log.info(f"  [账号] {name} {'可用' if m['healthy'] else '摘除'} 速率={m['rate_per_min']}/分 "
+                      f"请求={m['requests']} 失败={m['errors']} 限流={m['throttles']} 重登={m['relogins']}")
 
     # ===== 主循环 =====
+    def _profile_sizes(self):
+        """性能采样报告中记录的数据规模"""
+        sizes = {'products_data': len(self.products_data), 'detail_queue': len(self.detail_queue),
+                 'carried_over': self.carried_over,
+                 'missed_sweeps': len(self.missed_sweeps), 'last_push_ts': len(self.last_push_ts)}
+        for profile in self.profiles:
+            if profile.coordinator is None:
+                sizes[f'cooldown_map[{profile.name}]'] = len(profile.cooldown_map)
+        return sizes
+
+    def _idle(self):
+        """两轮之间的等待；控制通道收到修改命令时提前结束"""
+        if self.profiler.active:
+            # 本轮中途失败（列表请求失败、异常）：结束采样，不让采样线程和 tracemalloc 跨轮运行
+            self.profiler.end(self._profile_sizes(), completed=False)
+        self.control.idle(self.check_interval)
+
     def monitor_products(self, check_interval=1):
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 开始监控商品数据...")
-        if not self.login_with_captcha(self.detail_processor):
-            print("登录失败，无法继续监控")
+        self.check_interval = check_interval
+        log.info(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 开始监控商品数据...")
+        # 优先复用上次保存的会话（一次校验请求），失效时才走验证码登录
+        if not (self.session_manager.restore_saved() or self.session_manager.refresh_now()):
+            log.warning("登录失败，无法继续监控")
             return
-        self.last_login_time = time.time()  # 记录登录时间
+        # 之后的定时续期在后台线程完成，不再阻塞轮询
+        self.session_manager.start()
+        if self.session_pool:
+            self.session_pool.start()
+        self.rule_watcher.start()
+        self.control.start()
+        if self.feed_bind:
+            self.feed.start(self.feed_bind)
 
         while True:
             try:
                 self._rollover_if_new_day()
-                
-                # 检查是否需要主动刷新登录（超过1小时）
-                if self._should_refresh_login():
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ⏰ 登录已超过1小时，主动刷新...")
-                    self._try_relogin()
-                
+                self.apply_pending_rules()
+                self.control.apply_pending()
+                self.profiler.begin(self.cycles + 1, self._profile_sizes())
+
                 t0 = time.time()
                 all_new_products = []
                 page_num = 1
@@ -504,11 +917,11 @@ class ProductMonitor(BaseLogin):
                 first = self.fetch_page(page_num, page_size=500)
                 if not first:
                     self.consecutive_failures += 1
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 获取第一页失败 (连续失败 {self.consecutive_failures} 次)")
+                    log.warning(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 获取第一页失败 (连续失败 {self.consecutive_failures} 次)")
                     
                     # 连续失败多次，尝试重新登录
                     if self.consecutive_failures >= self.max_failures_before_relogin:
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ⚠ 连续失败 {self.consecutive_failures} 次，可能是登录过期")
+                        log.warning(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ⚠ 连续失败 {self.consecutive_failures} 次，可能是登录过期")
                         if self._try_relogin():
                             # 重新登录成功，立即重试获取
                             first = self.fetch_page(page_num, page_size=500)
@@ -516,46 +929,73 @@ class ProductMonitor(BaseLogin):
                                 self.consecutive_failures = 0
                                 all_new_products.extend(first)
                             else:
-                                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 重新登录后仍获取失败，等待下次检查")
-                                time.sleep(check_interval)
+                                log.warning(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 重新登录后仍获取失败，等待下次检查")
+                                self._idle()
                                 continue
                         else:
-                            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 等待下次检查...")
-                            time.sleep(check_interval)
+                            log.info(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 等待下次检查...")
+                            self._idle()
                             continue
                     else:
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 等待下次检查...")
-                        time.sleep(check_interval)
+                        log.info(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 等待下次检查...")
+                        self._idle()
                         continue
                 else:
                     self.consecutive_failures = 0  # 成功后重置失败计数
                     all_new_products.extend(first)
 
+                sweep_complete = True
                 while True:
                     page_num += 1
                     page_products = self.fetch_page(page_num, page_size=500)
-                    if not page_products or len(page_products) == 0:
+                    if page_products is None:
+                        sweep_complete = False  # 请求失败，本轮不是完整列表
+                        break
+                    if len(page_products) == 0:
                         break
                     all_new_products.extend(page_products)
 
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 共获取 {len(all_new_products)} 个商品")
+                log.info(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 共获取 {len(all_new_products)} 个商品")
+                if self.shard:
+                    all_new_products = self.own_products(all_new_products)
+                    log.info(f"  本分片负责 {len(all_new_products)} 个")
 
                 new_items, updated_items, _ = self.detect_changes(all_new_products)
 
                 if new_items:
-                    print(f"发现 {len(new_items)} 个新商品")
-                    self.process_products_streaming(new_items, "🆕新增")
+                    log.info(f"发现 {len(new_items)} 个新商品")
+                    for p in new_items:
+                        self.detail_queue.push(p, "🆕新增")
 
                 if updated_items:
-                    print(f"发现 {len(updated_items)} 个更新商品")
-                    updated_products = [i['new'] for i in updated_items]
-                    self.process_products_streaming(updated_products, "📌更新")
+                    log.info(f"发现 {len(updated_items)} 个更新商品")
+                    for i in updated_items:
+                        self.detail_queue.push(i['new'], "📌更新")
+
+                # 新增与更新统一进入优先级队列，新品不再排在大批更新之后；上一轮顺延的任务已在队列中，按商品ID合并
+                jobs, t_detail = len(self.detail_queue), time.time()
+                deadline = t0 + self.cycle_budget if self.cycle_budget else None
+                self.carried_over = self.process_detail_queue(deadline)
+                if self.carried_over:
+                    self.deadline_hits += 1
+                    log.info(f"  本轮时限 {self.cycle_budget:g} 秒已到，{self.carried_over} 个详情任务顺延到下一轮")
+                if self.shadow_report:
+                    self.shadow_report.end_cycle(jobs - len(self.detail_queue), time.time() - t_detail)
+
+                if sweep_complete:
+                    self.evict_absent_products({p['id'] for p in all_new_products})
 
                 self.save_initial_data()
-                print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 本次监控耗时: {time.time() - t0:.2f}秒")
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 等待 {check_interval} 秒后进行下一次检查...")
-                time.sleep(check_interval)
+                self.save_detail_backlog()
+                self.output_writer.flush()
+                self.profiler.end(self._profile_sizes())
+                self.cycles += 1
+                self.last_cycle_seconds = round(time.time() - t0, 2)
+                log.info(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 本次监控耗时: {time.time() - t0:.2f}秒")
+                self._print_concurrency_metrics()
+                log.info(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 等待 {self.check_interval} 秒后进行下一次检查...")
+                self._idle()
             except Exception as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 监控过程发生异常: {str(e)}")
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 等待 {check_interval} 秒后重试...")
-                time.sleep(check_interval)
+                log.warning(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 监控过程发生异常: {str(e)}")
+                log.info(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 等待 {self.check_interval} 秒后重试...")
+                self._idle()
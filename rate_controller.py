@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+按主机的自适应并发控制（AIMD）：
+延迟和错误率正常时并发上限 +1，遇到超时/429/5xx 或明显变慢时乘性降低。
+"""
+import random
+import threading
+import time
+import urllib.parse
+
+OUTCOME_OK = 'ok'
+OUTCOME_ERROR = 'error'        # 普通失败（非200/空页面等），只计入错误率
+OUTCOME_OVERLOAD = 'overload'  # 超时、429、5xx，视为服务端过载信号
+
+DECREASE_FACTOR = 0.7      # 过载时的乘性降低系数
+DECREASE_COOLDOWN = 2.0    # 两次降低之间的最小间隔（秒），避免同一波超时连续砍半
+SLOWDOWN_RATIO = 2.5       # 平滑延迟超过基线的倍数视为变慢
+ERROR_RATE_LIMIT = 0.1     # 错误率高于该值时不再增加并发
+EWMA_ALPHA = 0.2
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial=8, min_limit=2, max_limit=32, latency_target=2.0):
+        self.min_limit = int(min_limit)
+        self.max_limit = int(max_limit)
+        self.limit = max(self.min_limit, min(int(initial), self.max_limit))
+        self.latency_target = float(latency_target)
+
+        self.inflight = 0
+        self.latency_ewma = None
+        self.latency_floor = None   # 观察到的最低平滑延迟，作为变慢判断的基线
+        self.error_rate = 0.0
+        self.total_requests = 0
+        self.total_overloads = 0
+        self._ok_since_change = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None) -> bool:
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self.inflight >= self.limit:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.inflight += 1
+            return True
+
+    def release(self, latency, outcome=OUTCOME_OK):
+        with self._cond:
+            self.inflight = max(0, self.inflight - 1)
+            self.total_requests += 1
+            failed = outcome != OUTCOME_OK
+            self.error_rate += EWMA_ALPHA * ((1.0 if failed else 0.0) - self.error_rate)
+
+            if outcome == OUTCOME_OVERLOAD:
+                self.total_overloads += 1
+                self._decrease()
+            elif outcome == OUTCOME_OK and latency is not None:
+                self._observe_latency(latency)
+                if self._is_slow():
+                    self._decrease()
+                else:
+                    self._ok_since_change += 1
+                    # 每完成一个“窗口”（等于当前上限）的成功请求才加 1
+                    if (self._ok_since_change >= self.limit and self.error_rate < ERROR_RATE_LIMIT
+                            and self.latency_ewma <= self.latency_target):
+                        self.limit = min(self.max_limit, self.limit + 1)
+                        self._ok_since_change = 0
+            self._cond.notify_all()
+
+    def _observe_latency(self, latency):
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += EWMA_ALPHA * (latency - self.latency_ewma)
+        if self.latency_floor is None or self.latency_ewma < self.latency_floor:
+            self.latency_floor = self.latency_ewma
+        else:
+            # 基线缓慢回升，避免一次偶然的低延迟永久压低基线
+            self.latency_floor += 0.01 * (self.latency_ewma - self.latency_floor)
+
+    def _is_slow(self) -> bool:
+        if self.latency_ewma is None or self.latency_floor is None:
+            return False
+        return self.latency_ewma > self.latency_target and self.latency_ewma > self.latency_floor * SLOWDOWN_RATIO
+
+    def _decrease(self):
+        now = time.time()
+        self._ok_since_change = 0
+        if now - self._last_decrease < DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, int(self.limit * DECREASE_FACTOR))
+
+    def set_bounds(self, min_limit, max_limit):
+        """运行中调整并发上下限，当前上限随之收紧到新范围内"""
+        with self._cond:
+            self.min_limit = int(min_limit)
+            self.max_limit = int(max_limit)
+            self.limit = max(self.min_limit, min(self.limit, self.max_limit))
+            self._cond.notify_all()
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'inflight': self.inflight,
+                'latency_ms': round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+                'error_rate': round(self.error_rate, 3),
+                'requests': self.total_requests,
+                'overloads': self.total_overloads,
+            }
+
+
+class HostLimiters:
+    """每个主机（或主机+账号）一个 AdaptiveLimiter"""
+
+    def __init__(self, **limiter_kwargs):
+        self.limiter_kwargs = limiter_kwargs
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, account=None) -> AdaptiveLimiter:
+        """多账号时按 主机@账号 分别控制，每个账号各自的限流互不影响"""
+        host = urllib.parse.urlsplit(url).netloc or url
+        if account:
+            host = f"{host}@{account}"
+        with self._lock:
+            lim = self._limiters.get(host)
+            if lim is None:
+                lim = self._limiters[host] = AdaptiveLimiter(**self.limiter_kwargs)
+            return lim
+
+    def set_bounds(self, min_limit, max_limit):
+        """调整已有和之后新建的所有限流器的并发上下限"""
+        with self._lock:
+            self.limiter_kwargs.update(min_limit=min_limit, max_limit=max_limit)
+            items = list(self._limiters.values())
+        for lim in items:
+            lim.set_bounds(min_limit, max_limit)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            items = list(self._limiters.items())
+        return {host: lim.metrics() for host, lim in items}
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """全抖动指数退避：[0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -1,14 +1,50 @@
 # -*- coding: utf-8 -*-
 """
 重置所有群组的NO.计数器
+用法：python reset_counters.py [群组编号] [--profile 配置名] [--coordinator coordinator.db | http://主机:8765]
+                               [--socket monitor.sock]
+监控进程正在运行时通过控制通道（control_socket.py）重置，进程内存中的计数器同步更新；
+未运行时直接修改 daily_counter.json。分片模式下计数器保存在协调器中，需要加 --coordinator
 """
 import os
 import json
 from datetime import datetime
 
-def reset_all_counters():
+def _counter_file(profile=None):
+    """默认配置使用 daily_counter.json，profiles.json 中的配置使用 daily_counter_<配置名>.json"""
+    return f'daily_counter_{profile}.json' if profile else 'daily_counter.json'
+
+def reset_via_control_socket(path, group_num=None, profile=None):
+    """监控进程运行中时通过控制通道重置；进程未运行返回 False"""
+    from control_socket import request
+    try:
+        resp = request(path, {'cmd': 'counter', 'group': group_num, 'value': 1, 'profile': profile or 'default'})
+    except OSError:
+        return False
+    if not resp.get('ok'):
+        print(f"重置失败：{resp.get('error')}")
+    elif resp.get('queued'):
+        print(f"… 监控进程正在运行，{resp['message']}")
+    else:
+        print(f"✓ 已通过运行中的监控进程重置{'群组' + str(group_num) if group_num else '所有群组'}的计数器")
+        for g, v in sorted(resp['counters'].items()):
+            print(f"  群组{g}: {v}")
+    return True
+
+def reset_coordinator_counters(spec, group_num=None, profile=None):
+    """重置共享协调器中的计数器（分片模式）"""
+    from shard_coordinator import connect
+    today = datetime.now().strftime('%Y-%m-%d')
+    try:
+        connect(spec).reset_counters(profile or 'default', today, group_num)
+    except Exception as e:
+        print(f"重置协调器计数器失败：{e}")
+        return
+    print(f"✓ 协调器中{'群组' + str(group_num) if group_num else '所有群组'}的计数器已重置为1")
+
+def reset_all_counters(profile=None):
     """重置所有群组计数器为1"""
-    counter_file = 'daily_counter.json'
+    counter_file = _counter_file(profile)
     today = datetime.now().strftime('%Y-%m-%d')
     
     # 读取当前计数器
@@ -24,7 +60,8 @@ def reset_all_counters():
     
     # 重置所有计数器
     data['date'] = today
-    data['counter'] = 1
+    if not profile:
+        data['counter'] = 1
     data['counter_group_1'] = 1
     data['counter_group_2'] = 1
     data['counter_group_3'] = 1
@@ -40,9 +77,9 @@ def reset_all_counters():
     except Exception as e:
         print(f"保存计数器文件失败：{e}")
 
-def reset_group_counter(group_num: int):
+def reset_group_counter(group_num: int, profile=None):
     """重置指定群组的计数器为1"""
-    counter_file = 'daily_counter.json'
+    counter_file = _counter_file(profile)
     today = datetime.now().strftime('%Y-%m-%d')
     
     # 读取当前计数器
@@ -72,17 +109,48 @@ def reset_group_counter(group_num: int):
 if __name__ == '__main__':
     import sys
     
-    if len(sys.argv) > 1:
+    args = sys.argv[1:]
+    profile = None
+    if '--profile' in args:
+        i = args.index('--profile')
+        if i + 1 >= len(args):
+            print("错误：--profile 后需要配置名")
+            sys.exit(1)
+        profile = args[i + 1]
+        del args[i:i + 2]
+    coordinator = None
+    if '--coordinator' in args:
+        i = args.index('--coordinator')
+        if i + 1 >= len(args):
+            print("错误：--coordinator 后需要协调器地址")
+            sys.exit(1)
+        coordinator = args[i + 1]
+        del args[i:i + 2]
+    socket_path = 'monitor.sock'
+    if '--socket' in args:
+        i = args.index('--socket')
+        if i + 1 >= len(args):
+            print("错误：--socket 后需要控制通道文件")
+            sys.exit(1)
+        socket_path = args[i + 1]
+        del args[i:i + 2]
+
+    if args:
         # 重置指定群组
         try:
-            group_num = int(sys.argv[1])
+            group_num = int(args[0])
             if group_num in [1, 2, 3]:
-                reset_group_counter(group_num)
+                if coordinator:
+                    reset_coordinator_counters(coordinator, group_num, profile)
+                elif not reset_via_control_socket(socket_path, group_num, profile):
+                    reset_group_counter(group_num, profile)
             else:
                 print("错误：群组编号必须是1、2或3")
         except ValueError:
             print("错误：群组编号必须是数字")
     else:
         # 重置所有群组
-        reset_all_counters()
-
+        if coordinator:
+            reset_coordinator_counters(coordinator, None, profile)
+        elif not reset_via_control_socket(socket_path, None, profile):
+            reset_all_counters(profile)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+筛选规则配置文件（热加载）：修改 filter_rules.json 后无需重启，下一轮轮询开始时生效。
+
+文件格式（各项均可省略，省略的使用代码中的默认值）：
+    {
+      "excluded_brands": ["hoka", "saucony", ...],
+      "allowed_sizes": ["35.5", "36", ...],
+      "price_min": 270,
+      "price_max": 1800,
+      "cooldown_days": 3.5
+    }
+后台线程按修改时间轮询文件；读取后先校验、编译，成功才交给监控主循环替换，
+格式错误时保留当前规则并打印原因。
+
+用法：
+    python rule_config.py init  [filter_rules.json]   # 按当前默认规则生成配置文件
+    python rule_config.py check [filter_rules.json]   # 只校验不生效
+"""
+import os
+import sys
+import json
+import threading
+from rule_engine import CompiledRules
+from log_setup import get_logger
+
+log = get_logger('rules')
+
+RULES_FILE = 'filter_rules.json'
+POLL_INTERVAL = 2.0   # 检查文件修改时间的间隔（秒）
+
+
+class RuleConfigError(Exception):
+    pass
+
+
+def default_config() -> dict:
+    import detail_processor as dp
+    import product_monitor as pm
+    return {
+        'excluded_brands': list(dict.fromkeys(dp.EXCLUDED_BRANDS)),
+        'allowed_sizes': list(dp.ALLOWED_SIZES),
+        'price_min': dp.PRICE_MIN,
+        'price_max': dp.PRICE_MAX,
+        'cooldown_days': pm.COOLDOWN_DAYS,
+    }
+
+
+def _str_list(cfg, key, allow_empty=True):
+    value = cfg[key]
+    if not isinstance(value, list) or not all(isinstance(x, (str, int, float)) and str(x).strip() for x in value):
+        raise RuleConfigError(f"{key} 必须是字符串列表（元素不能为空）")
+    if not value and not allow_empty:
+        # 空的允许尺码会过滤掉所有尺码，多半是误操作，不热替换
+        raise RuleConfigError(f"{key} 不能为空列表")
+    return [str(x).strip() for x in value]
+
+
+def _number(cfg, key):
+    value = cfg[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise RuleConfigError(f"{key} 必须是非负数")
+    return float(value)
+
+
+def validate_config(raw) -> dict:
+    """校验并补全默认值；不合法时抛出 RuleConfigError"""
+    if not isinstance(raw, dict):
+        raise RuleConfigError("配置文件顶层必须是对象")
+    unknown = set(raw) - {'excluded_brands', 'allowed_sizes', 'price_min', 'price_max', 'cooldown_days'}
+    if unknown:
+        raise RuleConfigError(f"未知配置项: {', '.join(sorted(unknown))}")
+    cfg = default_config()
+    cfg.update(raw)
+    cfg['excluded_brands'] = _str_list(cfg, 'excluded_brands')
+    cfg['allowed_sizes'] = _str_list(cfg, 'allowed_sizes', allow_empty=False)
+    cfg['price_min'] = _number(cfg, 'price_min')
+    cfg['price_max'] = _number(cfg, 'price_max')
+    cfg['cooldown_days'] = _number(cfg, 'cooldown_days')
+    if cfg['price_min'] > cfg['price_max']:
+        raise RuleConfigError("price_min 不能大于 price_max")
+    return cfg
+
+
+def load_rules_file(path):
+    """读取、校验并编译，返回 (配置, CompiledRules)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except ValueError as e:
+        raise RuleConfigError(f"JSON 格式错误: {e}")
+    cfg = validate_config(raw)
+    rules = CompiledRules(cfg['excluded_brands'], cfg['allowed_sizes'], cfg['price_min'], cfg['price_max'])
+    return cfg, rules
+
+
+class RuleConfigWatcher(threading.Thread):
+    """
+    轮询配置文件的修改时间，变化后在后台读取和编译；
+    编译好的规则通过 take_pending() 交给主循环，在两轮之间替换，避免一轮内规则不一致。
+    """
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        super().__init__(name='rule-config-watcher', daemon=True)
+        self.path = path
+        self.poll_interval = poll_interval
+        self._mtime = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def check_now(self) -> bool:
+        """文件有变化时加载；返回是否产生了新的待生效规则"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            loaded = load_rules_file(self.path)
+        except (RuleConfigError, OSError) as e:
+            log.warning(f"规则配置 {os.path.basename(self.path)} 无效，继续使用当前规则：{e}")
+            return False
+        with self._lock:
+            self._pending = loaded
+        return True
+
+    def take_pending(self):
+        """取出待生效的 (配置, CompiledRules)，没有则返回 None"""
+        with self._lock:
+            loaded, self._pending = self._pending, None
+        return loaded
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.check_now()
+            except Exception as e:
+                log.warning(f"检查规则配置失败：{e}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('init', 'check'):
+        print(__doc__)
+        sys.exit(1)
+    path = sys.argv[2] if len(sys.argv) > 2 else RULES_FILE
+    if sys.argv[1] == 'init':
+        if os.path.exists(path):
+            print(f"{path} 已存在，未覆盖")
+            sys.exit(1)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(default_config(), f, ensure_ascii=False, indent=2)
+        print(f"✓ 已生成 {path}")
+    else:
+        try:
+            cfg, _ = load_rules_file(path)
+        except (RuleConfigError, OSError) as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+        print(f"✓ 配置有效：排除品牌 {len(cfg['excluded_brands'])} 个，允许尺码 {len(cfg['allowed_sizes'])} 个，"
+              f"价格 {cfg['price_min']:g}-{cfg['price_max']:g}，冷却 {cfg['cooldown_days']:g} 天")
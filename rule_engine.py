@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+筛选规则编译：把 排除品牌 / 允许尺码 / 价格区间 编译成查询用的结构，一次编译、反复使用。
+
+- 排除品牌：Aho-Corasick 自动机，标题只扫描一遍；同一标题的结果有缓存（列表每轮都会重复检查同一批商品）
+- 允许尺码：frozenset 判断 + 预先计算好的排序键（数字尺码按数值，其他按字符串排在后面）
+- 价格：解析结果按价格字符串缓存
+
+用法：
+    python rule_engine.py bench [标题数量]
+"""
+import sys
+import time
+import random
+
+MEMO_LIMIT = 200000   # 缓存条目上限，超过后整体清空
+
+
+class AhoCorasick:
+    """多模式子串匹配；模式和文本都按调用方给定的大小写处理"""
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))
+        goto = [{}]
+        out = [None]
+        for pat in self.patterns:
+            state = 0
+            for ch in pat:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(None)
+                state = nxt
+            if out[state] is None:
+                out[state] = pat
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[nxt] is None:
+                    out[nxt] = out[fail[nxt]]
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def search(self, text):
+        """返回文本中最先结束的匹配模式，没有匹配返回 None"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state] is not None:
+                return out[state]
+        return None
+
+
+def _size_key(s):
+    try:
+        return (0, float(s))
+    except Exception:
+        return (1, s)
+
+
+class CompiledRules:
+    def __init__(self, excluded_brands, allowed_sizes, price_min, price_max):
+        self.excluded_brands = tuple(dict.fromkeys(b.lower() for b in excluded_brands if b))
+        self.allowed_sizes = tuple(str(s) for s in allowed_sizes or ())
+        self.price_min = float(price_min)
+        self.price_max = float(price_max)
+
+        self._brands = AhoCorasick(self.excluded_brands)
+        self._allowed = frozenset(self.allowed_sizes)
+        # 允许尺码按数值排好的序号，排序时直接取
+        self.size_order = {s: i for i, s in enumerate(sorted(self._allowed, key=_size_key))}
+        self._sort_keys = {s: _size_key(s) for s in self._allowed}
+        self._brand_memo = {}
+        self._price_memo = {}
+
+    # ===== 品牌 =====
+    def matched_brand(self, title):
+        if not title:
+            return None
+        memo = self._brand_memo
+        try:
+            return memo[title]
+        except KeyError:
+            pass
+        if len(memo) >= MEMO_LIMIT:
+            memo.clear()
+        hit = memo[title] = self._brands.search(title.lower())
+        return hit
+
+    def skip_brand(self, title) -> bool:
+        return self.matched_brand(title) is not None
+
+    # ===== 尺码 =====
+    def size_allowed(self, size) -> bool:
+        return True if not self._allowed else (str(size) in self._allowed)
+
+    def size_sort_key(self, s):
+        key = self._sort_keys.get(s)
+        if key is None:
+            if len(self._sort_keys) >= MEMO_LIMIT:
+                self._sort_keys = {x: _size_key(x) for x in self._allowed}
+            key = self._sort_keys[s] = _size_key(s)
+        return key
+
+    def has_allowed_size(self, sizes) -> bool:
+        if not self._allowed:
+            return True
+        allowed = self._allowed
+        return any(str(s) in allowed for s in sizes or ())
+
+    # ===== 价格 =====
+    def price_ok(self, price_str) -> bool:
+        """价格在区间内，或为 0 / 未出价"""
+        memo = self._price_memo
+        try:
+            return memo[price_str]
+        except KeyError:
+            pass
+        if len(memo) >= MEMO_LIMIT:
+            memo.clear()
+        ok = memo[price_str] = self._check_price(price_str)
+        return ok
+
+    def _check_price(self, price_str) -> bool:
+        if price_str.strip() == '未出价':
+            return True
+        try:
+            p = float(price_str)
+        except Exception:
+            return False
+        if p == 0.0:
+            return True
+        return self.price_min <= p <= self.price_max
+
+    # ===== 列表级筛选 =====
+    def exclude_reason(self, product):
+        """列表阶段即可排除的商品返回原因，否则返回 None；被排除的商品不进入详情抓取"""
+        brand = self.matched_brand((product.get('title') or '').strip())
+        if brand is not None:
+            return f"排除品牌 {brand}"
+        if not self.has_allowed_size(product.get('sizes')):
+            return "无允许尺码"
+        return None
+
+
+def compile_rules(excluded_brands=None, allowed_sizes=None, price_min=None, price_max=None):
+    """未指定的参数使用 detail_processor 中的默认规则"""
+    import detail_processor as dp
+    return CompiledRules(
+        dp.EXCLUDED_BRANDS if excluded_brands is None else excluded_brands,
+        dp.ALLOWED_SIZES if allowed_sizes is None else allowed_sizes,
+        dp.PRICE_MIN if price_min is None else price_min,
+        dp.PRICE_MAX if price_max is None else price_max,
+    )
+
+
+def _bench(n):
+    import detail_processor as dp
+    rules = compile_rules()
+    rnd = random.Random(1)
+    words = ['Nike', 'Air Jordan 1', 'Dunk Low', 'Yeezy 350', '低帮', '板鞋', '复古', '跑步鞋', '黑白',
+             'Retro High OG', '熊猫', '男女同款', 'Travis Scott', 'Adidas Forum', '篮球鞋']
+    brands = [b for b in dp.EXCLUDED_BRANDS]
+    titles = []
+    for i in range(n):
+        parts = rnd.sample(words, 4)
+        if rnd.random() < 0.2:
+            parts.insert(rnd.randrange(len(parts)), rnd.choice(brands).upper())
+        titles.append(' '.join(parts) + f' {i % 5000}')
+    sizes = [rnd.choice(dp.ALLOWED_SIZES + ['34', '46', '47.5', 'XL']) for _ in range(n)]
+    prices = [rnd.choice(['未出价', '0', str(rnd.randint(100, 2500)), str(rnd.randint(100, 2500)) + '.5'])
+              for _ in range(n)]
+
+    def naive_brand(t):
+        tl = t.lower()
+        return any(b in tl for b in dp.EXCLUDED_BRANDS)
+
+    def timeit(label, fn, data):
+        t0 = time.perf_counter()
+        hits = sum(1 for x in data if fn(x))
+        dt = time.perf_counter() - t0
+        print(f"  {label:<28} {dt * 1000:8.1f} ms  命中 {hits}")
+        return hits
+
+    print(f"标题 {n} 条（“第二轮”模拟下一次轮询重复检查同一批标题）")
+    a = timeit('品牌 原实现(逐个子串)', naive_brand, titles)
+    b = timeit('品牌 Aho-Corasick(首轮)', lambda t: rules._brands.search(t.lower()) is not None, titles)
+    timeit('品牌 Aho-Corasick+缓存', rules.skip_brand, titles)
+    c = timeit('品牌 Aho-Corasick+缓存(第二轮)', rules.skip_brand, titles)
+    assert a == b == c and all(naive_brand(t) == rules.skip_brand(t) for t in titles), '匹配结果不一致'
+    allowed_list = list(dp.ALLOWED_SIZES)
+    timeit('尺码 原实现(列表)', lambda s: s in allowed_list, sizes)
+    timeit('尺码 frozenset', rules.size_allowed, sizes)
+    t0 = time.perf_counter()
+    sorted(sizes, key=_size_key)
+    t1 = time.perf_counter()
+    sorted(sizes, key=rules.size_sort_key)
+    t2 = time.perf_counter()
+    print(f"  {'尺码排序 原实现':<28} {(t1 - t0) * 1000:8.1f} ms")
+    print(f"  {'尺码排序 预计算键':<28} {(t2 - t1) * 1000:8.1f} ms")
+    timeit('价格 原实现', lambda p: rules._check_price(p), prices)
+    timeit('价格 缓存', rules.price_ok, prices)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'bench':
+        print(__doc__)
+        sys.exit(1)
+    _bench(int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
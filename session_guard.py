@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+会话过期熔断：详情页返回登录页时熔断，暂停所有尺码请求，只触发一次重新登录，
+登录成功后恢复；登录失败则在 retry_after 秒内快速失败，不再浪费请求。
+"""
+import threading
+import time
+from log_setup import get_logger
+
+log = get_logger('session')
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+
+LOGIN_PAGE_MARKERS = ('captchaImage', 'validateCode', '/tgc/login')
+
+
+class SessionExpiredError(Exception):
+    pass
+
+
+def is_login_response(response) -> bool:
+    """判断响应是否被重定向到了登录页"""
+    try:
+        urls = [getattr(h, 'url', '') or '' for h in (getattr(response, 'history', None) or [])]
+        urls.append(getattr(response, 'url', '') or '')
+        if any(u.split('?', 1)[0].rstrip('/').endswith('/login') for u in urls):
+            return True
+        text = response.text or ''
+    except Exception:
+        return False
+    head = text[:20000]
+    return sum(1 for m in LOGIN_PAGE_MARKERS if m in head) >= 2
+
+
+class SessionCircuitBreaker:
+    def __init__(self, relogin=None, retry_after=30.0):
+        self._relogin = relogin
+        self.retry_after = float(retry_after)
+        self.state = STATE_CLOSED
+        self.generation = 0      # 每次换新会话 +1，用于识别过期请求是否已被处理
+        self.trips = 0
+        self._relogging = False
+        self._retry_at = 0.0
+        self._cond = threading.Condition()
+
+    def set_relogin_handler(self, relogin):
+        self._relogin = relogin
+
+    def on_session_updated(self):
+        """外部（如主循环重新登录）更新了会话"""
+        with self._cond:
+            self.generation += 1
+            self.state = STATE_CLOSED
+            self._cond.notify_all()
+
+    def wait_ready(self) -> int:
+        """请求前调用：重新登录期间阻塞；熔断且未到重试时间时快速失败。返回当前会话代数"""
+        with self._cond:
+            while self._relogging:
+                self._cond.wait()
+            if self.state == STATE_OPEN and time.time() < self._retry_at:
+                raise SessionExpiredError("会话已过期，熔断中")
+            return self.generation
+
+    def trip(self, generation: int):
+        """请求发现会话过期时调用；返回即表示可以用新会话重试，否则抛出 SessionExpiredError"""
+        with self._cond:
+            while self._relogging:
+                self._cond.wait()
+            if generation != self.generation:
+                return
+            if self.state == STATE_OPEN and time.time() < self._retry_at:
+                raise SessionExpiredError("会话已过期，熔断中")
+            self.state = STATE_OPEN
+            self._relogging = True
+            self.trips += 1
+
+        log.info("[熔断] 详情页返回登录页，暂停尺码请求并重新登录...")
+        ok = False
+        try:
+            ok = bool(self._relogin and self._relogin())
+        except Exception as e:
+            log.warning(f"[熔断] 重新登录异常: {e}")
+
+        with self._cond:
+            self._relogging = False
+            if ok:
+                if self.generation == generation:
+                    self.generation += 1
+                self.state = STATE_CLOSED
+            else:
+                self._retry_at = time.time() + self.retry_after
+            self._cond.notify_all()
+        if not ok:
+            log.warning(f"[熔断] 重新登录失败，{int(self.retry_after)} 秒内快速失败")
+            raise SessionExpiredError("重新登录失败")
+        log.info("[熔断] 重新登录成功，恢复尺码请求")
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+后台会话管理线程：在会话到期前提前续期，新会话校验通过后再原子替换到
+ProductMonitor 和 DetailProcessor，续期期间主循环照常轮询。
+"""
+import os
+import json
+import threading
+import time
+from datetime import datetime
+from log_setup import get_logger
+
+log = get_logger('session')
+
+REFRESH_INTERVAL = 3600   # 会话有效期（秒）
+REFRESH_LEAD = 300        # 提前多久续期
+RETRY_DELAY = 30          # 续期失败后的重试间隔
+SESSION_FILE = 'session_state.json'  # 最近一次有效会话，权限 0600，仅当前用户可读
+
+
+class SessionManager(threading.Thread):
+    def __init__(self, login, detail_processor=None, on_swap=None,
+                 refresh_interval=REFRESH_INTERVAL, refresh_lead=REFRESH_LEAD, retry_delay=RETRY_DELAY,
+                 state_file=None, follow_file=None):
+        """
+        :param login: BaseLogin 实例（提供 acquire_session / validate_session / apply_session）
+        :param on_swap: 换新会话后的回调 on_swap(jsessionid)
+        :param state_file: 会话持久化文件，为 None 时不持久化
+        :param follow_file: 只读跟随另一进程保存的会话文件（影子模式）：自己不登录、不写文件，
+                            续期时重新读取该文件，对方换了新会话才算成功
+        """
+        super().__init__(name='session-manager', daemon=True)
+        self.login = login
+        self.detail_processor = detail_processor
+        self.on_swap = on_swap
+        self.refresh_interval = float(refresh_interval)
+        self.refresh_lead = float(refresh_lead)
+        self.retry_delay = float(retry_delay)
+        self.state_file = state_file
+        self.follow_file = follow_file
+
+        self.acquired_at = None   # 当前会话获取时间
+        self.generation = 0       # 成功换新会话的次数
+        self.last_ok = False
+        self._next_attempt = 0.0
+        self._refreshing = False
+        self._requested = False
+        self._stopped = False
+        self._cond = threading.Condition()
+
+    def _ts(self):
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _due_at(self):
+        if self.acquired_at is None or not self.last_ok:
+            # 尚无会话或上次续期失败：按 retry_delay 重试（每次登录都要识别验证码），不等到下一次定时续期
+            return self._next_attempt
+        return self.acquired_at + self.refresh_interval - self.refresh_lead
+
+    def _wake_at(self):
+        """主动请求的续期立即进行，但失败后的重试间隔仍然有效"""
+        return self._next_attempt if self._requested else self._due_at()
+
+    # ===== 对外接口 =====
+    def refresh_now(self) -> bool:
+        """同步获取新会话（启动时使用），多个调用方并发时只登录一次"""
+        return self.request_refresh(wait=True)
+
+    def request_refresh(self, wait=False, timeout=120) -> bool:
+        """请求立即续期；wait=True 时等待本次（或正在进行的）续期完成并返回是否成功"""
+        with self._cond:
+            start_gen = self.generation
+            if not self._refreshing:
+                self._requested = True
+            self._cond.notify_all()
+            if not wait:
+                return True
+            if not self.is_alive():
+                # 线程未启动时由调用方线程直接完成续期
+                if self._refreshing:
+                    self._cond.wait_for(lambda: not self._refreshing, timeout)
+                    return self.generation != start_gen
+                self._requested = False
+                self._refreshing = True
+            else:
+                ok = self._cond.wait_for(lambda: not self._requested and not self._refreshing, timeout)
+                return bool(ok) and self.generation != start_gen
+        return self._refresh()
+
+    def restore_saved(self) -> bool:
+        """启动时复用上次保存的会话：未过期且校验通过则直接使用，省去验证码登录"""
+        state = self._load_state(self.follow_file or self.state_file)
+        if not state:
+            return False
+        jsessionid = state.get('JSESSIONID')
+        acquired_at = state.get('acquired_at')
+        if not jsessionid or not isinstance(acquired_at, (int, float)):
+            return False
+        if time.time() - acquired_at >= self.refresh_interval:
+            log.info(f"[{self._ts()}] 已保存的会话超过有效期，重新登录")
+            return False
+        if not self.login.validate_session(jsessionid):
+            log.info(f"[{self._ts()}] 已保存的会话已失效，重新登录")
+            return False
+        self.login.apply_session(jsessionid, self.detail_processor)
+        with self._cond:
+            self.generation += 1
+            self.acquired_at = float(acquired_at)
+            self.last_ok = True
+        log.info(f"[{self._ts()}] ✓ 复用已保存的会话（获取于 {datetime.fromtimestamp(acquired_at).strftime('%Y-%m-%d %H:%M:%S')}）")
+        if self.on_swap:
+            self.on_swap(jsessionid)
+        return True
+
+    def _load_state(self, path):
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            log.warning(f"读取 {os.path.basename(path)} 失败：{e}")
+            return None
+
+    def _save_state(self, jsessionid, acquired_at):
+        """先写临时文件（0600）再原子替换，避免崩溃时留下半截文件或被其他用户读取"""
+        if not self.state_file or self.follow_file:
+            return
+        tmp = f"{self.state_file}.tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'JSESSIONID': jsessionid, 'acquired_at': acquired_at}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.state_file)
+            os.chmod(self.state_file, 0o600)
+        except Exception as e:
+            log.warning(f"写入 {os.path.basename(self.state_file)} 失败：{e}")
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    # ===== 线程主体 =====
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (self._refreshing or time.time() < self._wake_at()):
+                    self._cond.wait(max(0.5, self._wake_at() - time.time()))
+                if self._stopped:
+                    return
+                self._requested = False
+                self._refreshing = True
+            self._refresh()
+
+    def _refresh(self) -> bool:
+        """在调用线程中完成一次登录 + 校验 + 替换；调用前需已置 _refreshing"""
+        ok = False
+        acquired_at = time.time()
+        try:
+            log.info(f"[{self._ts()}] 🔄 后台续期会话...")
+            if self.follow_file:
+                jsessionid, acquired_at = self._read_followed()
+            else:
+                jsessionid = self.login.acquire_session()
+            if jsessionid and self.login.validate_session(jsessionid):
+                self.login.apply_session(jsessionid, self.detail_processor)
+                ok = True
+            elif jsessionid:
+                log.warning(f"[{self._ts()}] ✗ 新会话校验未通过，保留当前会话")
+        except Exception as e:
+            log.warning(f"[{self._ts()}] ✗ 会话续期异常: {e}")
+
+        with self._cond:
+            self._refreshing = False
+            self.last_ok = ok
+            if ok:
+                self.generation += 1
+                self.acquired_at = acquired_at
+                self._next_attempt = 0.0
+            else:
+                self._next_attempt = time.time() + self.retry_delay
+            self._cond.notify_all()
+
+        if ok:
+            log.info(f"[{self._ts()}] ✓ 会话已更新: {self.login.cookies.get('JSESSIONID')}")
+            self._save_state(self.login.cookies.get('JSESSIONID'), self.acquired_at)
+            if self.on_swap:
+                try:
+                    self.on_swap(self.login.cookies.get('JSESSIONID'))
+                except Exception as e:
+                    log.warning(f"会话替换回调异常: {e}")
+        return ok
+
+    def _read_followed(self):
+        """跟随模式：读取对方保存的会话；与当前会话相同（对方还没换新）时返回空，按 retry_delay 再读"""
+        state = self._load_state(self.follow_file) or {}
+        jsessionid = state.get('JSESSIONID')
+        acquired_at = state.get('acquired_at')
+        if not jsessionid or not isinstance(acquired_at, (int, float)):
+            log.warning(f"[{self._ts()}] ✗ {os.path.basename(self.follow_file)} 中没有可用会话（正式进程是否在运行？）")
+            return None, None
+        if jsessionid == self.login.cookies.get('JSESSIONID'):
+            log.info(f"[{self._ts()}] {os.path.basename(self.follow_file)} 尚未换新会话，{self.retry_delay:g} 秒后再读")
+            return None, None
+        return jsessionid, float(acquired_at)
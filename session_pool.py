@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+多账号会话池：每个账号独立登录（BaseLogin + SessionManager），详情请求在健康账号间分摊；
+账号被限流、连续出错或会话过期时暂时摘除并在后台重新登录。
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from base_login import BaseLogin
+from session_manager import SessionManager
+from log_setup import get_logger
+
+log = get_logger('session')
+
+ACCOUNTS_FILE = 'accounts.json'   # [{"username": "...", "password": "..."}, ...]
+THROTTLE_COOLDOWN = 300           # 被限流后摘除的时长（秒）
+MAX_CONSECUTIVE_ERRORS = 5        # 连续失败多少次后摘除
+RATE_WINDOW = 60                  # 请求速率统计窗口（秒）
+
+
+class AccountSession:
+    def __init__(self, username, password, state_file=None, follow_file=None):
+        self.username = username
+        self.login = BaseLogin(username, password)
+        self.manager = SessionManager(self.login, on_swap=self._on_swap, state_file=state_file, follow_file=follow_file)
+        self.healthy = False
+        self.quarantined_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.throttles = 0
+        self.relogins = 0
+        self.consecutive_errors = 0
+        self._quarantine_reason = None
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def _on_swap(self, jsessionid):
+        with self._lock:
+            self.healthy = True
+            # 会话过期的账号拿到新会话即可恢复；被限流的账号仍需等冷却结束
+            if self._quarantine_reason == 'logged_out':
+                self.quarantined_until = 0.0
+            self.consecutive_errors = 0
+        log.info(f"[账号池] {self.username} 会话已就绪")
+
+    @property
+    def cookies(self):
+        return self.login.cookies
+
+    def available(self, now) -> bool:
+        return self.healthy and now >= self.quarantined_until
+
+    def record(self, ok: bool):
+        now = time.time()
+        with self._lock:
+            self.requests += 1
+            self._recent.append(now)
+            while self._recent and now - self._recent[0] > RATE_WINDOW:
+                self._recent.popleft()
+            if ok:
+                self.consecutive_errors = 0
+            else:
+                self.errors += 1
+                self.consecutive_errors += 1
+            return self.consecutive_errors
+
+    def quarantine(self, seconds, reason):
+        with self._lock:
+            now = time.time()
+            # 并发请求可能同时报告同一个问题，已摘除的账号不重复触发重新登录
+            if not self.healthy or now < self.quarantined_until:
+                return
+            self.quarantined_until = now + seconds
+            self._quarantine_reason = reason
+            self.consecutive_errors = 0
+            if reason == 'logged_out':
+                self.healthy = False
+            if reason == 'throttled':
+                self.throttles += 1
+            self.relogins += 1
+        log.info(f"[账号池] 摘除 {self.username}（{reason}），后台重新登录")
+        self.manager.request_refresh(wait=False)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            now = time.time()
+            return {
+                'healthy': self.available(now),
+                'requests': self.requests,
+                'errors': self.errors,
+                'throttles': self.throttles,
+                'relogins': self.relogins,
+                'rate_per_min': round(len(self._recent) * 60.0 / RATE_WINDOW, 1),
+                'quarantine_left': max(0, int(self.quarantined_until - now)),
+            }
+
+
+class SessionPool:
+    def __init__(self, accounts, state_dir=None, suffix='', follow=False):
+        """suffix：会话文件后缀（分片/影子进程各自保存，互不覆盖）；
+        follow：只读跟随正式进程各账号的会话文件，不自己登录（影子模式）"""
+        self.accounts = []
+        for acc in accounts:
+            state_file = os.path.join(state_dir, f"session_state_{acc['username']}{suffix}.json") if state_dir else None
+            follow_file = os.path.join(state_dir, f"session_state_{acc['username']}.json") if state_dir and follow else None
+            self.accounts.append(AccountSession(acc['username'], acc['password'], state_file, follow_file))
+        self._rr = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path, suffix='', follow=False):
+        """账号配置文件不存在或为空时返回 None（沿用单账号）"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                accounts = json.load(f)
+        except Exception as e:
+            log.warning(f"读取 {os.path.basename(path)} 失败：{e}")
+            return None
+        accounts = [a for a in (accounts or []) if a.get('username') and a.get('password')]
+        if not accounts:
+            return None
+        return cls(accounts, state_dir=os.path.dirname(os.path.abspath(path)), suffix=suffix, follow=follow)
+
+    def start(self):
+        """逐个登录（优先复用已保存会话）并启动各自的后台续期线程"""
+        for acct in self.accounts:
+            if acct.manager.restore_saved() or acct.manager.refresh_now():
+                acct.healthy = True
+            else:
+                log.warning(f"[账号池] {acct.username} 登录失败，稍后重试")
+                acct.manager.request_refresh(wait=False)
+            acct.manager.start()
+        log.info(f"[账号池] 可用账号 {sum(1 for a in self.accounts if a.healthy)}/{len(self.accounts)}")
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def candidates(self):
+        """当前可用的账号（轮询起点逐次后移，负载相同时均匀分摊）"""
+        now = time.time()
+        with self._lock:
+            self._rr = (self._rr + 1) % max(1, len(self.accounts))
+            ordered = self.accounts[self._rr:] + self.accounts[:self._rr]
+        return [a for a in ordered if a.available(now)]
+
+    def report(self, acct, outcome_ok: bool, throttled=False, logged_out=False):
+        if logged_out:
+            acct.quarantine(0, 'logged_out')
+            return
+        if throttled:
+            acct.record(False)
+            acct.quarantine(THROTTLE_COOLDOWN, 'throttled')
+            return
+        if acct.record(outcome_ok) >= MAX_CONSECUTIVE_ERRORS:
+            acct.quarantine(THROTTLE_COOLDOWN, 'errors')
+
+    def metrics(self) -> dict:
+        return {a.username: a.metrics() for a in self.accounts}
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+影子模式：完整跑一遍 列表轮询 → 详情抓取 → 规则评估 → 格式化，但不真正推送，
+冷却标记、推送占用和群组计数器写入沙盒（shadow/sandbox.db，启动时用当前的冷却表/计数器初始化），
+用来在真实负载下验证新的并发数、规则引擎等改动，不影响正式的推送、编号和冷却。
+
+- 商品快照、尺码历史、推送记录使用 _shadow 后缀的文件，首次启动从 initial_products_data.json 复制
+- 每条“将要推送”的消息写入 shadow/pushes.jsonl（配置、群组、NO.、商品、尺码、入队到推送的耗时），
+  消息内容写入 products_output_shadow.txt（可用 output_archive.py 按 NO. 查找）
+- 每轮结束输出一行汇总：详情数、耗时、吞吐、各群组推送条数、入队→推送延迟
+- 会话只读跟随正式进程的 session_state.json（账号池为 session_state_<账号>.json），自己不登录、不写这些文件；
+  需要正式进程同时在运行（或先用另一个账号跑一次正式监控生成该文件）
+
+用法：
+    python main.py --shadow
+    python shadow_mode.py report [shadow/pushes.jsonl]   # 汇总历史记录
+"""
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import Future
+from shard_coordinator import CoordinatorStore
+from log_setup import get_logger
+
+log = get_logger('shadow')
+
+SHADOW_SUFFIX = '_shadow'
+SHADOW_DIR = 'shadow'
+SANDBOX_DB = 'sandbox.db'
+PUSHES_FILE = 'pushes.jsonl'
+
+
+def open_sandbox(base_dir):
+    """新建沙盒存储（每次启动清空，之后由各配置用当前状态初始化）"""
+    shadow_dir = os.path.join(base_dir, SHADOW_DIR)
+    os.makedirs(shadow_dir, exist_ok=True)
+    path = os.path.join(shadow_dir, SANDBOX_DB)
+    for ext in ('', '-wal', '-shm'):
+        if os.path.exists(path + ext):
+            os.remove(path + ext)
+    return CoordinatorStore(path)
+
+
+class ShadowBot:
+    """代替 WeChatBot：不发送，直接视为推送成功"""
+
+    def __init__(self, delivery_formats=None):
+        self.digest = False
+        self.delivery_formats = delivery_formats
+
+    def send_product_to_bot(self, content, img_url, group_num=1):
+        return True
+
+    def submit(self, content, img_url, group_num=1):
+        fut = Future()
+        fut.set_result(True)
+        return fut
+
+    def pending(self, group_num=None) -> int:
+        return 0
+
+
+class ShadowReport:
+    """记录将要推送的消息，并按轮汇总吞吐和延迟"""
+
+    def __init__(self, base_dir):
+        self.path = os.path.join(base_dir, SHADOW_DIR, PUSHES_FILE)
+        self._fh = open(self.path, 'a', encoding='utf-8', buffering=64 * 1024)
+        self._lock = threading.Lock()
+        self._cycle = _Totals()
+        self.total = _Totals()
+        self.cycles = 0
+
+    def record(self, profile, group_num, no, pid, keys, latency):
+        entry = {'ts': round(time.time(), 3), 'profile': profile, 'group': group_num, 'no': no,
+                 'pid': pid, 'keys': list(keys), 'latency': round(latency, 3) if latency is not None else None}
+        with self._lock:
+            self._fh.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._cycle.add(group_num, latency)
+
+    def end_cycle(self, details, elapsed):
+        """输出本轮汇总；details 为本轮处理的详情任务数，elapsed 为详情处理耗时"""
+        with self._lock:
+            self._fh.flush()
+            c, self._cycle = self._cycle, _Totals()
+        c.details, c.elapsed = details, elapsed
+        self.total.merge(c)
+        self.cycles += 1
+        log.info(f"[shadow] 本轮详情 {details} 个，用时 {elapsed:.1f}秒（{_rate(details, elapsed)}），{c.describe()}")
+        log.info(f"[shadow] 累计 {self.cycles} 轮：详情 {self.total.details} 个（{_rate(self.total.details, self.total.elapsed)}），"
+                 f"{self.total.describe()}")
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+
+class _Totals:
+    def __init__(self):
+        self.by_group = {1: 0, 2: 0, 3: 0}
+        self.latencies = []
+        self.details = 0
+        self.elapsed = 0.0
+
+    def add(self, group_num, latency):
+        self.by_group[group_num] = self.by_group.get(group_num, 0) + 1
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def merge(self, other):
+        for g, n in other.by_group.items():
+            self.by_group[g] = self.by_group.get(g, 0) + n
+        self.latencies.extend(other.latencies)
+        self.details += other.details
+        self.elapsed += other.elapsed
+
+    def describe(self):
+        pushes = sum(self.by_group.values())
+        groups = ' / '.join(f"群组{g} {n}" for g, n in sorted(self.by_group.items()))
+        text = f"将推送 {pushes} 条（{groups}）"
+        if self.latencies:
+            lat = sorted(self.latencies)
+            p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+            text += f"，入队→推送 平均 {sum(lat) / len(lat):.1f}秒 / P95 {p95:.1f}秒 / 最大 {lat[-1]:.1f}秒"
+        return text
+
+
+def _rate(n, seconds):
+    return f"{n / seconds:.1f} 个/秒" if seconds > 0 else '-'
+
+
+def report(path):
+    """汇总 pushes.jsonl"""
+    totals = _Totals()
+    by_profile = {}
+    first = last = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                e = json.loads(line)
+            except ValueError:
+                continue
+            totals.add(e['group'], e.get('latency'))
+            by_profile[e['profile']] = by_profile.get(e['profile'], 0) + 1
+            first = e['ts'] if first is None else first
+            last = e['ts']
+    if first is None:
+        print("（没有记录）")
+        return
+    hours = max((last - first) / 3600, 1 / 60)
+    print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(first))} ~ {time.strftime('%Y-%m-%d %H:%M', time.localtime(last))}")
+    print(totals.describe())
+    print(f"平均每小时 {sum(totals.by_group.values()) / hours:.1f} 条")
+    for name, n in sorted(by_profile.items()):
+        print(f"  {name}: {n} 条")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'report':
+        print(__doc__)
+        sys.exit(1)
+    report(sys.argv[2] if len(sys.argv) > 2 else os.path.join(SHADOW_DIR, PUSHES_FILE))
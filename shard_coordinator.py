@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+分片模式的共享协调器：多个监控进程（同机或多机）各自负责一段商品ID哈希区间，
+冷却表、群组计数器和推送占用统一放在协调器中，保证不重复推送、NO. 编号不重复。
+
+- 同一台机器：各进程直接共用一个 SQLite 文件（--coordinator coordinator.db）
+- 多台机器：在一台机器上启动协调服务，其余进程通过 XML-RPC 访问（--coordinator http://主机:8765）
+
+协调服务没有其他认证：默认只监听 127.0.0.1，监听其他地址时必须设置共享令牌（环境变量 COORDINATOR_TOKEN，
+服务端和各分片相同），请求头中令牌不符的调用一律拒绝。令牌以明文 HTTP 传输，只应在可信的内网中使用。
+
+用法：
+    python shard_coordinator.py serve [coordinator.db] [127.0.0.1:8765]
+    COORDINATOR_TOKEN=... python shard_coordinator.py serve coordinator.db 0.0.0.0:8765
+    python shard_coordinator.py stats [coordinator.db | http://主机:8765]
+"""
+import os
+import sys
+import hmac
+import time
+import zlib
+import socket
+import ipaddress
+import uuid
+import sqlite3
+import threading
+import xmlrpc.client
+from contextlib import contextmanager
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+COORDINATOR_DB = 'coordinator.db'
+DEFAULT_BIND = '127.0.0.1:8765'
+TOKEN_ENV = 'COORDINATOR_TOKEN'
+TOKEN_HEADER = 'X-Coordinator-Token'
+CLAIM_TTL = 120          # 推送占用的有效期（秒），进程崩溃后自动释放；推送在发送队列中等待期间由持有者定期续期
+CLAIM_RENEW_INTERVAL = CLAIM_TTL / 4
+RPC_TIMEOUT = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cooldown (profile TEXT, key TEXT, ts REAL, PRIMARY KEY (profile, key));
+CREATE TABLE IF NOT EXISTS counters (profile TEXT, day TEXT, grp INTEGER, value INTEGER, PRIMARY KEY (profile, day, grp));
+CREATE TABLE IF NOT EXISTS claims (profile TEXT, key TEXT, owner TEXT, expires REAL, PRIMARY KEY (profile, key));
+"""
+
+
+def shard_of(pid, total: int) -> int:
+    """商品ID -> 分片号（crc32 取模，各进程、各机器结果一致）"""
+    return zlib.crc32(str(pid).encode('utf-8')) % total
+
+
+def parse_shard(spec):
+    """'0/4' -> (0, 4)"""
+    try:
+        index, total = (int(x) for x in str(spec).split('/'))
+    except ValueError:
+        raise ValueError(f"分片格式应为 序号/总数，例如 0/4：{spec}")
+    if total < 1 or not 0 <= index < total:
+        raise ValueError(f"分片序号超出范围：{spec}")
+    return index, total
+
+
+def worker_id() -> str:
+    """推送占用的持有者标识：主机名:进程号:随机后缀（同一进程内的多个监控实例也互不相同）"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class CoordinatorStore:
+    """SQLite 实现；每个线程一个连接，写操作用 BEGIN IMMEDIATE 串行化（多进程共用同一文件也安全）"""
+
+    def __init__(self, path=COORDINATOR_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._tx() as db:
+            for stmt in filter(str.strip, _SCHEMA.split(';')):
+                db.execute(stmt)
+
+    def _conn(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _tx(self):
+        db = self._conn()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    # ===== 冷却 =====
+    def cooldown_remaining(self, profile, keys, seconds):
+        """{key: 剩余冷却秒数}，不在冷却中的 key 不返回"""
+        if not keys:
+            return {}
+        now = time.time()
+        db = self._conn()
+        out = {}
+        for i in range(0, len(keys), 500):
+            chunk = list(keys[i:i + 500])
+            rows = db.execute(
+                f"SELECT key, ts FROM cooldown WHERE profile=? AND key IN ({','.join('?' * len(chunk))})",
+                [profile] + chunk).fetchall()
+            for key, ts in rows:
+                rem = float(ts) + seconds - now
+                if rem > 0:
+                    out[key] = rem
+        return out
+
+    def claim(self, profile, keys, seconds, owner, ttl=CLAIM_TTL):
+        """占用即将推送的尺码：全部未冷却且未被占用时才成功"""
+        now = time.time()
+        with self._tx() as db:
+            for key in keys:
+                row = db.execute("SELECT ts FROM cooldown WHERE profile=? AND key=?", (profile, key)).fetchone()
+                if row and float(row[0]) + seconds > now:
+                    return False
+                # 同一进程内重复占用也拒绝（合并推送时前一条可能还在发送队列中）
+                row = db.execute("SELECT expires FROM claims WHERE profile=? AND key=?", (profile, key)).fetchone()
+                if row and row[0] > now:
+                    return False
+            db.executemany("INSERT OR REPLACE INTO claims (profile, key, owner, expires) VALUES (?, ?, ?, ?)",
+                           [(profile, k, owner, now + ttl) for k in keys])
+        return True
+
+    def renew(self, profile, keys, owner, ttl=CLAIM_TTL):
+        """延长仍由 owner 持有的占用（合并推送排队较久时防止过期后被其他分片重复推送）"""
+        with self._tx() as db:
+            db.executemany("UPDATE claims SET expires=? WHERE profile=? AND key=? AND owner=?",
+                           [(time.time() + ttl, profile, k, owner) for k in keys])
+        return True
+
+    def release(self, profile, keys, owner):
+        with self._tx() as db:
+            db.executemany("DELETE FROM claims WHERE profile=? AND key=? AND owner=?",
+                           [(profile, k, owner) for k in keys])
+        return True
+
+    def mark_cooled(self, profile, keys, owner):
+        now = time.time()
+        with self._tx() as db:
+            db.executemany("INSERT OR REPLACE INTO cooldown (profile, key, ts) VALUES (?, ?, ?)",
+                           [(profile, k, now) for k in keys])
+            db.executemany("DELETE FROM claims WHERE profile=? AND key=? AND owner=?",
+                           [(profile, k, owner) for k in keys])
+        return True
+
+    # ===== 计数器 =====
+    def take_number(self, profile, day, grp):
+        with self._tx() as db:
+            row = db.execute("SELECT value FROM counters WHERE profile=? AND day=? AND grp=?",
+                             (profile, day, grp)).fetchone()
+            n = row[0] if row else 1
+            db.execute("INSERT OR REPLACE INTO counters (profile, day, grp, value) VALUES (?, ?, ?, ?)",
+                       (profile, day, grp, n + 1))
+        return n
+
+    def return_number(self, profile, day, grp, n):
+        """只有 n 仍是最后发出的编号时才回收，否则留空号，避免与其他进程重复"""
+        with self._tx() as db:
+            cur = db.execute("UPDATE counters SET value=? WHERE profile=? AND day=? AND grp=? AND value=?",
+                             (n, profile, day, grp, n + 1))
+            return cur.rowcount > 0
+
+    def reset_counters(self, profile, day, grp=None):
+        with self._tx() as db:
+            groups = [grp] if grp else [1, 2, 3]
+            db.executemany("INSERT OR REPLACE INTO counters (profile, day, grp, value) VALUES (?, ?, ?, 1)",
+                           [(profile, day, g) for g in groups])
+        return True
+
+    def set_counter(self, profile, day, grp, value):
+        with self._tx() as db:
+            db.execute("INSERT OR REPLACE INTO counters (profile, day, grp, value) VALUES (?, ?, ?, ?)",
+                       (profile, day, grp, int(value)))
+        return True
+
+    def counters(self, profile, day):
+        rows = self._conn().execute("SELECT grp, value FROM counters WHERE profile=? AND day=?",
+                                    (profile, day)).fetchall()
+        return {str(g): v for g, v in rows}
+
+    def seed(self, profile, day, counters, cooldown):
+        """
+        用进程本地的旧状态初始化：计数器只在协调器还没有当天记录时写入（避免覆盖手动重置），
+        冷却时间取较大值
+        """
+        with self._tx() as db:
+            db.executemany("INSERT OR IGNORE INTO counters (profile, day, grp, value) VALUES (?, ?, ?, ?)",
+                           [(profile, day, int(g), int(v)) for g, v in (counters or {}).items()])
+            db.executemany("INSERT INTO cooldown (profile, key, ts) VALUES (?, ?, ?) "
+                           "ON CONFLICT (profile, key) DO UPDATE SET ts=max(ts, excluded.ts)",
+                           [(profile, k, float(ts)) for k, ts in (cooldown or {}).items()
+                            if isinstance(ts, (int, float))])
+        return True
+
+    def stats(self):
+        db = self._conn()
+        now = time.time()
+        return {
+            'cooldown_keys': db.execute("SELECT COUNT(*) FROM cooldown").fetchone()[0],
+            'active_claims': db.execute("SELECT COUNT(*) FROM claims WHERE expires > ?", (now,)).fetchone()[0],
+            'counters': [list(r) for r in db.execute(
+                "SELECT profile, day, grp, value FROM counters ORDER BY day DESC, profile, grp LIMIT 30")],
+        }
+
+
+class CoordinatorClient:
+    """XML-RPC 客户端，接口与 CoordinatorStore 相同；ServerProxy 不是线程安全的，每个线程各建一个"""
+
+    def __init__(self, url):
+        self.url = url
+        self._local = threading.local()
+
+    def _proxy(self):
+        proxy = getattr(self._local, 'proxy', None)
+        if proxy is None:
+            token = os.environ.get(TOKEN_ENV)
+            proxy = self._local.proxy = xmlrpc.client.ServerProxy(
+                self.url, allow_none=True,
+                transport=_TimeoutTransport(headers=[(TOKEN_HEADER, token)] if token else []))
+        return proxy
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args):
+            return getattr(self._proxy(), name)(*args)
+        return call
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        conn.timeout = RPC_TIMEOUT
+        return conn
+
+
+def connect(spec):
+    """http(s):// 开头连接远程协调服务，否则视为本机 SQLite 文件路径"""
+    if str(spec).startswith(('http://', 'https://')):
+        return CoordinatorClient(spec)
+    return CoordinatorStore(spec)
+
+
+class _ThreadedServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class _TokenRequestHandler(SimpleXMLRPCRequestHandler):
+    token = None
+
+    def do_POST(self):
+        if self.token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), self.token):
+            self.send_response(403)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        super().do_POST()
+
+
+def _is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(db_path=COORDINATOR_DB, bind=DEFAULT_BIND):
+    host, _, port = bind.rpartition(':')
+    host = host or '127.0.0.1'
+    token = os.environ.get(TOKEN_ENV)
+    if not token and not _is_loopback(host):
+        print(f"监听 {host} 时必须设置共享令牌（环境变量 {TOKEN_ENV}，各分片进程使用相同的值）")
+        sys.exit(1)
+
+    class Handler(_TokenRequestHandler):
+        pass
+    Handler.token = token
+    store = CoordinatorStore(db_path)
+    server = _ThreadedServer((host, int(port)), requestHandler=Handler,
+                             allow_none=True, logRequests=False)
+    for name in ('cooldown_remaining', 'claim', 'renew', 'release', 'mark_cooled', 'take_number', 'return_number',
+                 'reset_counters', 'set_counter', 'counters', 'seed', 'stats'):
+        server.register_function(getattr(store, name), name)
+    print(f"协调服务已启动：http://{host}:{port}（数据库 {db_path}{'，已启用令牌' if token else ''}）")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('serve', 'stats'):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == 'serve':
+        serve(sys.argv[2] if len(sys.argv) > 2 else COORDINATOR_DB,
+              sys.argv[3] if len(sys.argv) > 3 else DEFAULT_BIND)
+    else:
+        st = connect(sys.argv[2] if len(sys.argv) > 2 else COORDINATOR_DB).stats()
+        print(f"冷却记录 {st['cooldown_keys']} 条，进行中的推送占用 {st['active_claims']} 个")
+        for profile, day, grp, value in st['counters']:
+            print(f"  {day} {profile} 群组{grp}: 下一个编号 {value}")
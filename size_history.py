@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+尺码历史时间序列（只追加）：记录每个尺码 价格/人数/最新订单时间 的每次变化。
+
+存储布局（目录 size_history/）：
+    seg-00001.log ...  批次数据，每批 = 8字节头(魔数+长度) + zlib(marshal(事件列表))
+    index.jsonl        每批一行：所在段、偏移、长度、时间范围、包含的 (货号, 尺码)
+查询时只读取索引命中的批次，不扫描整个日志。
+
+用法：
+    python size_history.py query 货号 [尺码] [起始时间] [结束时间]
+    python size_history.py zero  货号 [尺码]        # 人数从0变为正数的时间点
+    python size_history.py rebuild                  # 索引丢失/损坏时从数据段重建
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import marshal
+import threading
+from datetime import datetime
+
+HISTORY_DIR = 'size_history'
+BATCH_SIZE = 500                  # 缓冲多少条事件写一批
+SEGMENT_MAX_BYTES = 64 * 1048576  # 单个数据段上限
+_BATCH_HEADER = struct.Struct('<4sI')
+_BATCH_MAGIC = b'SHB1'
+_FIELDS = ('ts', 'article_num', 'pid', 'size', 'price', 'count', 'time', 'prev_count')
+
+
+def _parse_ts(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析时间: {value}")
+
+
+class SizeHistoryStore:
+    def __init__(self, base_dir=HISTORY_DIR, batch_size=BATCH_SIZE):
+        self.base_dir = base_dir
+        self.batch_size = int(batch_size)
+        self.index_file = os.path.join(base_dir, 'index.jsonl')
+        os.makedirs(base_dir, exist_ok=True)
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._batches = []   # [(段号, 偏移, 长度, t0, t1)]
+        self._by_key = {}    # {(货号, 尺码): [批次序号]}
+        self._segment = 1
+        self._load_index()
+
+    # ===== 索引 =====
+    def _segment_path(self, seg):
+        return os.path.join(self.base_dir, f"seg-{seg:05d}.log")
+
+    def _load_index(self):
+        if not os.path.exists(self.index_file):
+            return
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    continue   # 崩溃时可能残留半行
+                self._add_to_index(e['seg'], e['off'], e['len'], e['t0'], e['t1'], e['keys'])
+        if self._batches:
+            self._segment = max(b[0] for b in self._batches)
+
+    def _add_to_index(self, seg, off, length, t0, t1, keys):
+        bid = len(self._batches)
+        self._batches.append((seg, off, length, t0, t1))
+        for k in keys:
+            self._by_key.setdefault(tuple(k), []).append(bid)
+
+    def rebuild_index(self):
+        """从数据段重建索引文件"""
+        with self._lock:
+            self._batches, self._by_key = [], {}
+            lines = []
+            segs = sorted(int(n[4:9]) for n in os.listdir(self.base_dir) if n.startswith('seg-') and n.endswith('.log'))
+            for seg in segs:
+                with open(self._segment_path(seg), 'rb') as f:
+                    data = f.read()
+                off = 0
+                while off + _BATCH_HEADER.size <= len(data):
+                    magic, length = _BATCH_HEADER.unpack_from(data, off)
+                    end = off + _BATCH_HEADER.size + length
+                    if magic != _BATCH_MAGIC or end > len(data):
+                        break
+                    events = marshal.loads(zlib.decompress(data[off + _BATCH_HEADER.size:end]))
+                    entry = self._index_entry(seg, off, end - off, events)
+                    self._add_to_index(entry['seg'], entry['off'], entry['len'], entry['t0'], entry['t1'], entry['keys'])
+                    lines.append(json.dumps(entry, ensure_ascii=False))
+                    off = end
+            tmp = self.index_file + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + ('\n' if lines else ''))
+            os.replace(tmp, self.index_file)
+            if segs:
+                self._segment = segs[-1]
+            return len(self._batches)
+
+    @staticmethod
+    def _index_entry(seg, off, length, events):
+        keys = sorted({(e[1], e[3]) for e in events})
+        return {'seg': seg, 'off': off, 'len': length,
+                't0': min(e[0] for e in events), 't1': max(e[0] for e in events),
+                'keys': [list(k) for k in keys]}
+
+    # ===== 写入 =====
+    def record_changes(self, article_num, pid, old_full, new_full, ts=None):
+        """对比新旧快照，把有变化的尺码加入缓冲；返回新增事件数"""
+        ts = time.time() if ts is None else ts
+        key = (article_num or '').strip() or str(pid)
+        old_full = old_full or {}
+        events = []
+        for size, info in (new_full or {}).items():
+            old = old_full.get(size) or {}
+            price = str(info.get('price', '未出价'))
+            count = int(info.get('count', 0) or 0)
+            stime = str(info.get('time', '') or '')
+            prev_count = int(old.get('count', 0) or 0)
+            if old and price == str(old.get('price', '未出价')) and count == prev_count \
+                    and stime == str(old.get('time', '') or ''):
+                continue
+            events.append((ts, key, str(pid), str(size), price, count, stime, prev_count))
+        if not events:
+            return 0
+        with self._lock:
+            self._buffer.extend(events)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+        return len(events)
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return 0
+            events, self._buffer = self._buffer, []
+            blob = zlib.compress(marshal.dumps(events, 4), 6)
+            path = self._segment_path(self._segment)
+            if os.path.exists(path) and os.path.getsize(path) + len(blob) > SEGMENT_MAX_BYTES:
+                self._segment += 1
+                path = self._segment_path(self._segment)
+            with open(path, 'ab') as f:
+                off = f.tell()
+                f.write(_BATCH_HEADER.pack(_BATCH_MAGIC, len(blob)))
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            entry = self._index_entry(self._segment, off, _BATCH_HEADER.size + len(blob), events)
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._add_to_index(entry['seg'], entry['off'], entry['len'], entry['t0'], entry['t1'], entry['keys'])
+            return len(events)
+
+    # ===== 查询 =====
+    def _read_batch(self, bid):
+        seg, off, length, _, _ = self._batches[bid]
+        with open(self._segment_path(seg), 'rb') as f:
+            f.seek(off)
+            data = f.read(length)
+        return marshal.loads(zlib.decompress(data[_BATCH_HEADER.size:]))
+
+    def query(self, article_num, size=None, start=None, end=None):
+        """按 货号(无货号时为商品ID)、尺码、时间范围查询变化事件，按时间排序"""
+        start, end = _parse_ts(start), _parse_ts(end)
+        with self._lock:
+            if size is not None:
+                bids = set(self._by_key.get((article_num, str(size)), []))
+            else:
+                bids = {b for (a, _), lst in self._by_key.items() if a == article_num for b in lst}
+            bids = [b for b in sorted(bids)
+                    if (start is None or self._batches[b][4] >= start) and (end is None or self._batches[b][3] <= end)]
+            pending = list(self._buffer)
+        out = []
+        for bid in bids:
+            out.extend(self._read_batch(bid))
+        out.extend(pending)
+        out = [e for e in out if e[1] == article_num and (size is None or e[3] == str(size))
+               and (start is None or e[0] >= start) and (end is None or e[0] <= end)]
+        out.sort(key=lambda e: e[0])
+        return [dict(zip(_FIELDS, e)) for e in out]
+
+    def zero_to_positive(self, article_num, size=None, start=None, end=None):
+        """人数从 0 变为 N（N>0）的事件"""
+        return [e for e in self.query(article_num, size, start, end) if e['prev_count'] <= 0 < e['count']]
+
+
+def _fmt_event(e):
+    ts = datetime.fromtimestamp(e['ts']).strftime('%Y-%m-%d %H:%M:%S')
+    return f"{ts} 【{e['size']}】{e['price']}({e['prev_count']}→{e['count']}) ⏱{e['time']}"
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('query', 'zero', 'rebuild'):
+        print(__doc__)
+        sys.exit(1)
+    # 与监控进程一致，默认读取模块所在目录下的历史，不依赖当前工作目录
+    store = SizeHistoryStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), HISTORY_DIR))
+    if sys.argv[1] == 'rebuild':
+        print(f"✓ 已重建索引，共 {store.rebuild_index()} 批")
+        sys.exit(0)
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    args = sys.argv[2:] + [None] * 4
+    fn = store.query if sys.argv[1] == 'query' else store.zero_to_positive
+    events = fn(args[0], args[1], args[2], args[3])
+    for e in events:
+        print(_fmt_event(e))
+    print(f"共 {len(events)} 条")
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+二进制快照格式（替代 pretty-print 的 JSON，启动时更快、更省内存）
+
+文件布局：
+    头部 | 记录1 | 记录2 | ... | 索引
+    - 每条记录单独 zlib 压缩（内容为 marshal 后的纯数据），可按商品ID随机读取
+    - 索引（zlib + marshal）：[(商品ID, 偏移, 长度), ...] 以及写入时的尺码序号表
+    - 读取使用 mmap，只有访问到的记录才解码
+冷却表等简单映射整体压缩为一块。
+
+用法：
+    python snapshot_store.py to-bin  initial_products_data.json [initial_products_data.snap]
+    python snapshot_store.py to-json initial_products_data.snap [initial_products_data.json]
+    python snapshot_store.py info    initial_products_data.snap
+    python snapshot_store.py bench   initial_products_data.json
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import marshal
+from compact_record import ProductRecord, SIZE_TABLE, json_default
+
+MAGIC = b'GXSNAP'
+SNAPSHOT_VERSION = 1
+MARSHAL_VERSION = 4
+KIND_PRODUCTS = 1
+KIND_MAP = 2
+COMPRESS_LEVEL = 1
+
+# 魔数 | 版本 | 类型 | 字节序(0小端/1大端) | marshal版本 | 记录数 | 索引偏移 | 索引长度 | 写入时间
+_HEADER = struct.Struct('<6sHBBBxIQQd')
+_BYTEORDER = 0 if sys.byteorder == 'little' else 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _write_atomic(path, chunks_writer):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        chunks_writer(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ===== 商品快照 =====
+def write_products(path, products):
+    """写出商品快照；products 可以是 ProductRecord 或普通 dict"""
+    def _writer(f):
+        f.write(b'\0' * _HEADER.size)
+        index = []
+        offset = _HEADER.size
+        for p in products:
+            if isinstance(p, ProductRecord):
+                payload = ('r', p.to_state())
+            else:
+                payload = ('d', p)
+            blob = zlib.compress(marshal.dumps(payload, MARSHAL_VERSION), COMPRESS_LEVEL)
+            f.write(blob)
+            index.append((p.get('id'), offset, len(blob)))
+            offset += len(blob)
+        idx_blob = zlib.compress(marshal.dumps((index, SIZE_TABLE.sizes()), MARSHAL_VERSION), COMPRESS_LEVEL)
+        f.write(idx_blob)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, SNAPSHOT_VERSION, KIND_PRODUCTS, _BYTEORDER, MARSHAL_VERSION,
+                             len(index), offset, len(idx_blob), time.time()))
+    _write_atomic(path, _writer)
+
+
+class SnapshotReader:
+    """基于 mmap 的惰性读取：打开时只解析头部和索引，记录在访问时才解码"""
+
+    def __init__(self, path, compact=True):
+        self.path = path
+        self.compact = compact
+        self._f = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._f.close()
+            raise SnapshotError(f"{os.path.basename(path)} 为空")
+        header = _read_header(self._mm, KIND_PRODUCTS, path)
+        _, _, _, byteorder, _, count, idx_off, idx_len, self.created = header
+        self._swap = byteorder != _BYTEORDER
+        self._index, sizes = marshal.loads(zlib.decompress(self._mm[idx_off:idx_off + idx_len]))
+        if len(self._index) != count:
+            raise SnapshotError(f"{os.path.basename(path)} 索引损坏")
+        remap = [SIZE_TABLE.ordinal(s) for s in sizes]
+        self._remap = None if remap == list(range(len(remap))) else remap
+        self._positions = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def ids(self):
+        return [pid for pid, _, _ in self._index]
+
+    def _decode(self, offset, length):
+        kind, payload = marshal.loads(zlib.decompress(self._mm[offset:offset + length]))
+        if kind == 'r':
+            rec = ProductRecord.from_state(payload, self._remap, self._swap)
+            return rec if self.compact else rec.to_dict()
+        return ProductRecord.from_dict(payload) if self.compact else payload
+
+    def get(self, pid):
+        if self._positions is None:
+            self._positions = {p: i for i, (p, _, _) in enumerate(self._index)}
+        i = self._positions.get(pid)
+        if i is None:
+            return None
+        _, offset, length = self._index[i]
+        return self._decode(offset, length)
+
+    def __iter__(self):
+        for _, offset, length in self._index:
+            yield self._decode(offset, length)
+
+    def close(self):
+        self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_header(buf, kind, path):
+    if len(buf) < _HEADER.size:
+        raise SnapshotError(f"{os.path.basename(path)} 不是有效的快照文件")
+    header = _HEADER.unpack_from(buf, 0)
+    magic, version, file_kind, _, marshal_version = header[:5]
+    if magic != MAGIC:
+        raise SnapshotError(f"{os.path.basename(path)} 不是有效的快照文件")
+    if version != SNAPSHOT_VERSION or marshal_version > marshal.version:
+        raise SnapshotError(f"{os.path.basename(path)} 版本不支持: v{version}/marshal{marshal_version}")
+    if file_kind != kind:
+        raise SnapshotError(f"{os.path.basename(path)} 类型不匹配")
+    return header
+
+
+def load_products(path, compact=True):
+    with SnapshotReader(path, compact=compact) as reader:
+        return list(reader)
+
+
+# ===== 简单映射（冷却表） =====
+def write_map(path, mapping):
+    def _writer(f):
+        blob = zlib.compress(marshal.dumps(dict(mapping), MARSHAL_VERSION), COMPRESS_LEVEL)
+        f.write(_HEADER.pack(MAGIC, SNAPSHOT_VERSION, KIND_MAP, _BYTEORDER, MARSHAL_VERSION,
+                             len(mapping), _HEADER.size, len(blob), time.time()))
+        f.write(blob)
+    _write_atomic(path, _writer)
+
+
+def read_map(path):
+    with open(path, 'rb') as f:
+        buf = f.read()
+    header = _read_header(buf, KIND_MAP, path)
+    off, length = header[6], header[7]
+    return marshal.loads(zlib.decompress(buf[off:off + length]))
+
+
+def newest_existing(*paths):
+    """返回存在的文件中修改时间最新的一个（都不存在返回 None）"""
+    existing = [p for p in paths if p and os.path.exists(p)]
+    if not existing:
+        return None
+    return max(existing, key=os.path.getmtime)
+
+
+def is_snapshot(path) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+# ===== 格式转换 =====
+def json_to_snapshot(json_path, snap_path):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        write_map(snap_path, data)
+    else:
+        write_products(snap_path, [ProductRecord.from_dict(p) for p in data])
+    return len(data)
+
+
+def snapshot_to_json(snap_path, json_path):
+    with open(snap_path, 'rb') as f:
+        head = f.read(_HEADER.size)
+    if len(head) < _HEADER.size or head[:len(MAGIC)] != MAGIC:
+        raise SnapshotError(f"{os.path.basename(snap_path)} 不是有效的快照文件")
+    kind = _HEADER.unpack(head)[2]
+    data = read_map(snap_path) if kind == KIND_MAP else load_products(snap_path, compact=False)
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=json_default)
+    return len(data)
+
+
+def _bench(json_path):
+    t0 = time.time()
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    t_json = time.time() - t0
+    snap_path = json_path + '.bench.snap'
+    write_products(snap_path, [ProductRecord.from_dict(p) for p in data])
+    t0 = time.time()
+    loaded = load_products(snap_path)
+    t_snap = time.time() - t0
+    print(f"商品数: {len(loaded)}")
+    print(f"JSON:     {os.path.getsize(json_path) / 1048576:.1f} MB，json.load {t_json:.2f}s")
+    print(f"二进制:   {os.path.getsize(snap_path) / 1048576:.1f} MB，加载 {t_snap:.2f}s")
+    os.remove(snap_path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('to-bin', 'to-json', 'info', 'bench'):
+        print(__doc__)
+        sys.exit(1)
+    cmd, src = sys.argv[1], sys.argv[2]
+    if cmd == 'to-bin':
+        dst = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(src)[0] + '.snap'
+        print(f"✓ 已写入 {dst}（{json_to_snapshot(src, dst)} 条）")
+    elif cmd == 'to-json':
+        dst = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(src)[0] + '.json'
+        print(f"✓ 已写入 {dst}（{snapshot_to_json(src, dst)} 条）")
+    elif cmd == 'info':
+        with open(src, 'rb') as f:
+            h = _HEADER.unpack(f.read(_HEADER.size))
+        kind = {KIND_PRODUCTS: '商品', KIND_MAP: '映射'}.get(h[2], h[2])
+        print(f"类型={kind} 版本={h[1]} 记录数={h[5]} 写入时间={time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(h[8]))}")
+    else:
+        _bench(src)
@@ -1,9 +1,37 @@
 import os
+import time
+import queue
 import base64
 import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future
 from datetime import datetime
 import requests
 import re
+from log_setup import get_logger
+
+log = get_logger('wechat')
+
+# 单条推送的消息格式（按群组选择）：
+#   image_text  下载图片 → base64 图片消息 + 文本消息（原方式，3 次请求、占 2 条额度）
+#   news        一条图文消息，封面直接引用 logoUrl，描述为尺码/价格摘要（超过 512 字节截断）
+#   markdown    一条 markdown 消息，保留完整文本，图片为链接
+# news/markdown 发送失败时回退到 image_text
+DELIVERY_IMAGE_TEXT = 'image_text'
+DELIVERY_NEWS = 'news'
+DELIVERY_MARKDOWN = 'markdown'
+DELIVERY_CHOICES = (DELIVERY_IMAGE_TEXT, DELIVERY_NEWS, DELIVERY_MARKDOWN)
+DELIVERY_FORMATS = {1: DELIVERY_IMAGE_TEXT, 2: DELIVERY_IMAGE_TEXT, 3: DELIVERY_IMAGE_TEXT}
+MARKDOWN_MAX_BYTES = 4096
+NEWS_TITLE_BYTES = 128
+NEWS_DESC_BYTES = 512
+
+# 合并推送：群组待发队列达到阈值时，把多条商品合并成一条 markdown 消息
+DIGEST_THRESHOLD = 3
+DIGEST_MAX_BYTES = MARKDOWN_MAX_BYTES
+DIGEST_SEPARATOR = '\n\n────────\n\n'
+SEND_INTERVAL = 1.0   # 同一群组两次发送之间的间隔（秒）
 
 class WeChatBot:
     def __init__(self, webhook_urls=None):
@@ -28,6 +56,11 @@ class WeChatBot:
         self.current_bot_index_group_1 = 0
         self.current_bot_index_group_2 = 0
         self.current_bot_index_group_3 = 0
+        self.delivery_formats = dict(DELIVERY_FORMATS)
+        # 合并推送模式：submit() 放入群组队列，由每个群组一个的发送线程按节奏发送
+        self.digest = False
+        self._queues = {}
+        self._dispatch_lock = threading.Lock()
 
     def download_image(self, img_url, save_path='temp_image.jpg'):
         try:
@@ -65,6 +98,161 @@ class WeChatBot:
         except Exception:
             return False
 
+    def send_markdown_message(self, content, webhook_url):
+        payload = {"msgtype": "markdown", "markdown": {"content": content}}
+        try:
+            r = requests.post(webhook_url, json=payload, timeout=5)
+            return r.status_code == 200 and r.json().get('errcode', 0) == 0
+        except Exception:
+            return False
+
+    def send_news_message(self, article, webhook_url):
+        payload = {"msgtype": "news", "news": {"articles": [article]}}
+        try:
+            r = requests.post(webhook_url, json=payload, timeout=5)
+            return r.status_code == 200 and r.json().get('errcode', 0) == 0
+        except Exception:
+            return False
+
+    def build_news_article(self, content, img_url):
+        """
+        把 format_product_output 的文本转成图文消息：
+        标题 = 编号行 + 商品标题行，描述 = 其余非链接行，点击跳转到商品标题后的第一个链接
+        """
+        lines = [l.strip() for l in content.strip().splitlines()]
+        urls = [l for l in lines if l.startswith('http')]
+        text = [l for l in lines if l and not l.startswith('http')]
+        try:
+            blank = lines.index('')
+            title_line = lines[blank + 1]
+            after = [l for l in lines[blank + 2:] if l.startswith('http')]
+        except (ValueError, IndexError):
+            title_line, after = '', []
+        title = f"{lines[0]} {title_line}".strip() if lines else title_line
+        desc = [l for l in text[1:] if l != title_line]
+        return {
+            'title': _truncate_bytes(title, NEWS_TITLE_BYTES),
+            'description': _truncate_bytes('\n'.join(desc), NEWS_DESC_BYTES),
+            'url': (after or urls or [img_url])[0],
+            'picurl': img_url or '',
+        }
+
+    def _send_rich(self, fmt, content, img_url, webhook_url):
+        """news / markdown 单请求推送；不适用（内容过长、缺少链接）或失败返回 False"""
+        if fmt == DELIVERY_NEWS:
+            article = self.build_news_article(content, img_url)
+            return bool(article['url']) and self.send_news_message(article, webhook_url)
+        if fmt == DELIVERY_MARKDOWN:
+            md = self._digest_entry(content, img_url)
+            return len(md.encode('utf-8')) <= MARKDOWN_MAX_BYTES and self.send_markdown_message(md, webhook_url)
+        return False
+
+    def _group_webhooks(self, group_num):
+        """返回 (webhook列表, 当前轮询下标)"""
+        if group_num == 1:
+            return self.webhook_urls_group_1, self.current_bot_index_group_1
+        if group_num == 2:
+            return self.webhook_urls_group_2, self.current_bot_index_group_2
+        return self.webhook_urls_group_3, self.current_bot_index_group_3
+
+    def _advance_bot_index(self, group_num):
+        urls, index = self._group_webhooks(group_num)
+        index = (index + 1) % len(urls)
+        if group_num == 1:
+            self.current_bot_index_group_1 = index
+        elif group_num == 2:
+            self.current_bot_index_group_2 = index
+        else:
+            self.current_bot_index_group_3 = index
+
+    # ====== 合并推送 ======
+    def submit(self, content, img_url, group_num=1):
+        """
+        放入群组发送队列，返回 Future（结果为是否推送成功）。
+        队列空闲时逐条按群组的消息格式发送；积压达到 DIGEST_THRESHOLD 时合并成 markdown 批量发送。
+        """
+        fut = Future()
+        with self._dispatch_lock:
+            q = self._queues.get(group_num)
+            if q is None:
+                q = self._queues[group_num] = queue.Queue()
+                threading.Thread(target=self._dispatch_loop, args=(group_num, q),
+                                 name=f'wechat-group-{group_num}', daemon=True).start()
+        q.put((content, img_url, fut))
+        return fut
+
+    def pending(self, group_num=None) -> int:
+        queues = [self._queues.get(group_num)] if group_num else list(self._queues.values())
+        return sum(q.qsize() for q in queues if q is not None)
+
+    def _dispatch_loop(self, group_num, q):
+        backlog = deque()
+        while True:
+            if not backlog:
+                backlog.append(q.get())
+            while True:
+                try:
+                    backlog.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            batch = self._take_digest(backlog) if len(backlog) >= DIGEST_THRESHOLD else []
+            batch = batch or [backlog.popleft()]
+            if len(batch) > 1 and self._try_send(self._send_digest, batch, group_num):
+                results = [True] * len(batch)
+            else:
+                # 合并消息失败时逐条重发，只有单条也失败的商品回滚编号
+                results = []
+                for i, (content, img_url, _) in enumerate(batch):
+                    if len(batch) > 1:
+                        time.sleep(SEND_INTERVAL)
+                    results.append(self._try_send(self.send_product_to_bot, content, img_url, group_num))
+            # 整批发送结束后再一起给出结果，主线程可以按编号从大到小回滚失败的推送
+            for (_, _, fut), ok in zip(batch, results):
+                fut.set_result(ok)
+            time.sleep(SEND_INTERVAL)
+
+    def _try_send(self, send, *args):
+        group_num = args[-1]
+        try:
+            return bool(send(*args))
+        except Exception as e:
+            log.warning(f"[推送错误] 群组{group_num}: {str(e)}")
+            return False
+
+    def _digest_entry(self, content, img_url):
+        return f"{content.strip()}\n[商品图片]({img_url})" if img_url else content.strip()
+
+    def _take_digest(self, backlog):
+        """从队首取出能放进一条 markdown 消息的若干条"""
+        batch, size = [], len(self._digest_header(0, 0).encode('utf-8')) + 8
+        while backlog:
+            content, img_url, fut = backlog[0]
+            n = len(self._digest_entry(content, img_url).encode('utf-8')) + len(DIGEST_SEPARATOR.encode('utf-8'))
+            if batch and size + n > DIGEST_MAX_BYTES:
+                break
+            if not batch and size + n > DIGEST_MAX_BYTES:
+                # 单条就超过上限，按原方式单独发送
+                return [backlog.popleft()]
+            batch.append(backlog.popleft())
+            size += n
+        return batch
+
+    def _digest_header(self, group_num, count):
+        return f"**群组{group_num} 合并推送 {count} 个商品**"
+
+    def _send_digest(self, batch, group_num):
+        urls, index = self._group_webhooks(group_num)
+        if not urls:
+            return False
+        body = DIGEST_SEPARATOR.join(self._digest_entry(c, u) for c, u, _ in batch)
+        content = f"{self._digest_header(group_num, len(batch))}\n\n{body}"
+        ok = self.send_markdown_message(content, urls[index])
+        if ok:
+            self._advance_bot_index(group_num)
+        else:
+            log.warning(f"[推送错误] 群组{group_num}: 合并消息（{len(batch)} 条）发送失败，改为逐条发送")
+        return ok
+
     def send_product_to_bot(self, content, img_url, group_num=1):
         """
         根据群组发送消息
@@ -87,6 +275,13 @@ class WeChatBot:
             return False
 
         webhook_url = webhook_urls[current_index]
+        fmt = self.delivery_formats.get(group_num, DELIVERY_IMAGE_TEXT)
+        if fmt != DELIVERY_IMAGE_TEXT:
+            # 单请求推送（不下载图片），失败时回退到图片+文本
+            if self._send_rich(fmt, content, img_url, webhook_url):
+                self._advance_bot_index(group_num)
+                return True
+            log.warning(f"[推送] 群组{group_num} {fmt} 消息发送失败，改用图片+文本")
         path = f"temp_image_{datetime.now().strftime('%Y%m%d%H%M%S%f')}.jpg"  # 添加微秒避免文件名冲突
 
         downloaded = None
@@ -135,7 +330,7 @@ class WeChatBot:
             
             return ok_text
         except Exception as e:
-            print(f"[推送错误] 群组{group_num}: {str(e)}")
+            log.warning(f"[推送错误] 群组{group_num}: {str(e)}")
             return False
         finally:
             # 清理临时文件
@@ -143,4 +338,12 @@ class WeChatBot:
                 if downloaded and os.path.exists(downloaded):
                     os.remove(downloaded)
             except:
-                pass
\ No newline at end of file
+                pass
+
+
+def _truncate_bytes(text, limit):
+    """按 UTF-8 字节数截断，不截断半个字符"""
+    data = text.encode('utf-8')
+    if len(data) <= limit:
+        return text
+    return data[:limit - 3].decode('utf-8', 'ignore') + '...'